@@ -1,19 +1,34 @@
 from django.contrib import admin
-from .models import Restaurant, MenuItem
+from .export import streaming_export_response
+from .models import Restaurant, MenuItem, Order, OrderItem, Review, StoredBlob
+
+class ExportActionsMixin:
+    """Stream the selected rows (or every filtered row, with "select all") as a file"""
+    actions = ('export_csv', 'export_json')
+
+    @admin.action(description='Export selected %(verbose_name_plural)s as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return streaming_export_response(queryset, 'csv')
+
+    @admin.action(description='Export selected %(verbose_name_plural)s as JSON', permissions=['view'])
+    def export_json(self, request, queryset):
+        return streaming_export_response(queryset, 'json')
 
 @admin.register(Restaurant)
-class RestaurantAdmin(admin.ModelAdmin):
+class RestaurantAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ('name', 'owner', 'category', 'status', 'rating', 'created_at')
+    list_select_related = ('owner',)
     list_filter = ('category', 'status', 'is_delivery_available', 'created_at')
     search_fields = ('name', 'description', 'owner__username', 'address')
     readonly_fields = ('created_at', 'updated_at', 'rating', 'total_reviews')
+    raw_id_fields = ('owner',)
 
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'owner', 'description', 'category', 'status')
         }),
         ('Contact & Location', {
-            'fields': ('address', 'phone', 'email', 'website')
+            'fields': ('address', 'latitude', 'longitude', 'phone', 'email', 'website')
         }),
         ('Images', {
             'fields': ('image', 'logo')
@@ -22,7 +37,7 @@ class RestaurantAdmin(admin.ModelAdmin):
             'fields': ('opening_time', 'closing_time')
         }),
         ('Delivery Settings', {
-            'fields': ('is_delivery_available', 'delivery_fee', 'minimum_order')
+            'fields': ('is_delivery_available', 'delivery_fee', 'minimum_order', 'delivery_radius_km')
         }),
         ('Statistics', {
             'fields': ('rating', 'total_reviews'),
@@ -35,11 +50,14 @@ class RestaurantAdmin(admin.ModelAdmin):
     )
 
 @admin.register(MenuItem)
-class MenuItemAdmin(admin.ModelAdmin):
+class MenuItemAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ('name', 'restaurant', 'category', 'price', 'is_available', 'created_at')
+    list_select_related = ('restaurant',)
     list_filter = ('category', 'is_available', 'is_vegetarian', 'is_vegan', 'restaurant__name')
     search_fields = ('name', 'description', 'restaurant__name')
     readonly_fields = ('created_at', 'updated_at')
+    # A select listing every restaurant would not scale
+    raw_id_fields = ('restaurant',)
 
     fieldsets = (
         ('Basic Information', {
@@ -56,3 +74,43 @@ class MenuItemAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ('restaurant', 'user', 'rating', 'created_at')
+    list_select_related = ('restaurant', 'user')
+    list_filter = ('rating', 'created_at')
+    search_fields = ('restaurant__name', 'user__username', 'comment')
+    readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('restaurant', 'user')
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    # Snapshots taken at checkout
+    readonly_fields = ('menu_item', 'name', 'unit_price', 'quantity', 'line_total')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'restaurant', 'customer', 'status', 'item_count', 'total', 'created_at')
+    list_select_related = ('restaurant', 'customer')
+    list_filter = ('status', 'created_at')
+    search_fields = ('restaurant__name', 'customer__username')
+    readonly_fields = ('item_count', 'subtotal', 'delivery_fee', 'total', 'created_at', 'updated_at')
+    raw_id_fields = ('restaurant', 'customer')
+    inlines = [OrderItemInline]
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'created_at', 'updated_at')
+    list_filter = ('created_at',)
+    search_fields = ('name',)
+    # Maintained by the image signals and the collect_blobs command
+    readonly_fields = ('name', 'size', 'refcount', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,292 @@
+"""
+Read-only JSON API for restaurants and menus, under ``/api/<version>/``.
+
+The restaurant listing accepts the same query parameters as the HTML
+listing (see listing.py) and pages with the same keyset cursor when it
+uses the default ordering. ``?fields=name,rating`` limits the output to
+those fields, and only their columns are read from the database.
+
+Every response carries a strong ``ETag`` hashed from the request and the
+``(pk, updated_at)`` of the rows it returns, so it changes whenever a row
+is edited, added or dropped. The rows are fetched before anything is
+serialized; a matching ``If-None-Match`` gets a bodiless 304.
+
+``restaurant_menu_snapshot`` serves a whole menu from its precomputed
+snapshot (see menus.py) without going through REST framework at all.
+
+The ``*_async`` views answer the same requests with the same bytes for
+ASGI workers (``ASYNC_VIEWS``), reading through the async ORM. REST
+framework views are synchronous, so these are plain Django views that use
+the same serializers and renderer.
+"""
+import functools
+import hashlib
+
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from rest_framework import serializers
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import listing, menus
+from .models import MenuItem, Restaurant
+from .pagination import CursorPaginator
+
+MENU_ORDERING = ('category', 'name', 'id')
+PAGE_SIZE = 20
+PAGE_PARAM = 'page'
+MSGPACK = 'application/msgpack'
+
+
+class ProjectedSerializer(serializers.ModelSerializer):
+    """A model serializer that outputs only the ``fields`` it is given"""
+
+    # Columns always loaded: the ETag and the cursor read them
+    required_columns = ('id', 'updated_at')
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def projection(cls, params):
+        """The fields named in ``?fields=``, or None for all of them"""
+        raw = params.get('fields', '')
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        if not names:
+            return None
+        unknown = [name for name in names if name not in cls.Meta.fields]
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        return names
+
+    @classmethod
+    def columns(cls, fields):
+        return {*cls.required_columns, *(fields or cls.Meta.fields)}
+
+
+class RestaurantSerializer(ProjectedSerializer):
+    required_columns = ('id', 'updated_at', 'rating', 'created_at')
+
+    class Meta:
+        model = Restaurant
+        fields = (
+            'id', 'name', 'description', 'category', 'address', 'latitude', 'longitude',
+            'phone', 'email', 'website', 'image', 'logo', 'opening_time', 'closing_time',
+            'is_delivery_available', 'delivery_fee', 'minimum_order', 'delivery_radius_km',
+            'rating', 'created_at', 'updated_at',
+        )
+
+
+class MenuItemSerializer(ProjectedSerializer):
+    required_columns = ('id', 'updated_at', 'category', 'name')
+
+    class Meta:
+        model = MenuItem
+        fields = (
+            'id', 'restaurant', 'name', 'description', 'price', 'category', 'image',
+            'is_available', 'is_vegetarian', 'is_vegan', 'preparation_time', 'created_at', 'updated_at',
+        )
+
+
+def compute_etag(request, rows, extra=''):
+    """A strong validator for the representation of ``rows`` at this URL"""
+    # The path carries the API version
+    digest = hashlib.sha256(request.get_full_path().encode())
+    digest.update(f'|{extra}|'.encode())
+    for row in rows:
+        digest.update(f'{row.pk}:{row.updated_at.isoformat()};'.encode())
+    return '"%s"' % digest.hexdigest()[:32]
+
+
+def not_modified(request, etag):
+    candidates = parse_etags(request.headers.get('If-None-Match', ''))
+    # If-None-Match uses the weak comparison
+    return '*' in candidates or etag in [tag.removeprefix('W/') for tag in candidates]
+
+
+def render_json(data, status=200):
+    """What a REST framework ``Response`` renders ``data`` to, for the plain views"""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def conditional_response(request, etag, serialize, respond=Response):
+    """A 304 if the client has ``etag``, otherwise the output of ``serialize()``"""
+    if not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = respond(serialize())
+    response['ETag'] = etag
+    return response
+
+
+def page_links(request, page):
+    url = request.build_absolute_uri()
+    links = {'next': None, 'previous': None}
+    if page.has_next():
+        links['next'] = replace_query_param(url, PAGE_PARAM, page.next_page_number())
+    if page.has_previous():
+        previous = page.previous_page_number()
+        links['previous'] = (
+            remove_query_param(url, PAGE_PARAM) if previous == 1 else replace_query_param(url, PAGE_PARAM, previous)
+        )
+    return links
+
+
+def list_response(request, serializer_class, page, fields, count=None, respond=Response):
+    rows = list(page.object_list)
+    etag = compute_etag(request, rows, extra='' if count is None else count)
+
+    def serialize():
+        data = {'count': count} if count is not None else {}
+        data.update(page_links(request, page))
+        data['results'] = serializer_class(rows, many=True, fields=fields, context={'request': request}).data
+        return data
+
+    return conditional_response(request, etag, serialize, respond)
+
+
+def menu_queryset(pk, params, fields):
+    queryset = MenuItem.objects.filter(restaurant_id=pk, is_available=True).only(*MenuItemSerializer.columns(fields))
+    category = params.get('category', '')
+    if category:
+        queryset = queryset.filter(category=category)
+    if params.get('vegetarian'):
+        queryset = queryset.filter(is_vegetarian=True)
+    if params.get('vegan'):
+        queryset = queryset.filter(is_vegan=True)
+    return queryset
+
+
+def snapshot_response(request, snapshot):
+    if snapshot is None:
+        return render_json({'detail': 'No such restaurant.'}, status=404)
+    if snapshot.msgpack is not None and MSGPACK in request.headers.get('Accept', ''):
+        body, content_type, etag = snapshot.msgpack, MSGPACK, snapshot.etag[:-1] + '-msgpack"'
+    else:
+        body, content_type, etag = snapshot.json, 'application/json', snapshot.etag
+    if not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept'
+    return response
+
+
+def api_errors(view):
+    """Answer 404s and invalid parameters the way REST framework does"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404 as e:
+            return render_json({'detail': str(e)}, status=404)
+        except ValidationError as e:
+            return render_json(e.detail, status=e.status_code)
+    return wrapper
+
+
+@api_view(['GET'])
+def restaurant_list(request, version):
+    fields = RestaurantSerializer.projection(request.query_params)
+    queryset = Restaurant.objects.filter(status='active').only(*RestaurantSerializer.columns(fields))
+    queryset = listing.filter_restaurants(queryset, request.query_params)
+    token = request.query_params.get(PAGE_PARAM)
+    if listing.uses_default_ordering(queryset):
+        page = CursorPaginator(queryset, PAGE_SIZE, listing.DEFAULT_ORDERING).get_page(token)
+        return list_response(request, RestaurantSerializer, page, fields)
+    # Relevance and summary sorts have no stable keyset; they keep offsets
+    page = Paginator(queryset, PAGE_SIZE).get_page(token)
+    return list_response(request, RestaurantSerializer, page, fields, count=page.paginator.count)
+
+
+@api_view(['GET'])
+def restaurant_detail(request, version, pk):
+    fields = RestaurantSerializer.projection(request.query_params)
+    queryset = Restaurant.objects.filter(status='active').only(*RestaurantSerializer.columns(fields))
+    restaurant = get_object_or_404(queryset, pk=pk)
+    return conditional_response(
+        request, compute_etag(request, [restaurant]),
+        lambda: RestaurantSerializer(restaurant, fields=fields, context={'request': request}).data,
+    )
+
+
+@api_view(['GET'])
+def restaurant_menu(request, version, pk):
+    """The available items on an active restaurant's menu"""
+    fields = MenuItemSerializer.projection(request.query_params)
+    get_object_or_404(Restaurant.objects.filter(status='active').only('pk'), pk=pk)
+    queryset = menu_queryset(pk, request.query_params, fields)
+    page = CursorPaginator(queryset, PAGE_SIZE, MENU_ORDERING).get_page(
+        request.query_params.get(PAGE_PARAM)
+    )
+    return list_response(request, MenuItemSerializer, page, fields)
+
+
+@api_view(['GET'])
+def menu_item_detail(request, version, pk):
+    fields = MenuItemSerializer.projection(request.query_params)
+    queryset = MenuItem.objects.filter(restaurant__status='active').only(*MenuItemSerializer.columns(fields))
+    item = get_object_or_404(queryset, pk=pk)
+    return conditional_response(
+        request, compute_etag(request, [item]),
+        lambda: MenuItemSerializer(item, fields=fields, context={'request': request}).data,
+    )
+
+
+@require_safe
+def restaurant_menu_snapshot(request, version, pk):
+    """The full public menu as stored: one cache read, the bytes as they are"""
+    return snapshot_response(request, menus.get_menu(pk))
+
+
+@require_safe
+@api_errors
+async def restaurant_detail_async(request, version, pk):
+    fields = RestaurantSerializer.projection(request.GET)
+    queryset = Restaurant.objects.filter(status='active').only(*RestaurantSerializer.columns(fields))
+    restaurant = await aget_object_or_404(queryset, pk=pk)
+    return conditional_response(
+        request, compute_etag(request, [restaurant]),
+        lambda: RestaurantSerializer(restaurant, fields=fields, context={'request': request}).data,
+        render_json,
+    )
+
+
+@require_safe
+@api_errors
+async def restaurant_menu_async(request, version, pk):
+    fields = MenuItemSerializer.projection(request.GET)
+    await aget_object_or_404(Restaurant.objects.filter(status='active').only('pk'), pk=pk)
+    page = await CursorPaginator(menu_queryset(pk, request.GET, fields), PAGE_SIZE, MENU_ORDERING).aget_page(
+        request.GET.get(PAGE_PARAM)
+    )
+    return list_response(request, MenuItemSerializer, page, fields, respond=render_json)
+
+
+@require_safe
+@api_errors
+async def menu_item_detail_async(request, version, pk):
+    fields = MenuItemSerializer.projection(request.GET)
+    queryset = MenuItem.objects.filter(restaurant__status='active').only(*MenuItemSerializer.columns(fields))
+    item = await aget_object_or_404(queryset, pk=pk)
+    return conditional_response(
+        request, compute_etag(request, [item]),
+        lambda: MenuItemSerializer(item, fields=fields, context={'request': request}).data,
+        render_json,
+    )
+
+
+@require_safe
+@api_errors
+async def restaurant_menu_snapshot_async(request, version, pk):
+    return snapshot_response(request, await menus.aget_menu(pk))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+
+def read_view(name):
+    """The async version of a read view when running under ASGI (``ASYNC_VIEWS``)"""
+    return getattr(api, f'{name}_async') if settings.ASYNC_VIEWS else getattr(api, name)
+
+
+urlpatterns = [
+    path('restaurants/', api.restaurant_list, name='restaurant_list'),
+    path('restaurants/<int:pk>/', read_view('restaurant_detail'), name='restaurant_detail'),
+    path('restaurants/<int:pk>/menu/', read_view('restaurant_menu'), name='restaurant_menu'),
+    path(
+        'restaurants/<int:pk>/menu/snapshot/', read_view('restaurant_menu_snapshot'),
+        name='restaurant_menu_snapshot',
+    ),
+    path('menu-items/<int:pk>/', read_view('menu_item_detail'), name='menu_item_detail'),
+]
@@ -5,3 +5,6 @@ class RestaurantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'restaurant'
     verbose_name = 'Restaurant Management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,261 @@
+"""
+In-memory autocomplete index for restaurant and menu item names.
+
+Names are normalised and stored twice: as a sorted list of word-suffix terms
+for prefix lookups with ``bisect`` ("pal" and "pizza pal" both find
+"Pizza Palace"), and as trigram postings used to recover from typos and
+infix matches when the prefix lookup comes up short.
+
+The index is loaded from the database on first use and then kept current
+from model signals (see ``restaurant.signals``). Every process holds its
+own copy and signals only reach the process that saved the row, so the
+index is rebuilt after ``INDEX_MAX_AGE`` seconds to pick up edits made
+elsewhere. Entries for inactive restaurants and unavailable items are
+never indexed.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+RESTAURANT = 'restaurant'
+MENU_ITEM = 'menu_item'
+
+# Upper bound on trigram candidates examined per lookup, keeps the typo
+# fallback's latency flat for queries made of very common trigrams
+MAX_CANDIDATES = 200
+MIN_TRIGRAM_SCORE = 0.5
+INDEX_MAX_AGE = 60
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+def trigrams(text):
+    compact = f'  {text} '
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._terms = []
+        self._trigrams = defaultdict(set)
+        self._restaurant_items = defaultdict(set)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, kind, pk, name, weight=0.0, restaurant_id=None):
+        with self._lock:
+            for term in self._insert(kind, pk, name, weight, restaurant_id):
+                insort(self._terms, term)
+
+    def extend(self, rows):
+        """
+        Bulk-load ``(kind, pk, name, weight, restaurant_id)`` rows.
+
+        Terms are sorted once at the end instead of insorted one by one,
+        which is what makes a 100k entry build take a second, not minutes.
+        """
+        with self._lock:
+            for row in rows:
+                self._terms.extend(self._insert(*row))
+            self._terms.sort()
+
+    def _insert(self, kind, pk, name, weight, restaurant_id):
+        key = (kind, pk)
+        normalized = normalize(name)
+        self._discard(key)
+        if not normalized:
+            return []
+        self._entries[key] = (name, normalized, weight, restaurant_id)
+        for gram in trigrams(normalized):
+            self._trigrams[gram].add(key)
+        if kind == MENU_ITEM:
+            self._restaurant_items[restaurant_id].add(pk)
+        words = normalized.split(' ')
+        return [(' '.join(words[position:]), position, key) for position in range(len(words))]
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._discard((kind, pk))
+
+    def remove_restaurant(self, restaurant_id):
+        """Drop a restaurant together with all of its menu items"""
+        with self._lock:
+            for item_id in list(self._restaurant_items.get(restaurant_id, ())):
+                self._discard((MENU_ITEM, item_id))
+            self._discard((RESTAURANT, restaurant_id))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        name, normalized, weight, restaurant_id = entry
+        words = normalized.split(' ')
+        for position in range(len(words)):
+            term = (' '.join(words[position:]), position, key)
+            index = bisect_left(self._terms, term)
+            if index < len(self._terms) and self._terms[index] == term:
+                del self._terms[index]
+        for gram in trigrams(normalized):
+            postings = self._trigrams.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._trigrams[gram]
+        if key[0] == MENU_ITEM:
+            items = self._restaurant_items.get(restaurant_id)
+            if items is not None:
+                items.discard(key[1])
+                if not items:
+                    del self._restaurant_items[restaurant_id]
+
+    def search(self, query, limit=8):
+        """Return up to ``limit`` suggestions for ``query``, best first"""
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            scored = self._prefix_matches(query)
+            if len(scored) < limit and len(query) >= 3:
+                for key, score in self._trigram_matches(query, exclude=scored):
+                    scored[key] = score
+            ranked = sorted(scored.items(), key=lambda pair: pair[1])[:limit]
+            return [self._serialize(key) for key, score in ranked]
+
+    def _prefix_matches(self, query):
+        # Every matching term is scored: the terms are in alphabetical order,
+        # so cutting the scan short would drop better ranked names further on
+        scored = {}
+        index = bisect_left(self._terms, (query,))
+        terms = self._terms
+        while index < len(terms):
+            term, position, key = terms[index]
+            if not term.startswith(query):
+                break
+            name, normalized, weight, restaurant_id = self._entries[key]
+            # Whole-name prefixes beat word prefixes; then higher weight, shorter name
+            score = (0, position, -weight, len(normalized), normalized)
+            if key not in scored or score < scored[key]:
+                scored[key] = score
+            index += 1
+        return scored
+
+    def _trigram_matches(self, query, exclude):
+        grams = trigrams(query)
+        postings = sorted(
+            (self._trigrams[gram] for gram in grams if gram in self._trigrams), key=len
+        )
+        candidates = set()
+        for keys in postings[:3]:
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+            for key in keys:
+                if key not in exclude:
+                    candidates.add(key)
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+        matches = []
+        for key in candidates:
+            shared = sum(1 for keys in postings if key in keys)
+            similarity = shared / len(grams)
+            if similarity >= MIN_TRIGRAM_SCORE:
+                name, normalized, weight, restaurant_id = self._entries[key]
+                matches.append((key, (1, -similarity, -weight, len(normalized), normalized)))
+        return matches
+
+    def _serialize(self, key):
+        kind, pk = key
+        name, normalized, weight, restaurant_id = self._entries[key]
+        result = {'type': kind, 'id': pk, 'name': name}
+        if kind == MENU_ITEM:
+            result['restaurant_id'] = restaurant_id
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def build_index():
+    """Load every active restaurant and its available menu items"""
+    from .models import Restaurant, MenuItem
+
+    index = AutocompleteIndex()
+    restaurants = Restaurant.objects.filter(status='active').values_list('id', 'name', 'rating')
+    index.extend(
+        (RESTAURANT, pk, name, rating, None)
+        for pk, name, rating in restaurants.iterator(chunk_size=2000)
+    )
+    items = MenuItem.objects.filter(
+        is_available=True, restaurant__status='active'
+    ).values_list('id', 'name', 'restaurant_id')
+    index.extend(
+        (MENU_ITEM, pk, name, 0.0, restaurant_id)
+        for pk, name, restaurant_id in items.iterator(chunk_size=2000)
+    )
+    return index
+
+
+def get_autocomplete_index():
+    global _index
+    index = _index
+    if index is None or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+        with _index_lock:
+            if _index is index:
+                _index = build_index()
+            index = _index
+    return index
+
+
+def reset_autocomplete_index():
+    global _index
+    _index = None
+
+
+def sync_restaurant(restaurant):
+    """Apply a restaurant save to the index, if it has been loaded"""
+    index = _index
+    if index is None:
+        return
+    if restaurant.status != 'active':
+        index.remove_restaurant(restaurant.pk)
+        return
+    was_indexed = (RESTAURANT, restaurant.pk) in index
+    index.add(RESTAURANT, restaurant.pk, restaurant.name, weight=restaurant.rating)
+    if not was_indexed:
+        # Newly activated: its menu was kept out of the index until now
+        items = restaurant.menu_items.filter(is_available=True).values_list('id', 'name')
+        index.extend((MENU_ITEM, pk, name, 0.0, restaurant.pk) for pk, name in items)
+
+
+def remove_restaurant(restaurant_id):
+    if _index is not None:
+        _index.remove_restaurant(restaurant_id)
+
+
+def sync_menu_item(menu_item):
+    index = _index
+    if index is None:
+        return
+    if menu_item.is_available and (RESTAURANT, menu_item.restaurant_id) in index:
+        index.add(MENU_ITEM, menu_item.pk, menu_item.name, restaurant_id=menu_item.restaurant_id)
+    else:
+        index.remove(MENU_ITEM, menu_item.pk)
+
+
+def remove_menu_item(menu_item_id):
+    if _index is not None:
+        _index.remove(MENU_ITEM, menu_item_id)
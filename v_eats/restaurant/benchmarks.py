@@ -0,0 +1,183 @@
+"""
+Shared helpers for the benchmark management commands.
+
+Benchmarks never touch the configured database: ``benchmark_database``
+creates a throwaway test database (in memory for SQLite) the same way the
+test runner does, and destroys it afterwards.
+"""
+import datetime
+import math
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection
+
+WORDS = [
+    'amala', 'bistro', 'buka', 'burger', 'cafe', 'chicken', 'chops', 'corner',
+    'curry', 'delight', 'diner', 'egusi', 'express', 'garden', 'grill', 'house',
+    'jollof', 'kitchen', 'lagos', 'mama', 'noodle', 'palace', 'pepper', 'pizza',
+    'plantain', 'pot', 'rice', 'shawarma', 'smoke', 'soup', 'spot', 'suya',
+    'taco', 'tasty', 'urban', 'village', 'wok', 'yam', 'zobo',
+]
+
+
+def random_name(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def make_rng(seed=42):
+    return random.Random(seed)
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize_latencies(samples):
+    """Summarise a list of durations in seconds as milliseconds"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        'throughput_per_s': round(len(ordered) / total, 1) if total else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:<28} n={summary['count']:<7} "
+        f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms "
+        f"p99={summary['p99_ms']:.3f}ms max={summary['max_ms']:.3f}ms"
+    )
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def seed_catalogue(restaurants, menu_items, rng, owner=None, batch_size=5000, stdout=None):
+    """
+    Bulk-insert ``restaurants`` restaurants (85% active) and ``menu_items``
+    menu items spread over them. Signals are bypassed, so derived tables
+    (search index, menu summaries) must be rebuilt afterwards if needed.
+    """
+    from django.contrib.auth.models import User
+
+    from .geo import geohash_encode
+    from .models import MenuItem, Restaurant
+
+    if owner is None:
+        owner = User.objects.create_user('benchmark-owner', 'owner@example.com', 'benchmark')
+    categories = [value for value, label in Restaurant.CATEGORY_CHOICES]
+    item_categories = [value for value, label in MenuItem.CATEGORY_CHOICES]
+
+    def restaurant_rows():
+        for number in range(restaurants):
+            opening = rng.randint(6, 12)
+            # Spread over greater Lagos
+            latitude, longitude = rng.uniform(6.40, 6.70), rng.uniform(3.10, 3.70)
+            rating, total_reviews = round(rng.uniform(1, 5), 1), rng.randint(0, 500)
+            yield Restaurant(
+                owner=owner,
+                name=random_name(rng),
+                description=f'{random_name(rng, 6)}. {random_name(rng, 8)}.',
+                category=rng.choice(categories),
+                address=f'{rng.randint(1, 300)} {random_name(rng, 2)} Street',
+                latitude=latitude,
+                longitude=longitude,
+                geohash=geohash_encode(latitude, longitude),
+                delivery_radius_km=rng.choice([3.0, 5.0, 8.0, 12.0]),
+                phone='555-0100',
+                email=f'restaurant{number}@example.com',
+                status='active' if rng.random() < 0.85 else rng.choice(['inactive', 'pending']),
+                opening_time=datetime.time(opening, 0),
+                closing_time=datetime.time((opening + rng.randint(8, 16)) % 24, 0),
+                rating=rating,
+                total_reviews=total_reviews,
+                rating_total=round(rating * total_reviews),
+            )
+
+    _bulk_insert(Restaurant, restaurant_rows(), batch_size, stdout)
+    restaurant_ids = list(Restaurant.objects.order_by().values_list('pk', flat=True))
+
+    def menu_rows():
+        for number in range(menu_items):
+            is_vegan = rng.random() < 0.1
+            yield MenuItem(
+                restaurant_id=restaurant_ids[number % len(restaurant_ids)],
+                name=random_name(rng, 2),
+                description=random_name(rng, 8),
+                price=Decimal(rng.randint(150, 6000)) / 100,
+                category=rng.choice(item_categories),
+                is_available=rng.random() < 0.9,
+                is_vegetarian=is_vegan or rng.random() < 0.25,
+                is_vegan=is_vegan,
+                preparation_time=rng.randint(5, 60),
+            )
+
+    if restaurant_ids:
+        _bulk_insert(MenuItem, menu_rows(), batch_size, stdout)
+    return owner, restaurant_ids
+
+
+def _bulk_insert(model, rows, batch_size, stdout):
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            inserted += len(batch)
+            batch = []
+            if stdout is not None and inserted % (batch_size * 20) == 0:
+                stdout.write(f'  {inserted} {model._meta.verbose_name_plural} inserted')
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def time_callable(func, repeat):
+    """Call ``func`` ``repeat`` times and return the durations in seconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def compare_results(baseline, current, threshold=0.2, metric='p95_ms'):
+    """
+    Compare two ``{name: summary}`` mappings from saved benchmark runs.
+
+    Returns ``(name, field, baseline, current)`` tuples for every entry whose
+    ``metric`` grew by more than ``threshold`` (a fraction) or whose query
+    count went up at all; query counts are deterministic, so any increase is
+    a regression.
+    """
+    regressions = []
+    for name, summary in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if before.get(metric) and summary[metric] > before[metric] * (1 + threshold):
+            regressions.append((name, metric, before[metric], summary[metric]))
+        if 'queries' in before and summary.get('queries', 0) > before['queries']:
+            regressions.append((name, 'queries', before['queries'], summary['queries']))
+    return regressions
@@ -0,0 +1,268 @@
+"""
+Reference counts and garbage collection for content-addressed uploads.
+
+Every blob (see storage.py) has a ``StoredBlob`` row counting the image
+fields that hold it. The ``Restaurant``/``MenuItem`` signals move the
+counts with ``apply_image_change`` and ``release`` when a save or delete
+changes which files a row holds, inside the same transaction.
+
+``collect_garbage`` removes blobs nobody has held for ``GRACE``, together
+with the thumbnails rendered from them (whose names carry the same digest,
+see images.py) unless other rows still use those, and files left on disk
+without a row by an upload whose transaction rolled back. Before deleting
+it re-checks the image columns, so a count that drifted (``QuerySet.update``
+bypasses the signals) can keep a blob alive for longer but never deletes
+one in use; ``rebuild_refcounts`` recounts everything from the tables.
+
+``serve_immutable`` is only routed when ``DEBUG`` is on. In production the
+proxy serving ``MEDIA_URL`` must send ``IMMUTABLE`` as ``Cache-Control`` for
+``blobs/`` and ``variants/``, with the file's digest as its ``ETag``.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.http import HttpResponseNotModified
+from django.utils import timezone
+from django.views.static import serve
+
+from .images import IMAGE_FIELDS, VARIANT_DIR
+from .listing import touch_update
+from .menus import invalidate_menu
+from .models import MenuItem, Restaurant, StoredBlob
+from .storage import BLOB_DIR, TEMP_DIR, blob_digest, blob_name, blob_storage
+
+GRACE = timedelta(hours=24)
+BATCH_SIZE = 500
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# The column naming the restaurant whose public menu shows a row's images
+MENU_OWNER = {Restaurant: 'id', MenuItem: 'restaurant_id'}
+
+
+def blob_names(names):
+    return sorted({name for name in names if blob_digest(name)})
+
+
+def adjust_refcounts(names, sign):
+    # One UPDATE per distinct multiplicity; an image and a logo may be the same blob
+    by_count = {}
+    for name, count in Counter(name for name in names if blob_digest(name)).items():
+        by_count.setdefault(count, []).append(name)
+    now = timezone.now()
+    for count, group in by_count.items():
+        StoredBlob.objects.filter(name__in=group).update(refcount=F('refcount') + sign * count, updated_at=now)
+
+
+def retain(names):
+    """Count one more reference to each blob in ``names``"""
+    names = list(names)
+    new = blob_names(names)
+    if new:
+        StoredBlob.objects.bulk_create(
+            [StoredBlob(name=name, size=blob_size(name)) for name in new], ignore_conflicts=True,
+        )
+        adjust_refcounts(names, 1)
+
+
+def release(names):
+    adjust_refcounts(names, -1)
+
+
+def apply_image_change(old, new):
+    """Move the counts from the file names in ``old`` to those in ``new`` (field by field)"""
+    old = old or [None] * len(new)
+    retain([name for before, name in zip(old, new) if name and name != before])
+    release([before for before, name in zip(old, new) if before and name != before])
+
+
+def blob_size(name):
+    try:
+        return blob_storage.size(name)
+    except OSError:
+        return 0
+
+
+def image_names(instance):
+    return [getattr(instance, field_name).name for field_name in IMAGE_FIELDS[type(instance)]]
+
+
+def fetch_image_names(model, pk):
+    return model.objects.filter(pk=pk).values_list(*IMAGE_FIELDS[model]).first()
+
+
+def referenced_names(names=None):
+    """How many image fields hold each of ``names`` (every stored name by default)"""
+    counts = Counter()
+    for model, fields in IMAGE_FIELDS.items():
+        for field_name in fields:
+            queryset = model.objects.order_by()
+            if names is not None:
+                queryset = queryset.filter(**{f'{field_name}__in': names})
+            else:
+                queryset = queryset.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            counts.update(queryset.values_list(field_name, flat=True).iterator(chunk_size=BATCH_SIZE))
+    return counts
+
+
+def rebuild_refcounts():
+    """Recount every blob from the image columns; returns the number of blobs"""
+    counts = referenced_names()
+    StoredBlob.objects.bulk_create(
+        [StoredBlob(name=name, size=blob_size(name)) for name in blob_names(counts)],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for blob in StoredBlob.objects.only('name', 'refcount').iterator(chunk_size=BATCH_SIZE):
+        if blob.refcount != counts.get(blob.name, 0):
+            StoredBlob.objects.filter(pk=blob.pk).update(refcount=counts.get(blob.name, 0), updated_at=now)
+    return StoredBlob.objects.count()
+
+
+def variants_in_use(digest, name):
+    """
+    Whether thumbnails of ``digest`` serve anything besides ``name``: the
+    same content stored under another extension, or a non-blob upload
+    whose ``image_variants`` entry was rendered from it.
+    """
+    same_content = StoredBlob.objects.filter(name__startswith=blob_name(digest)).exclude(name=name)
+    if same_content.exists():
+        return True
+    for model, fields in IMAGE_FIELDS.items():
+        for field_name in fields:
+            # An entry still naming ``name`` is stale: its field holds another file now
+            entries = model.objects.filter(**{f'image_variants__{field_name}__digest': digest}).exclude(
+                **{f'image_variants__{field_name}__source': name},
+            )
+            if entries.exists():
+                return True
+    return False
+
+
+def delete_blob_files(name):
+    """Remove a blob and its thumbnails, unless they are shared; returns the bytes freed"""
+    freed = blob_size(name)
+    blob_storage.delete(name)
+    digest = blob_digest(name)
+    if variants_in_use(digest, name):
+        return freed
+    directory = f'{VARIANT_DIR}/{digest[:2]}'
+    try:
+        files = default_storage.listdir(directory)[1]
+    except FileNotFoundError:
+        files = []
+    for variant in files:
+        if variant.startswith(digest[:32] + '-'):
+            freed += default_storage.size(f'{directory}/{variant}')
+            default_storage.delete(f'{directory}/{variant}')
+    return freed
+
+
+def recently_touched(name, cutoff):
+    try:
+        return blob_storage.get_modified_time(name) >= cutoff
+    except OSError:
+        return False
+
+
+def collect_garbage(grace=GRACE, dry_run=False):
+    """Delete blobs unused for ``grace``; returns ``(blobs, bytes)`` removed"""
+    cutoff = timezone.now() - grace
+    removed = freed = 0
+    candidates = list(
+        StoredBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).values_list('name', flat=True)
+    )
+    for start in range(0, len(candidates), BATCH_SIZE):
+        batch = candidates[start:start + BATCH_SIZE]
+        live = referenced_names(batch)
+        for name in live:
+            # The count drifted; put it right instead of deleting a blob in use
+            StoredBlob.objects.filter(name=name).update(refcount=live[name], updated_at=timezone.now())
+        for name in batch:
+            # A fresh mtime means the same content was just uploaded again
+            if name in live or recently_touched(name, cutoff):
+                continue
+            if dry_run:
+                removed += 1
+                freed += blob_size(name)
+                continue
+            # Conditional, so a reference taken since the query keeps the row
+            if StoredBlob.objects.filter(name=name, refcount__lte=0).delete()[0]:
+                freed += delete_blob_files(name)
+                removed += 1
+
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    for name in stray_files(cutoff):
+        if name in known:
+            continue
+        removed += 1
+        if dry_run or name.startswith(TEMP_DIR):
+            freed += blob_size(name)
+            if not dry_run:
+                blob_storage.delete(name)
+        else:
+            freed += delete_blob_files(name)
+    return removed, freed
+
+
+def stray_files(cutoff):
+    """Blob and temporary files older than ``cutoff``"""
+    root = blob_storage.path(BLOB_DIR)
+    for directory, subdirectories, files in os.walk(root):
+        relative = os.path.relpath(directory, blob_storage.location).replace(os.sep, '/')
+        for filename in files:
+            name = f'{relative}/{filename}'
+            if (name.startswith(TEMP_DIR) or blob_digest(name)) and not recently_touched(name, cutoff):
+                yield name
+
+
+def adopt_legacy_files(delete_originals=False):
+    """
+    Move uploads stored before content addressing into blobs, so duplicates
+    collapse into one file. Returns how many field values were rewritten.
+    """
+    adopted = 0
+    originals = set()
+    restaurant_ids = set()
+    for model, fields in IMAGE_FIELDS.items():
+        for field_name in fields:
+            legacy = (
+                model.objects.exclude(**{f'{field_name}__startswith': f'{BLOB_DIR}/'})
+                .exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list('pk', field_name, MENU_OWNER[model])
+            )
+            for pk, name, restaurant_id in list(legacy):
+                if not blob_storage.exists(name):
+                    continue
+                with blob_storage.open(name, 'rb') as original:
+                    blob = blob_storage.save(name, original)
+                touch_update(model.objects.filter(pk=pk, **{field_name: name}), **{field_name: blob})
+                retain([blob])
+                originals.add(name)
+                restaurant_ids.add(restaurant_id)
+                adopted += 1
+    # update() skips the signals, and stored menus must not keep the old URLs
+    for restaurant_id in restaurant_ids:
+        invalidate_menu(restaurant_id)
+    if delete_originals:
+        still_used = referenced_names(sorted(originals))
+        for name in originals - set(still_used):
+            blob_storage.delete(name)
+    return adopted
+
+
+def serve_immutable(request, path):
+    """
+    Serve a blob or thumbnail in development. Their names are content
+    hashes, so browsers and CDNs may keep them forever and never need to
+    revalidate.
+    """
+    etag = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = serve(request, path, document_root=blob_storage.location)
+    response['Cache-Control'] = IMMUTABLE
+    response['ETag'] = etag
+    return response
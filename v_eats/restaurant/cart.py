@@ -0,0 +1,181 @@
+"""
+Shopping cart kept on the client side of the session, not in the database.
+
+A cart is one restaurant plus ``(menu_item_id, quantity)`` pairs, stored as
+a flat integer array ``[restaurant_id, id, qty, id, qty, ...]``. With
+``CART_STORE = 'cookie'`` (the default) the array is signed and kept in a
+cookie, so carts cost no database row and no session write; with
+``'session'`` it goes in ``request.session``, which should then use the
+cache backend (``SESSION_ENGINE = 'django.contrib.sessions.backends.cache'``)
+to stay off the database too.
+
+Names and prices are never stored. ``Cart.lines()`` loads them on first use
+with a single ``in_bulk`` and drops anything that has since been deleted,
+switched off (``is_available``) or moved, reporting what it dropped in
+``removed``; prices are always the current ones.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+
+from .checkout import MAX_LINES, MAX_QUANTITY
+from .models import MenuItem
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'restaurant.cart'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 14
+SESSION_KEY = 'cart'
+LINE_FIELDS = ('pk', 'restaurant_id', 'name', 'price', 'is_available')
+
+
+class CartError(Exception):
+    pass
+
+
+class Cart:
+    def __init__(self, restaurant_id=None, quantities=None):
+        self.restaurant_id = restaurant_id
+        # menu_item_id -> quantity, in the order items were added
+        self.quantities = dict(quantities or {})
+        self.removed = []
+        self.modified = False
+        self._lines = None
+
+    def __len__(self):
+        return sum(self.quantities.values())
+
+    def __bool__(self):
+        return bool(self.quantities)
+
+    @classmethod
+    def decode(cls, data):
+        """A cart from its stored array; anything malformed is an empty cart"""
+        try:
+            restaurant_id, *pairs = (int(value) for value in data)
+        except (TypeError, ValueError):
+            return cls()
+        quantities = {}
+        for item_id, quantity in zip(pairs[0::2], pairs[1::2]):
+            if 0 < quantity <= MAX_QUANTITY and len(quantities) < MAX_LINES:
+                quantities[item_id] = quantity
+        return cls(restaurant_id, quantities) if quantities else cls()
+
+    def encode(self):
+        if not self.quantities:
+            return []
+        return [self.restaurant_id, *(value for pair in self.quantities.items() for value in pair)]
+
+    def set(self, item_id, quantity, restaurant_id):
+        """
+        Set the quantity of ``item_id`` (0 removes it). An item from another
+        restaurant starts a new cart; returns ``True`` when that happened.
+        """
+        if quantity > MAX_QUANTITY:
+            raise CartError(f'You can order at most {MAX_QUANTITY} of an item.')
+        replaced = quantity > 0 and bool(self.quantities) and restaurant_id != self.restaurant_id
+        if replaced:
+            self.quantities = {}
+        if quantity <= 0:
+            self.discard([item_id])
+            return False
+        if item_id not in self.quantities and len(self.quantities) >= MAX_LINES:
+            raise CartError(f'A cart can hold at most {MAX_LINES} different items.')
+        self.quantities[item_id] = quantity
+        self.restaurant_id = restaurant_id
+        self.modified = True
+        self._lines = None
+        return replaced
+
+    def clear(self):
+        self.quantities = {}
+        self.restaurant_id = None
+        self.modified = True
+        self._lines = []
+
+    def lines(self):
+        """
+        ``[(menu_item, quantity)]`` with current names and prices, loaded with
+        one query the first time it is needed. Stale entries are dropped.
+        """
+        if self._lines is None:
+            items = MenuItem.objects.only(*LINE_FIELDS).in_bulk(list(self.quantities)) if self.quantities else {}
+            self._lines = []
+            for item_id, quantity in list(self.quantities.items()):
+                item = items.get(item_id)
+                if item is None or not item.is_available or item.restaurant_id != self.restaurant_id:
+                    # Gone, switched off, or moved to another restaurant since it was added
+                    self.removed.append(item.name if item is not None else 'A discontinued item')
+                    del self.quantities[item_id]
+                    self.modified = True
+                    continue
+                self._lines.append((item, quantity))
+            if not self.quantities:
+                self.restaurant_id = None
+        return self._lines
+
+    def subtotal(self):
+        return sum((item.price * quantity for item, quantity in self.lines()), Decimal('0.00'))
+
+    def discard(self, item_ids):
+        """Remove ``item_ids`` from the cart, if present"""
+        for item_id in item_ids:
+            if self.quantities.pop(item_id, None) is not None:
+                self.modified = True
+        self._lines = None
+        if not self.quantities:
+            self.restaurant_id = None
+
+
+class CookieCartStore:
+    def load(self, request):
+        try:
+            data = signing.loads(
+                request.COOKIES[COOKIE_NAME], salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+            )
+        except (KeyError, signing.BadSignature):
+            return Cart()
+        return Cart.decode(data)
+
+    def save(self, request, response, cart):
+        if not cart:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+            return
+        response.set_cookie(
+            COOKIE_NAME,
+            signing.dumps(cart.encode(), salt=COOKIE_SALT, compress=True),
+            max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+
+
+class SessionCartStore:
+    def load(self, request):
+        return Cart.decode(request.session.get(SESSION_KEY) or [])
+
+    def save(self, request, response, cart):
+        if cart:
+            request.session[SESSION_KEY] = cart.encode()
+        else:
+            request.session.pop(SESSION_KEY, None)
+
+
+STORES = {'cookie': CookieCartStore, 'session': SessionCartStore}
+
+
+def get_cart_store():
+    return STORES[getattr(settings, 'CART_STORE', 'cookie')]()
+
+
+def load_cart(request):
+    """The request's cart, decoded once per request"""
+    if not hasattr(request, '_cart'):
+        request._cart = get_cart_store().load(request)
+    return request._cart
+
+
+def save_cart(request, response, cart):
+    """Store ``cart`` if it changed, including entries ``lines()`` dropped"""
+    if cart.modified:
+        get_cart_store().save(request, response, cart)
+    return response
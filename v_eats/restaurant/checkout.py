@@ -0,0 +1,150 @@
+"""
+Checkout: turn a cart into an ``Order``.
+
+A cart is a list of ``(menu_item_id, quantity)`` pairs. ``price_cart``
+reads every item together with its restaurant's ordering terms in one
+query, and checks availability, the restaurant and the minimum order in
+the same pass. Only then does ``place_order`` open a transaction, which
+inserts the order and all of its items with one ``bulk_create``.
+
+Nothing is locked and no shared row (restaurant counters, say) is updated,
+so checkouts on one busy restaurant do not queue behind each other: each
+transaction holds the database for two INSERTs. The prices on the order
+are snapshots of what the customer was shown, whatever happens to the
+menu afterwards; an item switched off between the read and the insert is
+still sold at the quoted price.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import MenuItem, Order, OrderItem
+
+MAX_LINES = 100
+MAX_QUANTITY = 50
+MAX_ITEM_ID = 2 ** 63 - 1
+
+QUOTE_FIELDS = (
+    'pk', 'name', 'price', 'is_available', 'restaurant_id', 'restaurant__status',
+    'restaurant__minimum_order', 'restaurant__delivery_fee', 'restaurant__is_delivery_available',
+)
+
+
+class CheckoutError(Exception):
+    """
+    The cart cannot be ordered. ``messages`` are for the customer;
+    ``item_ids`` are the cart entries that caused them, if any.
+    """
+
+    def __init__(self, messages, item_ids=()):
+        super().__init__(' '.join(messages))
+        self.messages = list(messages)
+        self.item_ids = list(item_ids)
+
+
+class Quote:
+    def __init__(self, restaurant_id, lines, delivery_fee):
+        self.restaurant_id = restaurant_id
+        # [(menu_item_id, name, unit_price, quantity)]
+        self.lines = lines
+        self.item_count = sum(line[3] for line in lines)
+        self.subtotal = sum((line[2] * line[3] for line in lines), Decimal('0.00'))
+        self.delivery_fee = delivery_fee
+        self.total = self.subtotal + delivery_fee
+
+
+def whole_number(value):
+    """``value`` as an int, refusing booleans and fractions rather than truncating them"""
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def normalize_cart(lines):
+    """``{menu_item_id: quantity}`` from ``(id, quantity)`` pairs, merging repeated items"""
+    quantities = {}
+    try:
+        for item_id, quantity in lines:
+            item_id, quantity = whole_number(item_id), whole_number(quantity)
+            # Ids past a signed 64-bit column cannot exist, and the database rejects them
+            if not 1 <= item_id <= MAX_ITEM_ID or quantity < 1:
+                raise ValueError(item_id, quantity)
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+    except (TypeError, ValueError):
+        raise CheckoutError(['The cart is not valid.'])
+    if not quantities:
+        raise CheckoutError(['Your cart is empty.'])
+    if len(quantities) > MAX_LINES:
+        raise CheckoutError([f'A cart can hold at most {MAX_LINES} different items.'])
+    too_many = [item_id for item_id, quantity in quantities.items() if quantity > MAX_QUANTITY]
+    if too_many:
+        raise CheckoutError([f'You can order at most {MAX_QUANTITY} of an item.'], too_many)
+    return quantities
+
+
+def price_cart(restaurant_id, quantities):
+    """
+    Price ``{menu_item_id: quantity}`` at ``restaurant_id`` with a single
+    query; returns a ``Quote`` or raises ``CheckoutError`` listing every
+    problem found.
+    """
+    rows = MenuItem.objects.filter(pk__in=list(quantities)).values_list(*QUOTE_FIELDS)
+    messages = []
+    bad_ids = []
+    lines = []
+    terms = None
+    seen = set()
+    for pk, name, price, is_available, item_restaurant_id, *restaurant_terms in rows:
+        seen.add(pk)
+        if item_restaurant_id != restaurant_id:
+            bad_ids.append(pk)
+            messages.append(f'"{name}" is from another restaurant.')
+            continue
+        terms = restaurant_terms
+        if not is_available:
+            bad_ids.append(pk)
+            messages.append(f'"{name}" is not available right now.')
+            continue
+        lines.append((pk, name, price, quantities[pk]))
+
+    missing = [item_id for item_id in quantities if item_id not in seen]
+    if missing:
+        bad_ids.extend(missing)
+        messages.append('Some items in your cart are no longer on the menu.')
+    if terms is None:
+        raise CheckoutError(messages or ['Your cart is empty.'], bad_ids)
+
+    status, minimum_order, delivery_fee, is_delivery_available = terms
+    if status != 'active':
+        raise CheckoutError(['This restaurant is not taking orders.'])
+    if messages:
+        raise CheckoutError(messages, bad_ids)
+    quote = Quote(restaurant_id, sorted(lines), delivery_fee if is_delivery_available else Decimal('0.00'))
+    if quote.subtotal < minimum_order:
+        raise CheckoutError([f'The minimum order here is {minimum_order}; add {minimum_order - quote.subtotal} more.'])
+    return quote
+
+
+def place_order(customer, restaurant_id, lines, delivery_address=''):
+    """Check out ``lines`` (``(menu_item_id, quantity)`` pairs) for ``customer``; returns the ``Order``"""
+    quote = price_cart(restaurant_id, normalize_cart(lines))
+    with transaction.atomic():
+        order = Order.objects.create(
+            customer=customer,
+            restaurant_id=restaurant_id,
+            delivery_address=delivery_address,
+            item_count=quote.item_count,
+            subtotal=quote.subtotal,
+            delivery_fee=quote.delivery_fee,
+            total=quote.total,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, menu_item_id=item_id, name=name, unit_price=price, quantity=quantity,
+                line_total=price * quantity,
+            )
+            for item_id, name, price, quantity in quote.lines
+        ])
+    return order
@@ -1,5 +1,6 @@
 from django import forms
-from .models import Restaurant, MenuItem
+from .checkout import MAX_QUANTITY
+from .models import Restaurant, MenuItem, Review
 
 class RestaurantForm(forms.ModelForm):
     class Meta:
@@ -7,7 +8,7 @@ class RestaurantForm(forms.ModelForm):
         fields = [
             'name', 'description', 'category', 'address', 'phone', 'email',
             'website', 'image', 'logo', 'opening_time', 'closing_time',
-            'is_delivery_available', 'delivery_fee', 'minimum_order'
+            'is_delivery_available', 'delivery_fee', 'minimum_order', 'delivery_radius_km'
         ]
         widgets = {
             'name': forms.TextInput(attrs={
@@ -68,6 +69,12 @@ class RestaurantForm(forms.ModelForm):
                 'step': '0.01',
                 'min': '0'
             }),
+            'delivery_radius_km': forms.NumberInput(attrs={
+                'class': 'w-full px-4 py-3 border border-gray-300 dark:border-gray-600 rounded-lg focus:ring-2 focus:ring-emerald-500 focus:border-emerald-500 dark:bg-gray-700 dark:text-white transition-colors duration-200',
+                'step': '0.5',
+                'min': '0.5',
+                'max': '25'
+            }),
         }
 
 class MenuItemForm(forms.ModelForm):
@@ -104,3 +111,28 @@ class MenuItemForm(forms.ModelForm):
                 'min': '1'
             }),
         }
+
+class CartItemForm(forms.Form):
+    item_id = forms.IntegerField(min_value=1)
+    quantity = forms.IntegerField(min_value=0, max_value=MAX_QUANTITY, initial=1)
+
+class ReviewForm(forms.ModelForm):
+    class Meta:
+        model = Review
+        fields = ['rating', 'comment']
+
+class MenuImportForm(forms.Form):
+    file = forms.FileField(
+        help_text='CSV or XLSX with a header row',
+        widget=forms.FileInput(attrs={
+            'class': 'w-full px-4 py-3 border border-gray-300 dark:border-gray-600 rounded-lg focus:ring-2 focus:ring-emerald-500 focus:border-emerald-500 dark:bg-gray-700 dark:text-white transition-colors duration-200',
+            'accept': '.csv,.xlsx',
+        }),
+    )
+    partial = forms.BooleanField(
+        required=False,
+        help_text='Import the valid rows even if some rows have errors',
+        widget=forms.CheckboxInput(attrs={
+            'class': 'h-4 w-4 text-emerald-600 focus:ring-emerald-500 border-gray-300 rounded'
+        }),
+    )
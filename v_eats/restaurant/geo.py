@@ -0,0 +1,415 @@
+"""
+Restaurant locations: offline geocoding, geohash cells and a delivery index.
+
+Coordinates come from a local gazetteer file (``GEO_GAZETTEER``, one
+``name<TAB>lat<TAB>lng`` per line) matched against the free-text address by
+``manage.py geocode_restaurants``; nothing is looked up over the network.
+
+Two indexes answer "which restaurants deliver to this point":
+
+* ``Restaurant.geohash`` is kept in step from ``lat``/``lng`` and indexed,
+  so a 3x3 block of geohash cells becomes nine range conditions on that
+  index, with the exact great-circle distance checked in SQL.
+* ``DeliveryIndex`` keeps a KD-tree over unit vectors in memory (like the
+  autocomplete index, one per process, loaded on first use and updated from
+  signals). Edits go to a small overlay that is folded into a rebuilt tree
+  once it grows. Signals only reach their own process, so the index is
+  rebuilt after ``INDEX_MAX_AGE`` seconds to pick up restaurants created,
+  geocoded or moved elsewhere.
+
+``filter_by_location`` uses the in-memory index when ``GEO_INDEX`` is
+``'memory'`` (the default) and the database otherwise.
+"""
+import functools
+import math
+import threading
+import time
+from operator import itemgetter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FloatField, Max, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+from .autocomplete import normalize
+
+EARTH_RADIUS_KM = 6371.0088
+# Upper bound for Restaurant.delivery_radius_km, and so for any delivery search
+MAX_DELIVERY_RADIUS_KM = 25.0
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Above this many matches the id list is not worth sending to the database
+MAX_ID_FILTER = 10000
+MAX_RADIUS_CACHE_KEY = 'restaurant:max-delivery-radius'
+INDEX_MAX_AGE = 60
+
+DEFAULT_GAZETTEER = Path(__file__).resolve().parent / 'data' / 'gazetteer.tsv'
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Geohash
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bit = value = 0
+    even = True
+    while len(chars) < precision:
+        bounds, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bit = value = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """``(height, width)`` of a geohash cell in degrees"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    Geohash prefixes whose cells cover every point within ``radius_km``.
+
+    Picks the finest precision whose cells are at least ``radius_km`` on
+    each side; the circle then fits in the 3x3 block around the centre cell.
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(candidate)
+        height_km = height * 111.32
+        width_km = width * 111.32 * math.cos(math.radians(min(abs(lat) + height, 89.9)))
+        if height_km >= radius_km and width_km >= radius_km:
+            precision = candidate
+            break
+    height, width = geohash_cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlng in (-width, 0, width):
+            cell_lat = max(-90.0, min(90.0, lat + dlat))
+            cell_lng = (lng + dlng + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def distance_expression(lat, lng):
+    """Great-circle distance in km from ``(lat, lng)`` to each row, in SQL"""
+    phi = math.radians(lat)
+    half_dlat = (Radians(F('latitude')) - Value(phi)) / 2
+    half_dlng = (Radians(F('longitude')) - Value(math.radians(lng))) / 2
+    a = Power(Sin(half_dlat), 2) + Value(math.cos(phi)) * Cos(Radians(F('latitude'))) * Power(Sin(half_dlng), 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a), output_field=FloatField())
+
+
+def geohash_filter(lat, lng, radius_km):
+    condition = Q()
+    for prefix in covering_cells(lat, lng, radius_km):
+        # A prefix match as a range, so the B-tree index on geohash is used
+        condition |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+    return condition
+
+
+# In-memory KD-tree
+
+def to_unit_vector(lat, lng):
+    phi, lam = math.radians(lat), math.radians(lng)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def chord_length(distance_km):
+    """Straight-line distance through the sphere for a surface distance"""
+    return 2 * math.sin(min(distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def surface_distance(squared_chord):
+    """Inverse of ``chord_length``, from the squared chord"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class KDTree:
+    """
+    Static 3-d tree over ``(x, y, z, key)`` points, stored implicitly: each
+    subrange is sorted on its axis and split at the median.
+    """
+
+    LEAF_SIZE = 16
+
+    def __init__(self, points):
+        self._points = list(points)
+        self._build(0, len(self._points), 0)
+
+    def __len__(self):
+        return len(self._points)
+
+    def _build(self, lo, hi, depth):
+        while hi - lo > self.LEAF_SIZE:
+            axis = depth % 3
+            self._points[lo:hi] = sorted(self._points[lo:hi], key=itemgetter(axis))
+            middle = (lo + hi) // 2
+            self._build(lo, middle, depth + 1)
+            lo, depth = middle + 1, depth + 1
+
+    def query_ball(self, center, radius):
+        """``(key, squared distance)`` for all points within straight-line ``radius``"""
+        cx, cy, cz = center
+        limit = radius * radius
+        points = self._points
+        found = []
+        stack = [(0, len(points), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= self.LEAF_SIZE:
+                for x, y, z, key in points[lo:hi]:
+                    squared = (x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2
+                    if squared <= limit:
+                        found.append((key, squared))
+                continue
+            middle = (lo + hi) // 2
+            x, y, z, key = points[middle]
+            squared = (x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2
+            if squared <= limit:
+                found.append((key, squared))
+            axis = depth % 3
+            offset = center[axis] - points[middle][axis]
+            if offset <= radius:
+                stack.append((lo, middle, depth + 1))
+            if offset >= -radius:
+                stack.append((middle + 1, hi, depth + 1))
+        return found
+
+
+class DeliveryIndex:
+    """Active, geocoded restaurants by location, with their delivery radius"""
+
+    # Pending edits folded into a fresh tree past this many
+    REBUILD_THRESHOLD = 256
+
+    def __init__(self, entries=()):
+        self._lock = threading.RLock()
+        # pk -> (lat, lng, delivery_radius_km, delivers)
+        self._entries = {}
+        self._pending = set()
+        self._tree = KDTree(())
+        self._tree_coordinates = {}
+        self._max_radius = 0.0
+        self.built_at = time.monotonic()
+        for pk, lat, lng, radius, delivers in entries:
+            self._entries[pk] = (lat, lng, radius, delivers)
+        self._rebuild()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pk):
+        return pk in self._entries
+
+    def _rebuild(self):
+        self._tree = KDTree(
+            to_unit_vector(lat, lng) + (pk,) for pk, (lat, lng, radius, delivers) in self._entries.items()
+        )
+        self._tree_coordinates = {pk: entry[:2] for pk, entry in self._entries.items()}
+        self._pending.clear()
+        self._max_radius = max((entry[2] for entry in self._entries.values()), default=0.0)
+
+    def add(self, pk, lat, lng, radius_km, delivers=True):
+        with self._lock:
+            self._entries[pk] = (lat, lng, radius_km, delivers)
+            self._max_radius = max(self._max_radius, radius_km)
+            # Only a move needs the overlay; radius and flag are read from _entries
+            if self._tree_coordinates.get(pk) != (lat, lng):
+                self._mark_pending(pk)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._entries.pop(pk, None) is not None and pk in self._tree_coordinates:
+                self._mark_pending(pk)
+
+    def _mark_pending(self, pk):
+        self._pending.add(pk)
+        if len(self._pending) > self.REBUILD_THRESHOLD:
+            self._rebuild()
+
+    def within(self, lat, lng, radius_km):
+        """``{pk: distance_km}`` for restaurants within ``radius_km``"""
+        with self._lock:
+            center = to_unit_vector(lat, lng)
+            chord = chord_length(radius_km)
+            matches = {
+                pk: squared for pk, squared in self._tree.query_ball(center, chord)
+                if pk not in self._pending
+            }
+            # Pending entries were added or moved since the tree was built
+            limit = chord * chord
+            for pk in self._pending:
+                entry = self._entries.get(pk)
+                if entry is not None:
+                    x, y, z = to_unit_vector(entry[0], entry[1])
+                    squared = (x - center[0]) ** 2 + (y - center[1]) ** 2 + (z - center[2]) ** 2
+                    if squared <= limit:
+                        matches[pk] = squared
+            return {pk: surface_distance(squared) for pk, squared in matches.items()}
+
+    def delivering_to(self, lat, lng):
+        """``{pk: distance_km}`` for restaurants whose delivery radius covers the point"""
+        with self._lock:
+            nearby = self.within(lat, lng, self._max_radius)
+            entries = self._entries
+            return {
+                pk: distance for pk, distance in nearby.items()
+                if entries[pk][3] and distance <= entries[pk][2]
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def build_index():
+    from .models import Restaurant
+
+    rows = Restaurant.objects.filter(
+        status='active', latitude__isnull=False, longitude__isnull=False
+    ).values_list('id', 'latitude', 'longitude', 'delivery_radius_km', 'is_delivery_available')
+    return DeliveryIndex(rows.iterator(chunk_size=2000))
+
+
+def get_delivery_index():
+    global _index
+    index = _index
+    if index is None or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+        with _index_lock:
+            if _index is index:
+                _index = build_index()
+            index = _index
+    return index
+
+
+def reset_delivery_index():
+    global _index
+    _index = None
+
+
+def sync_restaurant(restaurant):
+    """Apply a restaurant save to the delivery index, if it has been loaded"""
+    cache.delete(MAX_RADIUS_CACHE_KEY)
+    index = _index
+    if index is None:
+        return
+    if restaurant.status != 'active' or restaurant.latitude is None or restaurant.longitude is None:
+        index.remove(restaurant.pk)
+    else:
+        index.add(
+            restaurant.pk, restaurant.latitude, restaurant.longitude,
+            restaurant.delivery_radius_km, restaurant.is_delivery_available,
+        )
+
+
+def remove_restaurant(restaurant_id):
+    cache.delete(MAX_RADIUS_CACHE_KEY)
+    if _index is not None:
+        _index.remove(restaurant_id)
+
+
+def max_delivery_radius():
+    """Largest delivery radius of any active restaurant, cached until one is saved"""
+    from .models import Restaurant
+
+    radius = cache.get(MAX_RADIUS_CACHE_KEY)
+    if radius is None:
+        radius = Restaurant.objects.filter(status='active').aggregate(
+            radius=Max('delivery_radius_km')
+        )['radius'] or 0.0
+        cache.set(MAX_RADIUS_CACHE_KEY, radius, None)
+    return radius
+
+
+def filter_by_location(queryset, lat, lng, radius_km=None, delivering=False):
+    """
+    Restrict ``queryset`` to restaurants within ``radius_km`` of the point
+    and/or (with ``delivering``) whose delivery radius covers it.
+    """
+    if radius_km is not None:
+        radius_km = min(float(radius_km), MAX_DELIVERY_RADIUS_KM)
+
+    if getattr(settings, 'GEO_INDEX', 'memory') == 'memory':
+        index = get_delivery_index()
+        if delivering:
+            matches = index.delivering_to(lat, lng)
+            if radius_km is not None:
+                matches = {pk: distance for pk, distance in matches.items() if distance <= radius_km}
+        else:
+            matches = index.within(lat, lng, radius_km if radius_km is not None else MAX_DELIVERY_RADIUS_KM)
+        if len(matches) <= MAX_ID_FILTER:
+            return queryset.filter(pk__in=list(matches))
+
+    if radius_km is not None:
+        search_radius = radius_km
+    elif delivering:
+        search_radius = max_delivery_radius()
+    else:
+        search_radius = MAX_DELIVERY_RADIUS_KM
+    # Cheap bounding-box comparisons first, the trigonometry only for what is left
+    lat_span = math.degrees(search_radius / EARTH_RADIUS_KM)
+    lng_span = lat_span / max(math.cos(math.radians(min(abs(lat) + lat_span, 89.9))), 1e-6)
+    queryset = queryset.filter(
+        geohash_filter(lat, lng, search_radius),
+        latitude__range=(lat - lat_span, lat + lat_span),
+        longitude__range=(lng - lng_span, lng + lng_span),
+    ).alias(distance_km=distance_expression(lat, lng)).filter(distance_km__lte=search_radius)
+    if delivering:
+        queryset = queryset.filter(is_delivery_available=True, distance_km__lte=F('delivery_radius_km'))
+    return queryset
+
+
+# Offline geocoding
+
+def load_gazetteer(path=None):
+    """``{normalized place name: (lat, lng)}`` from a tab-separated file"""
+    path = path or getattr(settings, 'GEO_GAZETTEER', None) or DEFAULT_GAZETTEER
+    places = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            if not line.strip() or line.startswith('#'):
+                continue
+            name, lat, lng = line.rstrip('\n').split('\t')[:3]
+            places[normalize(name)] = (float(lat), float(lng))
+    return places
+
+
+@functools.lru_cache(maxsize=4)
+def get_gazetteer(path=None):
+    """``load_gazetteer`` cached per process, for geocoding search input"""
+    return load_gazetteer(path)
+
+
+def geocode(text, gazetteer, max_words=4):
+    """
+    Coordinates of the most specific gazetteer place named in ``text``:
+    the longest matching run of words, the last one on a tie (addresses
+    usually end with the area and city). ``None`` if nothing matches.
+    """
+    words = normalize(text).split()
+    for length in range(min(max_words, len(words)), 0, -1):
+        for start in range(len(words) - length, -1, -1):
+            place = gazetteer.get(' '.join(words[start:start + length]))
+            if place is not None:
+                return place
+    return None
@@ -0,0 +1,121 @@
+"""
+"Open now" / "open at" lookups backed by ``RestaurantOpenSlot``.
+
+Opening hours are wall-clock times in ``settings.TIME_ZONE`` and repeat
+every day. They are stored as one row per hour of the day the restaurant is
+open, holding the minutes it is open within that hour, so overnight hours
+(22:00-02:00) are simply the hours 22, 23, 0 and 1. "Open at minute m" is
+then ``hour = m // 60 AND start_minute <= m < end_minute``, answered from
+``openslot_lookup_idx`` when few restaurants are open or probed per listed
+row through ``openslot_restaurant_idx`` when most are.
+
+Slots are rebuilt from the ``Restaurant`` signals when the hours change;
+after ``bulk_create``/``update`` run ``manage.py rebuild_opening_hours``.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from .models import Restaurant, RestaurantOpenSlot
+
+MINUTES_PER_DAY = 24 * 60
+# Above this share of restaurants open in the hour, probe per row (see filter_open_at)
+PROBE_THRESHOLD = 0.05
+OPEN_SHARE_CACHE_KEY = 'restaurant:open-share-by-hour'
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def open_intervals(opening_time, closing_time):
+    """
+    ``[(start, end)]`` minutes of the day, end exclusive. Equal opening and
+    closing times mean open around the clock; a closing time at or before
+    the opening time runs past midnight.
+    """
+    start, end = minute_of_day(opening_time), minute_of_day(closing_time)
+    if start == end:
+        return [(0, MINUTES_PER_DAY)]
+    if start < end:
+        return [(start, end)]
+    intervals = [(start, MINUTES_PER_DAY)]
+    if end:
+        intervals.insert(0, (0, end))
+    return intervals
+
+
+def open_slots(opening_time, closing_time):
+    """``(hour, start_minute, end_minute)`` for each hour the interval touches"""
+    slots = []
+    for start, end in open_intervals(opening_time, closing_time):
+        for hour in range(start // 60, (end - 1) // 60 + 1):
+            slots.append((hour, max(start, hour * 60), min(end, hour * 60 + 60)))
+    return slots
+
+
+def is_open_at(opening_time, closing_time, at):
+    minute = minute_of_day(at)
+    return any(start <= minute < end for start, end in open_intervals(opening_time, closing_time))
+
+
+def rebuild_open_slots(restaurant_ids=None, batch_size=2000):
+    """Recreate the slots of ``restaurant_ids`` (all restaurants by default); returns the row count"""
+    restaurants = Restaurant.objects.order_by('pk').values_list('pk', 'opening_time', 'closing_time')
+    slots = RestaurantOpenSlot.objects.all()
+    if restaurant_ids is not None:
+        restaurants = restaurants.filter(pk__in=restaurant_ids)
+        slots = slots.filter(restaurant_id__in=restaurant_ids)
+
+    count = 0
+    with transaction.atomic():
+        slots.delete()
+        batch = []
+        for pk, opening_time, closing_time in restaurants.iterator(chunk_size=batch_size):
+            batch.extend(
+                RestaurantOpenSlot(restaurant_id=pk, hour=hour, start_minute=start, end_minute=end)
+                for hour, start, end in open_slots(opening_time, closing_time)
+            )
+            if len(batch) >= batch_size:
+                RestaurantOpenSlot.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            RestaurantOpenSlot.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def open_share_by_hour():
+    """
+    Fraction of restaurants open at some point in each hour of the day.
+    Only steers the query plan, so it is cached for an hour rather than
+    kept exact.
+    """
+    shares = cache.get(OPEN_SHARE_CACHE_KEY)
+    if shares is None:
+        total = Restaurant.objects.count() or 1
+        counts = dict(
+            RestaurantOpenSlot.objects.order_by().values_list('hour')
+            .annotate(open=Count('restaurant', distinct=True))
+        )
+        shares = [counts.get(hour, 0) / total for hour in range(24)]
+        cache.set(OPEN_SHARE_CACHE_KEY, shares, 60 * 60)
+    return shares
+
+
+def filter_open_at(queryset, at=None):
+    """Restaurants in ``queryset`` open at wall-clock time ``at`` (default: now)"""
+    if at is None:
+        at = timezone.localtime().time()
+    minute = minute_of_day(at)
+    slots = RestaurantOpenSlot.objects.filter(
+        hour=minute // 60, start_minute__lte=minute, end_minute__gt=minute,
+    )
+    if open_share_by_hour()[minute // 60] >= PROBE_THRESHOLD:
+        # Most restaurants are open: walk the listing order and probe each
+        # row, which stops as soon as a page is filled
+        return queryset.filter(Exists(slots.filter(restaurant=OuterRef('pk'))))
+    # Few are open: read that set once and look the restaurants up by pk
+    return queryset.filter(pk__in=slots.values('restaurant_id'))
@@ -0,0 +1,255 @@
+"""
+Thumbnails and responsive variants for uploaded images.
+
+Uploads (``Restaurant.image``, ``Restaurant.logo``, ``MenuItem.image``) are
+kept as they are, and a background worker renders fixed-size variants of
+each one: every size in ``VARIANTS`` used by that field, at 1x and 2x, as
+WebP and as a JPEG fallback. Files are named after the SHA-256 of the
+source, so re-processing an unchanged upload writes nothing, identical
+uploads share their variants, and the URLs never change meaning (they can
+be served with a far-future ``Cache-Control``).
+
+The result is recorded in the model's ``image_variants`` JSON field, keyed
+by image field and tagged with the source name it was made from;
+``{% responsive_image %}`` only uses an entry whose source matches the
+current upload and falls back to the original otherwise.
+
+Saves schedule work from the model signals once the transaction commits.
+With ``IMAGE_PIPELINE_WORKER = 'thread'`` a daemon thread in the web
+process renders them; with ``'command'`` they are left to
+``manage.py process_images``, which also backfills anything the thread
+missed (a restart, or rows written with ``update()``/``bulk_create``).
+"""
+import hashlib
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .listing import touch_update
+from .models import MenuItem, Restaurant
+from .storage import blob_digest
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height, ``sizes`` attribute); the CSS box each one fills
+VARIANTS = {
+    # w-12 h-12 logos and dashboard thumbnails
+    'avatar': (48, 48, '48px'),
+    # h-48 cards: one column on phones, up to three from lg
+    'card': (400, 192, '(min-width: 1024px) 400px, (min-width: 768px) 50vw, 100vw'),
+}
+SCALES = (1, 2)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+IMAGE_FIELDS = {
+    Restaurant: {'image': ('card',), 'logo': ('avatar',)},
+    MenuItem: {'image': ('card', 'avatar')},
+}
+VARIANT_DIR = 'variants'
+ORIENTATION_TAG = 0x0112
+# EXIF orientations that swap width and height
+ROTATED = (5, 6, 7, 8)
+BATCH_SIZE = 200
+POLL_INTERVAL = 60
+
+
+def file_digest(name, storage=default_storage):
+    # Content-addressed uploads carry their hash in the name
+    known = blob_digest(name)
+    if known:
+        return known
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_name(digest, variant, width, height, format):
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest[:32]}-{variant}-{width}x{height}.{format}'
+
+
+def load_source(name, targets, storage=default_storage):
+    """
+    Decode ``name`` upright, shrunk by an integer factor while it stays at
+    least twice as large as the biggest of ``targets``; cutting a 4000px
+    photo down before resampling is most of the saving.
+    """
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        # JPEGs can be decoded straight at a lower resolution
+        image.draft('RGB', (max(w for w, h in targets) * 2, max(h for w, h in targets) * 2))
+        image = ImageOps.exif_transpose(image)
+    scale = max(max(w / image.width, h / image.height) for w, h in targets)
+    factor = int(1 / (2 * scale))
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def encode(image, format):
+    pil_format, options = FORMATS[format]
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if format == 'jpeg' and has_alpha:
+        # Flatten transparent logos onto white
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif format == 'webp' and has_alpha:
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    output = ContentFile(b'')
+    image.save(output, pil_format, **options)
+    return output
+
+
+def generate_variants(name, variants, source_storage=default_storage, storage=default_storage):
+    """
+    Render ``variants`` of the image ``name`` in ``source_storage`` into
+    ``storage`` and return the ``image_variants`` entry describing them.
+    Sizes the source is too small to fill at 2x are only made at 1x.
+    """
+    digest = file_digest(name, source_storage)
+    with source_storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        original_size = original.size
+        if original.getexif().get(ORIENTATION_TAG) in ROTATED:
+            original_size = original_size[::-1]
+    targets = [
+        (variant, VARIANTS[variant][0] * scale, VARIANTS[variant][1] * scale)
+        for variant in variants for scale in SCALES
+        if scale == 1 or (VARIANTS[variant][0] * scale <= original_size[0]
+                          and VARIANTS[variant][1] * scale <= original_size[1])
+    ]
+    entry = {'source': name, 'digest': digest, 'width': original_size[0], 'height': original_size[1], 'variants': {}}
+    image = None
+    for variant, width, height in targets:
+        files = entry['variants'].setdefault(variant, {format: [] for format in FORMATS})
+        for format in FORMATS:
+            target = variant_name(digest, variant, width, height, format)
+            if not storage.exists(target):
+                if image is None:
+                    image = load_source(name, [(w, h) for v, w, h in targets], source_storage)
+                fitted = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                # Two workers racing on the same upload get a suffixed copy, not a clash
+                target = storage.save(target, encode(fitted, format))
+            files[format].append([width, target])
+    return entry
+
+
+def is_stale(name, entry):
+    """Whether the ``image_variants`` entry does not describe the upload ``name``"""
+    if not name:
+        return entry is not None
+    return entry is None or entry.get('source') != name
+
+
+def needs_variants(instance, field_name):
+    return is_stale(getattr(instance, field_name).name, (instance.image_variants or {}).get(field_name))
+
+
+def process_image(model, pk, field_name):
+    """
+    Bring one image field's variants up to date; returns ``True`` if the
+    record changed. A newer upload that lands while rendering wins: the
+    result is only stored if the field still holds the same file.
+    """
+    row = model.objects.filter(pk=pk).values_list(field_name, 'image_variants').first()
+    if row is None:
+        return False
+    name, stored = row
+    if not is_stale(name, (stored or {}).get(field_name)):
+        return False
+    entry = None
+    if name:
+        try:
+            source_storage = model._meta.get_field(field_name).storage
+            entry = generate_variants(name, IMAGE_FIELDS[model][field_name], source_storage)
+        except (OSError, Image.DecompressionBombError) as e:
+            # Missing or unreadable upload: leave it to the original <img>
+            logger.warning(f"Could not render variants of {name}: {str(e)}")
+            return False
+
+    with transaction.atomic():
+        same_file = Q(**{field_name: name}) if name else Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+        row = model.objects.select_for_update().filter(same_file, pk=pk).values_list('image_variants').first()
+        if row is None:
+            return False
+        current = dict(row[0] or {})
+        if entry is None:
+            current.pop(field_name, None)
+        else:
+            current[field_name] = entry
+        touch_update(model.objects.filter(pk=pk), image_variants=current)
+    return True
+
+
+def pending_images(batch_size=BATCH_SIZE):
+    """``(model, pk, field_name)`` for every image whose variants are missing or stale"""
+    for model, fields in IMAGE_FIELDS.items():
+        columns = ['pk', 'image_variants', *fields]
+        for row in model.objects.order_by('pk').values_list(*columns).iterator(chunk_size=batch_size):
+            pk, stored = row[0], row[1] or {}
+            for field_name, name in zip(fields, row[2:]):
+                if is_stale(name, stored.get(field_name)):
+                    yield model, pk, field_name
+
+
+def process_pending(batch_size=BATCH_SIZE):
+    """Render everything that is out of date; returns how many records changed"""
+    changed = 0
+    for job in list(pending_images(batch_size)):
+        changed += process_image(*job)
+    return changed
+
+
+class ImageWorker(threading.Thread):
+    """Daemon thread that renders variants for the uploads queued to it"""
+
+    def __init__(self):
+        super().__init__(name='image-variants', daemon=True)
+        self.jobs = queue.Queue()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                process_image(*job)
+            except Exception:
+                logger.exception("Image variant worker failed")
+            finally:
+                close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(model, pk, field_name):
+    if getattr(settings, 'IMAGE_PIPELINE_WORKER', 'thread') != 'thread':
+        return
+    global _worker
+    with _worker_lock:
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if _worker is None or not _worker.is_alive():
+            _worker = ImageWorker()
+            _worker.start()
+    _worker.jobs.put((model, pk, field_name))
+
+
+def schedule(instance):
+    """Queue the image fields of a just-saved ``instance`` whose variants are out of date"""
+    model = type(instance)
+    for field_name in IMAGE_FIELDS[model]:
+        if needs_variants(instance, field_name):
+            transaction.on_commit(lambda field_name=field_name: enqueue(model, instance.pk, field_name))
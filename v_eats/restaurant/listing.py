@@ -0,0 +1,126 @@
+"""
+The public restaurant listing's filters and orderings.
+
+Shared by ``RestaurantListView`` and the read API so both accept the same
+query parameters (``search``, ``category``, ``vegetarian``, ``vegan``,
+``max_price``, ``open_now``/``open_at``, ``lat``/``lng`` or ``near`` with
+``radius`` and ``delivers``, and ``sort``) and return the same rows.
+
+The cards of both listing templates are cached per ``updated_at``; writes
+that bypass ``save()`` go through ``touch_update`` so they show up.
+"""
+import datetime
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+from django.utils import timezone
+
+from .geo import filter_by_location, geocode, get_gazetteer
+from .hours import filter_open_at
+from .search import search_restaurants
+
+DEFAULT_ORDERING = ('-rating', '-created_at', '-id')
+
+# Sort options read from the denormalized menu summary, so no MenuItem joins
+SORT_ORDERINGS = {
+    'price': (F('menu_summary__min_price').asc(nulls_last=True), '-rating', '-created_at'),
+    'prep_time': (F('menu_summary__avg_preparation_time').asc(nulls_last=True), '-rating', '-created_at'),
+}
+
+
+def touch_update(queryset, **fields):
+    """``queryset.update(**fields)`` that also moves ``updated_at``"""
+    # update() skips auto_now, and the cached listing cards key on updated_at
+    return queryset.update(updated_at=timezone.now(), **fields)
+
+
+def parse_location(params):
+    """``(lat, lng)`` from the ``lat``/``lng`` or ``near`` parameters, or None"""
+    try:
+        lat, lng = float(params['lat']), float(params['lng'])
+    except (KeyError, ValueError):
+        pass
+    else:
+        # Out of range or non-finite coordinates fall through to ``near``
+        if math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+    near = params.get('near', '').strip()
+    if near:
+        return geocode(near, get_gazetteer())
+    return None
+
+
+def parse_open_at(params):
+    """The ``open_at`` time (HH:MM, local), or None"""
+    try:
+        return datetime.datetime.strptime(params.get('open_at', ''), '%H:%M').time()
+    except ValueError:
+        return None
+
+
+def parse_radius(params):
+    try:
+        radius = float(params.get('radius', ''))
+    except ValueError:
+        return None
+    return radius if radius > 0 else None
+
+
+def parse_max_price(params):
+    try:
+        max_price = Decimal(params.get('max_price', ''))
+    except InvalidOperation:
+        return None
+    # Decimal() also accepts NaN and Infinity, which the database rejects
+    return max_price if max_price.is_finite() else None
+
+
+def filter_restaurants(queryset, params):
+    """Apply the listing parameters in ``params`` to ``queryset`` and order it"""
+    search_query = params.get('search', '')
+    category_filter = params.get('category', '')
+    sort = params.get('sort', '')
+
+    if category_filter:
+        queryset = queryset.filter(category=category_filter)
+
+    if params.get('vegetarian'):
+        queryset = queryset.filter(menu_summary__vegetarian_count__gt=0)
+
+    if params.get('vegan'):
+        queryset = queryset.filter(menu_summary__vegan_count__gt=0)
+
+    max_price = parse_max_price(params)
+    if max_price is not None:
+        queryset = queryset.filter(menu_summary__min_price__lte=max_price)
+
+    open_at = parse_open_at(params)
+    if open_at is not None:
+        queryset = filter_open_at(queryset, open_at)
+    elif params.get('open_now'):
+        queryset = filter_open_at(queryset)
+
+    location = parse_location(params)
+    if location is not None:
+        queryset = filter_by_location(
+            queryset, *location,
+            radius_km=parse_radius(params),
+            delivering=bool(params.get('delivers')),
+        )
+
+    if sort in SORT_ORDERINGS:
+        if search_query:
+            queryset = search_restaurants(queryset, search_query)
+        return queryset.order_by(*SORT_ORDERINGS[sort])
+
+    if search_query:
+        # Ranked by relevance, then by the default ordering
+        return search_restaurants(queryset, search_query)
+
+    return queryset.order_by(*DEFAULT_ORDERING)
+
+
+def uses_default_ordering(queryset):
+    """Whether keyset pagination applies; relevance and summary sorts keep offsets"""
+    return tuple(queryset.query.order_by) == DEFAULT_ORDERING
@@ -0,0 +1,216 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from restaurant.benchmarks import benchmark_database, format_summary, make_rng, seed_catalogue, summarize_latencies
+from restaurant.hours import rebuild_open_slots
+from restaurant.models import MenuItem, Restaurant
+from restaurant.summary import rebuild_all_summaries
+
+HOST = 'localhost'
+
+
+class SlowDatabase:
+    """``execute_wrapper`` hook adding a fixed network round trip to every query"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        # Innermost, under the request metrics' wrapper (a stack popped from the end)
+        connection.execute_wrappers.insert(0, self)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare sync workers (WSGI, one request at a time each, like gunicorn sync '
+        'workers) with one ASGI event loop serving the async views, under many '
+        'concurrent requests to the browsing views and a database with added latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+        parser.add_argument('--workers', type=int, default=8, help='Sync workers')
+        parser.add_argument('--io-latency-ms', type=float, default=20.0, help='Added to every SQL query')
+        parser.add_argument('--restaurants', type=int, default=500)
+        parser.add_argument('--menu-items', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'both':
+            # ASYNC_VIEWS picks the URL routes at import time, so each mode runs in its own process
+            for mode in ('sync', 'async'):
+                self.run_child(mode, options)
+            return
+        if settings.ASYNC_VIEWS != (options['mode'] == 'async'):
+            raise CommandError(f'--mode {options["mode"]} needs ASYNC_VIEWS={options["mode"] == "async"}')
+
+        rng = make_rng(options['seed'])
+        with benchmark_database():
+            self.stdout.write(f'Seeding ({options["mode"]})...')
+            seed_catalogue(options['restaurants'], options['menu_items'], rng)
+            Restaurant.objects.update(status='active')
+            rebuild_all_summaries()
+            rebuild_open_slots()
+            paths = self.build_paths(rng, options['requests'])
+
+            slow = SlowDatabase(options['io_latency_ms'] / 1000)
+            connection_created.connect(slow.install)
+            slow.install(None, connection)
+            try:
+                if options['mode'] == 'sync':
+                    samples, failures, elapsed = self.run_sync(paths, options['workers'])
+                    label = f'sync x{options["workers"]} workers'
+                else:
+                    samples, failures, elapsed = asyncio.run(self.run_async(paths, options['concurrency']))
+                    label = f'async x{options["concurrency"]} in flight'
+            finally:
+                connection_created.disconnect(slow.install)
+                connection.execute_wrappers.remove(slow)
+
+        if failures:
+            raise CommandError(f'{len(failures)} requests failed, e.g. {failures[0]}')
+        self.stdout.write(format_summary(label, summarize_latencies(samples)))
+        self.stdout.write(
+            f'  {len(samples)} requests in {elapsed:.2f}s ({len(samples) / elapsed:.0f}/s), '
+            f'{options["io_latency_ms"]}ms per query'
+        )
+
+    def run_child(self, mode, options):
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_asgi', '--mode', mode,
+            *(f'--{name.replace("_", "-")}={options[name]}' for name in (
+                'requests', 'concurrency', 'workers', 'io_latency_ms', 'restaurants', 'menu_items', 'seed',
+            )),
+        ]
+        env = {**os.environ, 'ASYNC_VIEWS': str(mode == 'async')}
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.stdout.write(result.stdout.rstrip())
+        if result.returncode:
+            raise CommandError(f'{mode} run failed:\n{result.stderr}')
+
+    def build_paths(self, rng, count):
+        """A browsing mix: listing pages, restaurant details, menus and stored menus"""
+        restaurant_ids = list(Restaurant.objects.values_list('pk', flat=True))
+        item_ids = list(MenuItem.objects.filter(is_available=True).values_list('pk', flat=True))
+        categories = [value for value, label in Restaurant.CATEGORY_CHOICES]
+        paths = []
+        for number in range(count):
+            pk = rng.choice(restaurant_ids)
+            kind = number % 5
+            if kind == 0:
+                paths.append(f"{reverse('restaurant:list')}?category={rng.choice(categories)}")
+            elif kind == 1:
+                paths.append(reverse('api:restaurant_detail', kwargs={'version': 'v1', 'pk': pk}))
+            elif kind == 2:
+                paths.append(reverse('api:restaurant_menu', kwargs={'version': 'v1', 'pk': pk}))
+            elif kind == 3:
+                paths.append(reverse('api:restaurant_menu_snapshot', kwargs={'version': 'v1', 'pk': pk}))
+            else:
+                paths.append(reverse('api:menu_item_detail', kwargs={'version': 'v1', 'pk': rng.choice(item_ids)}))
+        return paths
+
+    def run_sync(self, paths, workers):
+        application = get_wsgi_application()
+        jobs = iter(paths)
+        lock = threading.Lock()
+        samples = []
+        failures = []
+
+        def worker():
+            while True:
+                with lock:
+                    path = next(jobs, None)
+                if path is None:
+                    return
+                started = time.perf_counter()
+                status = self.call_wsgi(application, path)
+                with lock:
+                    samples.append(time.perf_counter() - started)
+                    if status != 200:
+                        failures.append(f'{path}: {status}')
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, failures, time.perf_counter() - started
+
+    def call_wsgi(self, application, path):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+        }
+        statuses = []
+        body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        return int(statuses[0].split()[0])
+
+    async def run_async(self, paths, concurrency):
+        application = get_asgi_application()
+        jobs = iter(paths)
+        samples = []
+        failures = []
+
+        async def client():
+            for path in jobs:
+                started = time.perf_counter()
+                status = await self.call_asgi(application, path)
+                samples.append(time.perf_counter() - started)
+                if status != 200:
+                    failures.append(f'{path}: {status}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return samples, failures, time.perf_counter() - started
+
+    async def call_asgi(self, application, path):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', HOST.encode())], 'server': (HOST, 80), 'client': ('127.0.0.1', 0),
+        }
+        request_sent = False
+        statuses = []
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                # The client never disconnects; Django cancels this wait when it is done
+                await asyncio.Future()
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await application(scope, receive, send)
+        return statuses[0]
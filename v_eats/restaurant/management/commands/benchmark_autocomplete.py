@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from restaurant.autocomplete import MENU_ITEM, RESTAURANT, AutocompleteIndex
+from restaurant.benchmarks import format_summary, make_rng, random_name, summarize_latencies
+
+
+class Command(BaseCommand):
+    help = 'Measure autocomplete lookup latency on a synthetic in-memory index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = make_rng(options['seed'])
+        entries = options['entries']
+        restaurants = max(1, entries // 20)
+
+        rows = []
+        for pk in range(1, restaurants + 1):
+            rows.append((RESTAURANT, pk, random_name(rng), rng.uniform(0, 5), None))
+        for pk in range(1, entries - restaurants + 1):
+            rows.append((MENU_ITEM, pk, random_name(rng), 0.0, rng.randint(1, restaurants)))
+
+        index = AutocompleteIndex()
+        started = time.perf_counter()
+        index.extend(rows)
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(f'Built index with {len(index)} entries in {build_seconds:.2f}s')
+
+        # Mix of short prefixes, longer prefixes, multi-word prefixes and typos
+        queries = []
+        for _ in range(options['queries']):
+            name = random_name(rng).lower()
+            kind = rng.random()
+            if kind < 0.3:
+                queries.append(name[:rng.randint(1, 3)])
+            elif kind < 0.7:
+                queries.append(name[:rng.randint(4, 10)])
+            elif kind < 0.9:
+                queries.append(name[:rng.randint(11, len(name))])
+            else:
+                word = name.split(' ')[0]
+                position = rng.randrange(len(word))
+                queries.append(word[:position] + word[position + 1:] + word[position:position + 1])
+
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, options['limit'])
+            samples.append(time.perf_counter() - started)
+
+        self.stdout.write(format_summary('autocomplete.search', summarize_latencies(samples)))
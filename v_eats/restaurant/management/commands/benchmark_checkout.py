@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from restaurant.benchmarks import benchmark_database, format_summary, make_rng, seed_catalogue, summarize_latencies
+from restaurant.checkout import CheckoutError, place_order
+from restaurant.models import MenuItem, Order, OrderItem, Restaurant
+
+MINIMUM_ORDER = Decimal('5.00')
+
+
+def naive_checkout(customer, restaurant_id, lines):
+    """
+    The usual first version, for comparison: lock the restaurant, then read
+    and insert item by item, all inside the transaction.
+    """
+    with transaction.atomic():
+        restaurant = Restaurant.objects.select_for_update().get(pk=restaurant_id)
+        order = Order.objects.create(customer=customer, restaurant=restaurant, subtotal=0, total=0)
+        subtotal = Decimal('0.00')
+        item_count = 0
+        for item_id, quantity in lines:
+            item = MenuItem.objects.get(pk=item_id, restaurant=restaurant)
+            if not item.is_available:
+                raise CheckoutError([f'"{item.name}" is not available right now.'], [item_id])
+            OrderItem.objects.create(
+                order=order, menu_item=item, name=item.name, unit_price=item.price, quantity=quantity,
+                line_total=item.price * quantity,
+            )
+            subtotal += item.price * quantity
+            item_count += quantity
+        if subtotal < restaurant.minimum_order:
+            raise CheckoutError(['Below the minimum order.'])
+        order.subtotal = subtotal
+        order.item_count = item_count
+        order.delivery_fee = restaurant.delivery_fee
+        order.total = subtotal + restaurant.delivery_fee
+        order.save()
+    return order
+
+
+STRATEGIES = {'bulk': place_order, 'naive': naive_checkout}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with one popular restaurant and run many '
+        'checkouts against it from parallel threads, comparing the bulk '
+        'checkout service with a lock-and-loop implementation.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=400)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--menu-items', type=int, default=80)
+        parser.add_argument('--max-lines', type=int, default=6, help='Most distinct items in one cart')
+        parser.add_argument('--strategy', choices=['bulk', 'naive', 'both'], default='both')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = make_rng(options['seed'])
+        strategies = ['bulk', 'naive'] if options['strategy'] == 'both' else [options['strategy']]
+        with benchmark_database():
+            self.stdout.write('Seeding...')
+            _, (restaurant_id,) = seed_catalogue(1, options['menu_items'], rng)
+            Restaurant.objects.update(
+                status='active', minimum_order=MINIMUM_ORDER, is_delivery_available=True, delivery_fee=Decimal('2.50'),
+            )
+            item_ids = list(MenuItem.objects.filter(is_available=True).values_list('pk', flat=True))
+            customers = User.objects.bulk_create(
+                [User(username=f'customer{n}', password='!') for n in range(options['threads'])]
+            )
+            carts = [
+                [(item_id, rng.randint(1, 3)) for item_id in rng.sample(item_ids, rng.randint(1, options['max_lines']))]
+                for _ in range(options['checkouts'])
+            ]
+
+            for name in strategies:
+                checkout = STRATEGIES[name]
+                with CaptureQueriesContext(connection) as queries:
+                    checkout(customers[0], restaurant_id, carts[0])
+                Order.objects.all().delete()
+
+                samples, conflicts, rejected, elapsed = self.run_concurrently(
+                    checkout, restaurant_id, customers, carts, options['threads'])
+                placed = Order.objects.count()
+                if placed != len(carts) - rejected:
+                    raise CommandError(f'{name}: {placed} orders stored for {len(carts) - rejected} checkouts')
+                self.stdout.write(format_summary(f'checkout ({name})', summarize_latencies(samples)))
+                self.stdout.write(
+                    f'  {placed} orders in {elapsed:.2f}s ({placed / elapsed:.0f}/s) from {options["threads"]} threads, '
+                    f'{len(queries)} queries per checkout, {conflicts} lock conflicts retried, {rejected} rejected'
+                )
+                Order.objects.all().delete()
+
+    def run_concurrently(self, checkout, restaurant_id, customers, carts, threads):
+        jobs = queue.SimpleQueue()
+        for number, cart in enumerate(carts):
+            jobs.put((customers[number % len(customers)], cart))
+        samples = []
+        counters = {'conflicts': 0, 'rejected': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + 1)
+
+        def worker():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        customer, cart = jobs.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    conflicts = rejected = 0
+                    while True:
+                        try:
+                            checkout(customer, restaurant_id, cart)
+                            break
+                        except CheckoutError:
+                            rejected = 1
+                            break
+                        except OperationalError as e:
+                            # SQLite reports a busy table instead of waiting for the writer
+                            if 'locked' not in str(e):
+                                raise
+                            conflicts += 1
+                            time.sleep(0.0005)
+                    with lock:
+                        samples.append(time.perf_counter() - started)
+                        counters['conflicts'] += conflicts
+                        counters['rejected'] += rejected
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise CommandError(f'Checkout failed: {errors[0]!r}')
+        return samples, counters['conflicts'], counters['rejected'], elapsed
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from restaurant.benchmarks import (
+    benchmark_database, format_summary, make_rng, seed_catalogue, summarize_latencies, time_callable,
+)
+from restaurant.geo import build_index, filter_by_location, haversine_km, reset_delivery_index
+from restaurant.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and compare "delivers to this point" lookups: '
+        'a full scan, the geohash index in SQL and the in-memory KD-tree.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=100000)
+        parser.add_argument('--points', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = make_rng(options['seed'])
+        with benchmark_database():
+            self.stdout.write('Seeding...')
+            seed_catalogue(options['restaurants'], 0, rng, stdout=self.stdout)
+            active = Restaurant.objects.filter(status='active')
+            points = [(rng.uniform(6.40, 6.70), rng.uniform(3.10, 3.70)) for _ in range(options['points'])]
+            rows = list(active.values_list('pk', 'latitude', 'longitude', 'delivery_radius_km'))
+
+            def full_scan(lat, lng):
+                return {
+                    pk for pk, row_lat, row_lng, radius in rows
+                    if haversine_km(lat, lng, row_lat, row_lng) <= radius
+                }
+
+            def database(lat, lng):
+                with override_settings(GEO_INDEX='database'):
+                    return set(filter_by_location(active, lat, lng, delivering=True).values_list('pk', flat=True))
+
+            started = time.perf_counter()
+            index = build_index()
+            self.stdout.write(f'Built KD-tree over {len(index)} restaurants in {time.perf_counter() - started:.2f}s')
+
+            def memory(lat, lng):
+                return set(index.delivering_to(lat, lng))
+
+            reset_delivery_index()
+            for lat, lng in points[:20]:
+                expected = full_scan(lat, lng)
+                if database(lat, lng) != expected or memory(lat, lng) != expected:
+                    raise CommandError(f'Index results differ from a full scan at ({lat}, {lng})')
+
+            for name, lookup in (('full_scan', full_scan), ('geohash_sql', database), ('kd_tree', memory)):
+                queue = iter(points)
+                samples = time_callable(lambda: lookup(*next(queue)), len(points))
+                self.stdout.write(format_summary(name, summarize_latencies(samples)))
@@ -0,0 +1,113 @@
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from restaurant.benchmarks import (
+    benchmark_database, format_summary, make_rng, seed_catalogue, summarize_latencies, time_callable,
+)
+from restaurant.hours import filter_open_at, rebuild_open_slots
+from restaurant.models import MenuItem, Restaurant, RestaurantOpenSlot
+from restaurant.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and compare EXPLAIN plans and latencies of the '
+        'hot listing queries with and without the composite indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=100000)
+        parser.add_argument('--menu-items', type=int, default=2000000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        rng = make_rng(options['seed'])
+        with benchmark_database():
+            started = time.perf_counter()
+            self.stdout.write('Seeding...')
+            seed_catalogue(options['restaurants'], options['menu_items'], rng, stdout=self.stdout)
+            rebuild_open_slots()
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+            self.analyze()
+
+            queries = self.build_queries(rng)
+            indexes = [
+                (model, index)
+                for model in (Restaurant, MenuItem, RestaurantOpenSlot)
+                for index in model._meta.indexes
+            ]
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            self.analyze()
+            before = self.run_queries(queries, options['repeat'], 'without indexes')
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            self.analyze()
+            after = self.run_queries(queries, options['repeat'], 'with indexes')
+
+        results = {
+            'vendor': connection.vendor,
+            'restaurants': options['restaurants'],
+            'menu_items': options['menu_items'],
+            'before': before,
+            'after': after,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def analyze(self):
+        # Refresh planner statistics so index choices reflect the seeded data
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def build_queries(self, rng):
+        active = Restaurant.objects.filter(status='active')
+        ranked = active.order_by('-rating', '-created_at', '-id')
+        restaurant_id = Restaurant.objects.order_by('?').values_list('pk', flat=True).first()
+        category = rng.choice(Restaurant.CATEGORY_CHOICES)[0]
+        item_category = rng.choice(MenuItem.CATEGORY_CHOICES)[0]
+
+        # A cursor deep into the listing, as the keyset paginator would issue it
+        paginator = CursorPaginator(active, 12, ('-rating', '-created_at', '-id'))
+        middle = ranked[ranked.count() // 2]
+        deep_filter = paginator.keyset_filter(
+            [middle.rating, middle.created_at, middle.pk], forward=True
+        )
+
+        menu = MenuItem.objects.filter(restaurant_id=restaurant_id)
+        return {
+            'restaurant_list': ranked[:13],
+            'restaurant_list_category': active.filter(category=category).order_by(
+                '-rating', '-created_at', '-id')[:13],
+            'restaurant_list_deep_cursor': ranked.filter(deep_filter)[:13],
+            'restaurant_list_open_at': filter_open_at(ranked, datetime.time(23, 30))[:13],
+            'manage_menu': menu.order_by('category', 'name', 'id')[:13],
+            'manage_menu_category': menu.filter(category=item_category).order_by('category', 'name', 'id')[:13],
+            'available_menu': menu.filter(is_available=True).order_by('category', 'name'),
+            'dashboard_recent_items': menu.order_by('-created_at')[:5],
+        }
+
+    def run_queries(self, queries, repeat, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label}'))
+        results = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            samples = time_callable(lambda: list(queryset.all()), repeat)
+            summary = summarize_latencies(samples)
+            results[name] = {'plan': plan, **summary}
+            self.stdout.write(format_summary(name, summary))
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        return results
@@ -0,0 +1,198 @@
+import json
+import platform
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from restaurant.benchmarks import (
+    benchmark_database, compare_results, format_summary, make_rng, random_name, seed_catalogue,
+    summarize_latencies,
+)
+from restaurant.hours import rebuild_open_slots
+from restaurant.models import MenuItem, Restaurant
+from restaurant.search import IndexedSearchBackend, get_search_backend
+from restaurant.summary import rebuild_all_summaries
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and drive the core views through the test client, '
+        'reporting latency percentiles, throughput and query counts per view.'
+    )
+
+    scenario_names = (
+        'restaurant_list', 'restaurant_list_filtered', 'restaurant_list_search', 'restaurant_list_open_now',
+        'restaurant_dashboard',
+        'manage_menu', 'add_menu_item_form', 'add_menu_item_submit', 'register_form', 'register_submit',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=5000)
+        parser.add_argument('--menu-items', type=int, default=100000)
+        parser.add_argument('--menu-size', type=int, default=300,
+                            help='Menu items on the restaurant used for the owner views.')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--views', nargs='+', metavar='SCENARIO',
+                            help=f"Only run these scenarios: {', '.join(self.scenario_names)}.")
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against results saved with --output.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 slowdown against the baseline, as a fraction.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['views'] or ()) - set(self.scenario_names)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        rng = make_rng(options['seed'])
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+
+        setup_test_environment()
+        try:
+            # Registration emails stay in the outbox instead of starting a sender thread
+            with benchmark_database(), override_settings(EMAIL_OUTBOX_WORKER='command'):
+                started = time.perf_counter()
+                self.stdout.write('Seeding...')
+                owner, restaurant = self.seed(rng, options)
+                self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+                scenarios = self.build_scenarios(owner, restaurant, rng)
+                results = {}
+                for name, (request, expected_status) in scenarios.items():
+                    if options['views'] and name not in options['views']:
+                        continue
+                    results[name] = self.run_scenario(
+                        request, expected_status, options['repeat'], options['warmup'])
+                    self.stdout.write(
+                        f"{format_summary(name, results[name])} "
+                        f"queries={results[name]['queries']} rps={results[name]['throughput_per_s']}"
+                    )
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'timestamp': int(time.time()),
+                **{key: options[key] for key in ('restaurants', 'menu_items', 'menu_size', 'repeat', 'seed')},
+            },
+            'views': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = compare_results(baseline['views'], results, options['threshold'])
+            for name, field, before, after in regressions:
+                self.stderr.write(f'{name}: {field} regressed from {before} to {after}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}.')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def seed(self, rng, options):
+        owner = User.objects.create_user('benchmark-owner', 'owner@example.com', 'benchmark')
+        UserProfile.objects.create(user=owner, role='RESTAURANT')
+        seed_catalogue(options['restaurants'], options['menu_items'], rng, owner=owner, stdout=self.stdout)
+
+        # The restaurant the owner views run against gets a menu of a known size
+        restaurant = Restaurant.objects.filter(status='active').order_by('pk').first()
+        restaurant.menu_items.all().delete()
+        categories = [value for value, label in MenuItem.CATEGORY_CHOICES]
+        MenuItem.objects.bulk_create(
+            MenuItem(
+                restaurant=restaurant, name=random_name(rng, 2), description=random_name(rng, 8),
+                price=rng.randint(150, 6000) / 100, category=rng.choice(categories),
+                preparation_time=rng.randint(5, 60),
+            )
+            for _ in range(options['menu_size'])
+        )
+
+        # bulk_create skips the signals that keep these in step
+        rebuild_all_summaries()
+        rebuild_open_slots()
+        backend = get_search_backend()
+        if isinstance(backend, IndexedSearchBackend) and backend.is_available():
+            backend.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return owner, restaurant
+
+    def build_scenarios(self, owner, restaurant, rng):
+        anonymous = Client()
+        owner_client = Client()
+        owner_client.force_login(owner)
+        counter = iter(range(10 ** 9))
+        category = rng.choice(Restaurant.CATEGORY_CHOICES)[0]
+
+        list_url = reverse('restaurant:list')
+        dashboard_url = reverse('restaurant:dashboard', args=[restaurant.pk])
+        menu_url = reverse('restaurant:manage_menu', args=[restaurant.pk])
+        add_url = reverse('restaurant:add_menu_item', args=[restaurant.pk])
+        register_url = reverse('users:register_customer')
+
+        def add_menu_item():
+            number = next(counter)
+            return owner_client.post(add_url, {
+                'name': f'Benchmark Dish {number}', 'description': 'Seeded by benchmark_views',
+                'price': '12.50', 'category': 'main_course', 'is_available': 'on', 'preparation_time': 20,
+            })
+
+        def register():
+            number = next(counter)
+            password = 'Bench-mark-pass-9'
+            return anonymous.post(register_url, {
+                'username': f'bench{number}', 'email': f'bench{number}@example.com',
+                'first_name': 'Bench', 'last_name': 'Mark', 'phone': '5550100',
+                'address': '1 Benchmark Road', 'password1': password, 'password2': password,
+            })
+
+        # name -> (request callable, expected status code)
+        return {
+            'restaurant_list': (lambda: anonymous.get(list_url), 200),
+            'restaurant_list_filtered': (lambda: anonymous.get(
+                list_url, {'category': category, 'vegetarian': '1', 'sort': 'price'}), 200),
+            'restaurant_list_search': (lambda: anonymous.get(list_url, {'search': 'pizza'}), 200),
+            'restaurant_list_open_now': (lambda: anonymous.get(list_url, {'open_now': '1'}), 200),
+            'restaurant_dashboard': (lambda: owner_client.get(dashboard_url), 200),
+            'manage_menu': (lambda: owner_client.get(menu_url), 200),
+            'add_menu_item_form': (lambda: owner_client.get(add_url), 200),
+            'add_menu_item_submit': (add_menu_item, 302),
+            'register_form': (lambda: anonymous.get(register_url), 200),
+            'register_submit': (register, 302),
+        }
+
+    def run_scenario(self, request, expected_status, repeat, warmup):
+        for _ in range(warmup):
+            self.check_response(request(), expected_status)
+        samples = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request()
+                samples.append(time.perf_counter() - started)
+            self.check_response(response, expected_status)
+            queries = max(queries, len(captured))
+        return {**summarize_latencies(samples), 'queries': queries}
+
+    def check_response(self, response, expected_status):
+        # A re-rendered form (200 instead of a redirect) would time the wrong thing
+        if response.status_code != expected_status:
+            raise CommandError(
+                f'{response.request["PATH_INFO"]} returned {response.status_code}, expected {expected_status}'
+            )
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from restaurant.blobs import GRACE, adopt_legacy_files, collect_garbage, rebuild_refcounts
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded images (and their thumbnails) that no restaurant or menu item uses any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=GRACE.total_seconds() / 3600,
+            help='Only delete blobs unused for at least this long.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted.')
+        parser.add_argument('--recount', action='store_true', help='Recount references from the tables first.')
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help='Move uploads stored before content addressing into blobs, deleting the originals.',
+        )
+
+    def handle(self, *args, **options):
+        if options['adopt'] and options['dry_run']:
+            self.stdout.write('Skipping --adopt in a dry run.')
+        elif options['adopt']:
+            adopted = adopt_legacy_files(delete_originals=True)
+            self.stdout.write(f'Moved {adopted} legacy uploads into blobs.')
+        if options['recount']:
+            self.stdout.write(f'Recounted references to {rebuild_refcounts()} blobs.')
+        removed, freed = collect_garbage(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} files ({freed / 1024 / 1024:.1f} MB).'))
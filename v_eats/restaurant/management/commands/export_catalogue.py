@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.admin import MenuItemAdmin, RestaurantAdmin
+from restaurant.export import FORMATS, ExportError, apply_filters, export_chunks
+from restaurant.models import MenuItem, Restaurant
+
+MODELS = {
+    'restaurants': (Restaurant, RestaurantAdmin.list_filter),
+    'menu_items': (MenuItem, MenuItemAdmin.list_filter),
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream restaurants or menu items to CSV or JSON, optionally filtered like the admin changelists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output)')
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='FIELD[__LOOKUP]=VALUE',
+            help='Repeatable; FIELD is one of the admin list_filter fields, LOOKUP one of exact/gt/gte/lt/lte',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        model, allowed = MODELS[options['model']]
+        filters = {}
+        for item in options['filter']:
+            key, separator, value = item.partition('=')
+            if not separator:
+                raise CommandError(f'Filters look like field=value, got "{item}"')
+            filters[key] = value
+
+        try:
+            queryset = apply_filters(model.objects.all(), filters, allowed)
+            chunks = export_chunks(queryset, options['format'], options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
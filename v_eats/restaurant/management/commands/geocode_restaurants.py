@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.geo import geocode, geohash_encode, load_gazetteer, reset_delivery_index
+from restaurant.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Set restaurant coordinates from their addresses using a local gazetteer file (no network)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer', help='Tab-separated name/lat/lng file; defaults to settings.GEO_GAZETTEER.')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-geocode restaurants that already have coordinates.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        gazetteer = load_gazetteer(options['gazetteer'])
+        queryset = Restaurant.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(latitude__isnull=True)
+
+        located = unmatched = 0
+        batch = []
+        for restaurant in queryset.only('pk', 'address').iterator(chunk_size=options['batch_size']):
+            place = geocode(restaurant.address, gazetteer)
+            if place is None:
+                unmatched += 1
+                continue
+            restaurant.latitude, restaurant.longitude = place
+            restaurant.geohash = geohash_encode(*place)
+            batch.append(restaurant)
+            if len(batch) >= options['batch_size']:
+                located += self.save(batch)
+                batch = []
+        if batch:
+            located += self.save(batch)
+
+        # bulk_update skips the signals that keep the in-memory index current
+        reset_delivery_index()
+        self.stdout.write(self.style.SUCCESS(f'Geocoded {located} restaurants; {unmatched} addresses not matched.'))
+
+    def save(self, batch):
+        Restaurant.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+        return len(batch)
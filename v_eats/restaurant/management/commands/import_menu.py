@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.menu_import import MenuImportError, import_menu_file
+from restaurant.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import menu items for one restaurant from a CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument(
+            '--partial', action='store_true',
+            help='Import the valid rows even if some rows have errors',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            restaurant = Restaurant.objects.get(pk=options['restaurant_id'])
+        except Restaurant.DoesNotExist:
+            raise CommandError(f'Restaurant {options["restaurant_id"]} does not exist')
+
+        path = options['path']
+        try:
+            with open(path, 'rb') as file:
+                result = import_menu_file(restaurant, file, os.path.basename(path), partial=options['partial'])
+        except (OSError, MenuImportError) as e:
+            raise CommandError(str(e))
+
+        for row_number, errors in result.errors:
+            details = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items())
+            self.stderr.write(f'Row {row_number}: {details}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more rows with errors')
+
+        if not result.committed:
+            raise CommandError(
+                f'Nothing imported: {result.error_count} of {result.rows} rows had errors (use --partial to skip them)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} of {result.rows} rows into {restaurant.name}.'
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from restaurant.images import BATCH_SIZE, POLL_INTERVAL, process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Render thumbnails for uploaded images whose variants are missing or out of date '
+        '(use with IMAGE_PIPELINE_WORKER = "command", or once to backfill)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process what is pending once and exit.')
+        parser.add_argument(
+            '--interval', type=float, default=POLL_INTERVAL,
+            help='Seconds to sleep between scans when running continuously.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            changed = process_pending(options['batch_size'])
+            if changed:
+                self.stdout.write(f'Updated variants of {changed} images.')
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.summary import rebuild_all_summaries, verify_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-restaurant menu summary table from MenuItem and verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only verify the stored summaries against a recount; do not rebuild.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = rebuild_all_summaries()
+            self.stdout.write(f'Rebuilt {count} menu summaries.')
+
+        mismatches = verify_summaries()
+        for restaurant_id, field, stored, expected in mismatches[:50]:
+            self.stderr.write(f'Restaurant {restaurant_id}: {field} is {stored!r}, expected {expected!r}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} summary mismatches found.')
+        self.stdout.write(self.style.SUCCESS('Menu summaries verified.'))
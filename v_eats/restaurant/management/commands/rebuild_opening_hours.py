@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.hours import rebuild_open_slots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the open-hours slots used by the "open now" filter'
+
+    def handle(self, *args, **options):
+        count = rebuild_open_slots()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} open slots.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.search import IndexedSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the restaurant full-text search index from scratch'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, IndexedSearchBackend) or not backend.is_available():
+            raise CommandError(
+                'No search index table found. Run "migrate" first; '
+                'searches will use icontains until then.'
+            )
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} restaurants.'))
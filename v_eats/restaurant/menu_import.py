@@ -0,0 +1,238 @@
+"""
+Bulk menu import from CSV or XLSX files.
+
+Rows are streamed from the file one at a time (``csv.reader``, or
+openpyxl's read-only mode for XLSX), validated with the same rules as
+``MenuItemForm`` and written with ``bulk_create`` in batches, all inside
+one transaction. By default a file with any invalid row imports nothing;
+with ``partial=True`` the valid rows are kept. Either way every invalid row
+is reported with its spreadsheet row number (the header is row 1).
+
+``bulk_create`` bypasses the ``MenuItem`` signals, so the menu summary,
+dashboard stats, autocomplete entries and the public menu snapshot are
+refreshed once at the end.
+XLSX files need the optional ``openpyxl`` package.
+"""
+import csv
+import io
+import os
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import autocomplete
+from .forms import MenuItemForm
+from .menus import invalidate_menu
+from .models import MenuItem
+from .summary import rebuild_summary
+
+COLUMNS = (
+    'name', 'description', 'price', 'category', 'is_available', 'is_vegetarian', 'is_vegan', 'preparation_time',
+)
+REQUIRED_COLUMNS = ('name', 'description', 'price', 'category')
+BOOLEAN_COLUMNS = ('is_available', 'is_vegetarian', 'is_vegan')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+BATCH_SIZE = 500
+# Rows beyond this many errors are counted but not listed
+MAX_REPORTED_ERRORS = 200
+
+
+class MenuImportError(Exception):
+    """The file as a whole cannot be imported"""
+
+
+class MenuItemImportForm(MenuItemForm):
+    """``MenuItemForm`` without the image; its fields validate each imported row"""
+
+    class Meta(MenuItemForm.Meta):
+        fields = [field for field in MenuItemForm.Meta.fields if field != 'image']
+
+
+# Labels ("Main Course") as well as values ("main_course")
+CATEGORY_ALIASES = {
+    key: value
+    for value, label in MenuItem.CATEGORY_CHOICES
+    for key in (value, label.lower())
+}
+
+
+def validate_row(data, restaurant):
+    """
+    Apply ``MenuItemImportForm``'s rules (field cleaning, then the model's
+    ``full_clean``) to one row. Returns ``(menu_item, errors)``.
+
+    A bound form per row would deep-copy every field and widget, which is
+    most of the cost of a large import; the class's fields are stateless
+    once built, so they are shared instead.
+    """
+    errors = {}
+    cleaned = {}
+    for name, field in MenuItemImportForm.base_fields.items():
+        try:
+            cleaned[name] = field.clean(data.get(name))
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        return None, errors
+    item = MenuItem(restaurant=restaurant, **cleaned)
+    try:
+        item.full_clean(exclude=['restaurant', 'image'], validate_unique=False)
+    except ValidationError as e:
+        return None, e.message_dict
+    return item, {}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.rows = 0
+        self.error_count = 0
+        # [(row_number, {field: [message, ...]})]
+        self.errors = []
+        self.committed = False
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, errors))
+
+
+def normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def read_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield [normalize_header(value) for value in header]
+        yield from reader
+    finally:
+        # Leave the underlying upload open for the caller
+        text.detach()
+
+
+def read_xlsx(file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise MenuImportError('XLSX import needs the openpyxl package; upload a CSV file instead.')
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield [normalize_header(value) for value in header]
+        for row in rows:
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+READERS = {'.csv': read_csv, '.xlsx': read_xlsx}
+
+
+def read_rows(file, filename):
+    """Yield ``(row_number, {column: value})`` for each non-empty data row"""
+    extension = os.path.splitext(filename)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise MenuImportError(f'Unsupported file type "{extension}"; use CSV or XLSX.')
+
+    try:
+        yield from read_columns(reader(file))
+    except (UnicodeDecodeError, csv.Error):
+        # Raised lazily while the rows are read, so the import transaction rolls back
+        raise MenuImportError('The file is not UTF-8 CSV; export it from your spreadsheet as "CSV UTF-8".')
+
+
+def read_columns(rows):
+    header = next(rows, None)
+    if header is None:
+        raise MenuImportError('The file is empty.')
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise MenuImportError(f'Missing required columns: {", ".join(missing)}.')
+
+    # Unknown columns are ignored
+    positions = [(column, position) for position, column in enumerate(header) if column in COLUMNS]
+    for row_number, row in enumerate(rows, start=2):
+        if not any(str(value).strip() for value in row):
+            continue
+        yield row_number, {
+            column: row[position] if position < len(row) else '' for column, position in positions
+        }
+
+
+def prepare(values):
+    """Turn raw cell values into form data plus any yes/no column errors"""
+    data = {}
+    errors = {}
+    for column, value in values.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value == '':
+            # Blank cells fall back to the model defaults below
+            continue
+        if column == 'category':
+            category = str(value).lower()
+            data[column] = CATEGORY_ALIASES.get(category, category)
+            continue
+        if column not in BOOLEAN_COLUMNS:
+            data[column] = value
+            continue
+        if isinstance(value, (int, float)):
+            # XLSX cells arrive as booleans or numbers
+            text = '1' if value else '0'
+        else:
+            text = value.lower()
+        if text in TRUE_VALUES:
+            data[column] = True
+        elif text in FALSE_VALUES:
+            data[column] = False
+        else:
+            errors[column] = [f'"{value}" is not a yes/no value.']
+    for column in BOOLEAN_COLUMNS + ('preparation_time',):
+        if column not in data and column not in errors:
+            data[column] = MenuItem._meta.get_field(column).get_default()
+    return data, errors
+
+
+def import_menu_file(restaurant, file, filename, partial=False, batch_size=BATCH_SIZE):
+    """Import menu items for ``restaurant`` from an open binary ``file``; returns an ``ImportResult``"""
+    result = ImportResult()
+    created = []
+    with transaction.atomic():
+        batch = []
+        for row_number, values in read_rows(file, filename):
+            result.rows += 1
+            data, errors = prepare(values)
+            item, field_errors = validate_row(data, restaurant)
+            errors.update(field_errors)
+            if errors:
+                result.add_error(row_number, errors)
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                created.extend(MenuItem.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created.extend(MenuItem.objects.bulk_create(batch))
+
+        if result.error_count and not partial:
+            transaction.set_rollback(True)
+            return result
+
+    result.created = len(created)
+    result.committed = True
+    if created:
+        rebuild_summary(restaurant.pk)
+        invalidate_menu(restaurant.pk)
+        for item in created:
+            autocomplete.sync_menu_item(item)
+    return result
@@ -0,0 +1,134 @@
+"""
+Precomputed public menus.
+
+Each active restaurant's available menu, grouped by category in
+``MenuItem.Meta.ordering``, is serialized once to JSON (and to msgpack
+when the optional ``msgpack`` package is installed) and kept in the
+``menus`` cache, so serving it is a primary key lookup, one cache read and
+a response around the stored bytes. Point that alias at a file-based cache
+(``MENU_CACHE_BACKEND=file``) to keep the snapshots on disk and share them
+between processes.
+
+Snapshots carry the restaurant's ``menu_generation``, a column that
+``invalidate_menu`` bumps with an ``F()`` update whenever a ``MenuItem`` of
+the restaurant (or the restaurant itself) changes, from the model signals
+and after bulk imports. Serving a menu reads that column (the lookup also
+tells whether the restaurant is public) and uses the
+stored snapshot only if it was built for the same generation; otherwise
+the menu is rebuilt. The counter lives in the database so every worker
+sees an edit at once, whatever cache backend holds the snapshots. A
+rebuild reads the generation before the menu rows, so one that raced with
+an edit is stored under the old number and never served. The dashboard
+stats (stats.py) are cached under the same number.
+``FORMAT_VERSION`` is part of the keys; bump it when the layout changes.
+"""
+import hashlib
+import itertools
+import json
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import MenuItem, Restaurant
+from .storage import blob_storage
+
+FORMAT_VERSION = 1
+ITEM_FIELDS = (
+    'id', 'name', 'description', 'price', 'category', 'image', 'is_vegetarian', 'is_vegan', 'preparation_time',
+)
+
+MenuSnapshot = namedtuple('MenuSnapshot', 'generation etag json msgpack')
+
+
+def get_menu_cache():
+    return caches['menus']
+
+
+def snapshot_key(restaurant_id):
+    return f'menu:v{FORMAT_VERSION}:{restaurant_id}'
+
+
+def build_menu(restaurant_id, generation):
+    """The public menu of an active restaurant as plain data, or None"""
+    restaurant = Restaurant.objects.filter(pk=restaurant_id, status='active').values('id', 'name').first()
+    if restaurant is None:
+        return None
+    items = (
+        MenuItem.objects.filter(restaurant_id=restaurant_id, is_available=True)
+        .order_by(*MenuItem._meta.ordering, 'id')
+        .values(*ITEM_FIELDS)
+    )
+    labels = dict(MenuItem.CATEGORY_CHOICES)
+    categories = []
+    for category, group in itertools.groupby(items, key=lambda item: item['category']):
+        group = list(group)
+        for item in group:
+            item['price'] = str(item['price'])
+            item['image'] = blob_storage.url(item['image']) if item['image'] else None
+            del item['category']
+        categories.append({'category': category, 'label': labels.get(category, category), 'items': group})
+    return {
+        'format': FORMAT_VERSION,
+        'generation': generation,
+        'restaurant': restaurant,
+        'categories': categories,
+    }
+
+
+def pack(data):
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack.packb(data)
+
+
+def public_generation(restaurant_id):
+    """The current ``menu_generation`` of an active restaurant, or None"""
+    return Restaurant.objects.filter(pk=restaurant_id, status='active').values_list('menu_generation', flat=True)
+
+
+def rebuild_menu(restaurant_id, generation=None):
+    """Serialize and store the menu of ``restaurant_id``; returns the snapshot or None"""
+    if generation is None:
+        generation = public_generation(restaurant_id).first()
+        if generation is None:
+            return None
+    data = build_menu(restaurant_id, generation)
+    if data is None:
+        return None
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    snapshot = MenuSnapshot(generation, '"%s"' % hashlib.sha256(body).hexdigest()[:32], body, pack(data))
+    get_menu_cache().set(snapshot_key(restaurant_id), snapshot)
+    return snapshot
+
+
+def current_snapshot(snapshot, generation):
+    return snapshot if snapshot is not None and snapshot.generation == generation else None
+
+
+def get_menu(restaurant_id):
+    """The current menu snapshot of ``restaurant_id``, or None if it is not public"""
+    generation = public_generation(restaurant_id).first()
+    if generation is None:
+        return None
+    snapshot = current_snapshot(get_menu_cache().get(snapshot_key(restaurant_id)), generation)
+    return snapshot or rebuild_menu(restaurant_id, generation)
+
+
+async def aget_menu(restaurant_id):
+    """``get_menu`` for async views"""
+    generation = await public_generation(restaurant_id).afirst()
+    if generation is None:
+        return None
+    snapshot = current_snapshot(await get_menu_cache().aget(snapshot_key(restaurant_id)), generation)
+    return snapshot or await sync_to_async(rebuild_menu)(restaurant_id, generation)
+
+
+def invalidate_menu(restaurant_id):
+    """Retire the stored menu of ``restaurant_id``"""
+    # Part of the caller's transaction: readers see the new number with the new rows
+    Restaurant.objects.filter(pk=restaurant_id).update(menu_generation=F('menu_generation') + 1)
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS restaurant_search USING fts5("
+    "name, description, address, tokenize = 'unicode61 remove_diacritics 2')"
+)
+SQLITE_POPULATE = (
+    "INSERT INTO restaurant_search (rowid, name, description, address) "
+    "SELECT id, name, description, address FROM restaurant_restaurant"
+)
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS restaurant_search ("
+    "restaurant_id bigint PRIMARY KEY REFERENCES restaurant_restaurant (id) "
+    "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS restaurant_search_document_gin "
+    "ON restaurant_search USING GIN (document)",
+]
+POSTGRES_POPULATE = (
+    "INSERT INTO restaurant_search (restaurant_id, document) "
+    "SELECT id, "
+    "setweight(to_tsvector('simple', name), 'A') || "
+    "setweight(to_tsvector('simple', description), 'B') || "
+    "setweight(to_tsvector('simple', address), 'C') "
+    "FROM restaurant_restaurant"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_CREATE)
+        except Exception:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        schema_editor.execute(SQLITE_POPULATE)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+        schema_editor.execute(POSTGRES_POPULATE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS restaurant_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
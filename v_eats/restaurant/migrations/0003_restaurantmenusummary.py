@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+
+
+def populate_summaries(apps, schema_editor):
+    Restaurant = apps.get_model('restaurant', 'Restaurant')
+    MenuItem = apps.get_model('restaurant', 'MenuItem')
+    RestaurantMenuSummary = apps.get_model('restaurant', 'RestaurantMenuSummary')
+
+    available = Q(is_available=True)
+    rows = MenuItem.objects.order_by().values('restaurant_id').annotate(
+        item_count=Count('id'),
+        available_count=Count('id', filter=available),
+        vegetarian_count=Count('id', filter=available & Q(is_vegetarian=True)),
+        vegan_count=Count('id', filter=available & Q(is_vegan=True)),
+        min_price=Min('price', filter=available),
+        max_price=Max('price', filter=available),
+        preparation_time_total=Sum('preparation_time', filter=available),
+        avg_preparation_time=Avg('preparation_time', filter=available),
+    )
+    summaries = {row.pop('restaurant_id'): row for row in rows}
+    RestaurantMenuSummary.objects.bulk_create([
+        RestaurantMenuSummary(restaurant_id=restaurant_id, **{
+            **summaries.get(restaurant_id, {}),
+            'preparation_time_total': summaries.get(restaurant_id, {}).get('preparation_time_total') or 0,
+        })
+        for restaurant_id in Restaurant.objects.values_list('pk', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0002_restaurant_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantMenuSummary',
+            fields=[
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='menu_summary', serialize=False, to='restaurant.restaurant')),
+                ('item_count', models.IntegerField(default=0)),
+                ('available_count', models.IntegerField(default=0)),
+                ('vegetarian_count', models.IntegerField(default=0, help_text='Available vegetarian items')),
+                ('vegan_count', models.IntegerField(default=0, help_text='Available vegan items')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('preparation_time_total', models.IntegerField(default=0, help_text='Sum over available items, in minutes')),
+                ('avg_preparation_time', models.FloatField(blank=True, help_text='Time in minutes', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'restaurant menu summaries',
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 11:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0003_restaurantmenusummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['restaurant', 'category', 'name', 'id'], name='menuitem_rest_cat_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['restaurant', 'category', 'name'], name='menuitem_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['restaurant', '-created_at'], name='menuitem_rest_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['-rating', '-created_at', '-id'], name='restaurant_active_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['status', 'category', '-rating', '-created_at', '-id'], name='restaurant_status_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['owner', '-created_at'], name='restaurant_owner_created_idx'),
+        ),
+    ]
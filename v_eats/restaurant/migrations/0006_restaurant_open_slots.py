@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_open_slots(apps, schema_editor):
+    # Inline copy of hours.open_slots: migrations must not import app code
+    Restaurant = apps.get_model('restaurant', 'Restaurant')
+    RestaurantOpenSlot = apps.get_model('restaurant', 'RestaurantOpenSlot')
+
+    slots = []
+    for pk, opening_time, closing_time in Restaurant.objects.values_list('pk', 'opening_time', 'closing_time'):
+        start = opening_time.hour * 60 + opening_time.minute
+        end = closing_time.hour * 60 + closing_time.minute
+        if start == end:
+            intervals = [(0, 24 * 60)]
+        elif start < end:
+            intervals = [(start, end)]
+        else:
+            intervals = [(start, 24 * 60)] + ([(0, end)] if end else [])
+        for low, high in intervals:
+            for hour in range(low // 60, (high - 1) // 60 + 1):
+                slots.append(RestaurantOpenSlot(
+                    restaurant_id=pk, hour=hour,
+                    start_minute=max(low, hour * 60), end_minute=min(high, hour * 60 + 60),
+                ))
+    RestaurantOpenSlot.objects.bulk_create(slots, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0005_restaurant_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantOpenSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('start_minute', models.PositiveSmallIntegerField(help_text='Minute of the day, inclusive')),
+                ('end_minute', models.PositiveSmallIntegerField(help_text='Minute of the day, exclusive')),
+                ('restaurant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='open_slots', to='restaurant.restaurant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour', 'start_minute', 'end_minute', 'restaurant'], name='openslot_lookup_idx'), models.Index(fields=['restaurant', 'hour', 'start_minute', 'end_minute'], name='openslot_restaurant_idx')],
+            },
+        ),
+        migrations.RunPython(populate_open_slots, migrations.RunPython.noop),
+    ]
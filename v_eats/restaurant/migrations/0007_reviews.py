@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 12:22
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def seed_rating_totals(apps, schema_editor):
+    # Keep existing averages: the running sum they imply
+    Restaurant = apps.get_model('restaurant', 'Restaurant')
+    Restaurant.objects.filter(total_reviews__gt=0).update(rating_total=Round(F('rating') * F('total_reviews')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_restaurant_open_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_total',
+            field=models.IntegerField(default=0, editable=False, help_text='Sum of review ratings'),
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('comment', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='restaurant.restaurant')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restaurant_reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['restaurant', '-created_at'], name='review_restaurant_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'user'), name='review_one_per_user')],
+            },
+        ),
+        migrations.RunPython(seed_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+import restaurant.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='menuitem',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=restaurant.storage.ContentAddressedStorage(), upload_to='menu_items/'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=restaurant.storage.ContentAddressedStorage(), upload_to='restaurants/'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=restaurant.storage.ContentAddressedStorage(), upload_to='restaurant_logos/'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('size', models.BigIntegerField(default=0, help_text='Bytes')),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount__lte', 0)), fields=['updated_at'], name='blob_unused_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,33 @@
 from django.db import models
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.urls import reverse
 from django.utils import timezone
 
-class Restaurant(models.Model):
+from .storage import blob_storage
+
+
+class MaintainedFieldsMixin:
+    """
+    Keeps a full ``save()`` of a loaded row from writing back
+    ``maintained_fields``: counters that are only ever moved by ``F()``
+    updates, whose in-memory copies may be older than the row (admin forms,
+    approval flows). Such saves update every other field instead.
+    """
+    maintained_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not (args or self._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Restaurant(MaintainedFieldsMixin, models.Model):
     CATEGORY_CHOICES = [
         ('fast_food', 'Fast Food'),
         ('casual', 'Casual Dining'),
@@ -25,24 +49,54 @@ class Restaurant(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='owned_restaurants')
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
     address = models.TextField()
+    # Filled in by the offline geocoder (manage.py geocode_restaurants)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Derived from latitude/longitude on save, see restaurant/geo.py
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     phone = models.CharField(max_length=20)
     email = models.EmailField()
     website = models.URLField(blank=True, null=True)
-    image = models.ImageField(upload_to='restaurants/', blank=True, null=True)
-    logo = models.ImageField(upload_to='restaurant_logos/', blank=True, null=True)
+    image = models.ImageField(upload_to='restaurants/', storage=blob_storage, blank=True, null=True)
+    logo = models.ImageField(upload_to='restaurant_logos/', storage=blob_storage, blank=True, null=True)
+    # Resized copies of image and logo, written by restaurant/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     opening_time = models.TimeField()
     closing_time = models.TimeField()
     is_delivery_available = models.BooleanField(default=True)
     delivery_fee = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
     minimum_order = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    delivery_radius_km = models.FloatField(
+        default=5.0, validators=[MinValueValidator(0.5), MaxValueValidator(25.0)]
+    )
+    # Running average of Review.rating, maintained by reviews.py
     rating = models.FloatField(default=0.0)
     total_reviews = models.IntegerField(default=0)
+    rating_total = models.IntegerField(default=0, editable=False, help_text="Sum of review ratings")
+    # Bumped on every menu change; the stored public menu must match it (see menus.py)
+    menu_generation = models.BigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    maintained_fields = ('rating', 'total_reviews', 'rating_total', 'menu_generation')
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Public listing: active restaurants by rating (see RestaurantListView)
+            models.Index(
+                fields=['-rating', '-created_at', '-id'],
+                condition=models.Q(status='active'),
+                name='restaurant_active_rank_idx',
+            ),
+            models.Index(fields=['status', 'category', '-rating', '-created_at', '-id'], name='restaurant_status_cat_idx'),
+            models.Index(fields=['owner', '-created_at'], name='restaurant_owner_created_idx'),
+            # Geohash prefix ranges for delivery-area searches
+            models.Index(
+                fields=['geohash'], condition=models.Q(status='active'), name='restaurant_active_geohash_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -68,7 +122,9 @@ class MenuItem(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=8, decimal_places=2)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
-    image = models.ImageField(upload_to='menu_items/', blank=True, null=True)
+    image = models.ImageField(upload_to='menu_items/', storage=blob_storage, blank=True, null=True)
+    # Resized copies of image, written by restaurant/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
     is_vegetarian = models.BooleanField(default=False)
     is_vegan = models.BooleanField(default=False)
@@ -78,6 +134,154 @@ class MenuItem(models.Model):
 
     class Meta:
         ordering = ['category', 'name']
+        indexes = [
+            # Menu management: one restaurant's items by category and name
+            models.Index(fields=['restaurant', 'category', 'name', 'id'], name='menuitem_rest_cat_name_idx'),
+            # Customer-facing menus only ever read available items
+            models.Index(
+                fields=['restaurant', 'category', 'name'],
+                condition=models.Q(is_available=True),
+                name='menuitem_available_idx',
+            ),
+            models.Index(fields=['restaurant', '-created_at'], name='menuitem_rest_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.name}"
+
+class Review(models.Model):
+    """One customer's rating of a restaurant; aggregates live on Restaurant"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='reviews')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='restaurant_reviews')
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'user'], name='review_one_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['restaurant', '-created_at'], name='review_restaurant_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.rating} by {self.user_id}"
+
+class RestaurantMenuSummary(models.Model):
+    """Denormalized menu facts, kept current from MenuItem signals (see summary.py)"""
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, primary_key=True, related_name='menu_summary')
+    item_count = models.IntegerField(default=0)
+    available_count = models.IntegerField(default=0)
+    vegetarian_count = models.IntegerField(default=0, help_text="Available vegetarian items")
+    vegan_count = models.IntegerField(default=0, help_text="Available vegan items")
+    min_price = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    preparation_time_total = models.IntegerField(default=0, help_text="Sum over available items, in minutes")
+    avg_preparation_time = models.FloatField(blank=True, null=True, help_text="Time in minutes")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'restaurant menu summaries'
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.item_count} items"
+
+    @property
+    def has_vegetarian(self):
+        return self.vegetarian_count > 0
+
+    @property
+    def has_vegan(self):
+        return self.vegan_count > 0
+
+class RestaurantOpenSlot(models.Model):
+    """
+    One hour of the day in which a restaurant is open, with the minutes it
+    is open inside that hour (see hours.py). Rebuilt from opening_time and
+    closing_time whenever they change.
+    """
+    # Indexed by openslot_restaurant_idx below
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='open_slots', db_index=False)
+    hour = models.PositiveSmallIntegerField()
+    start_minute = models.PositiveSmallIntegerField(help_text="Minute of the day, inclusive")
+    end_minute = models.PositiveSmallIntegerField(help_text="Minute of the day, exclusive")
+
+    class Meta:
+        indexes = [
+            # "Open at minute m": one hour bucket, then a short range scan
+            models.Index(fields=['hour', 'start_minute', 'end_minute', 'restaurant'], name='openslot_lookup_idx'),
+            # The same check for a single restaurant, probed row by row
+            models.Index(fields=['restaurant', 'hour', 'start_minute', 'end_minute'], name='openslot_restaurant_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.start_minute}-{self.end_minute}"
+
+class StoredBlob(models.Model):
+    """
+    One content-addressed upload (see storage.py) and how many image fields
+    point at it. Blobs nobody has used for a while are removed by
+    blobs.collect_garbage.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    size = models.BigIntegerField(default=0, help_text="Bytes")
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set whenever the count changes, so a grace period can be measured from the last release
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], condition=models.Q(refcount__lte=0), name='blob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+class Order(models.Model):
+    """A placed order; prices are copied onto its items at checkout (see checkout.py)"""
+    STATUS_CHOICES = [
+        ('placed', 'Placed'),
+        ('accepted', 'Accepted'),
+        ('preparing', 'Preparing'),
+        ('out_for_delivery', 'Out for Delivery'),
+        ('delivered', 'Delivered'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='orders')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.PROTECT, related_name='orders')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='placed')
+    delivery_address = models.TextField(blank=True)
+    item_count = models.PositiveIntegerField(default=0, help_text="Total quantity over all lines")
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    delivery_fee = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # A restaurant's incoming orders, newest first
+            models.Index(fields=['restaurant', 'status', '-created_at'], name='order_restaurant_status_idx'),
+            models.Index(fields=['customer', '-created_at'], name='order_customer_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.pk} - {self.restaurant_id} ({self.status})"
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # Kept when the dish is later deleted; name and price are snapshots
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
+    name = models.CharField(max_length=200)
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2)
+    quantity = models.PositiveSmallIntegerField()
+    line_total = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.name}"
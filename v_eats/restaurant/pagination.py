@@ -0,0 +1,168 @@
+"""
+Keyset (cursor) pagination for the listing views.
+
+Instead of ``OFFSET n`` plus a ``COUNT(*)``, each page is fetched with a
+``WHERE (sort key) > (last row's sort key)`` predicate, so deep pages cost
+the same as the first one. Page links carry an opaque token in the usual
+``page`` query parameter, and the page object mimics the parts of
+``django.core.paginator.Page`` the templates use; ``paginator.num_pages``
+and ``paginator.count`` are ``None`` because nothing is counted.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+OFFSET = 'offset'
+CURSOR = 'cursor'
+
+
+def get_pagination_mode(view_name):
+    """The mode configured for ``view_name`` in ``settings.PAGINATION_MODES``"""
+    return getattr(settings, 'PAGINATION_MODES', {}).get(view_name, OFFSET)
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+        meta = queryset.model._meta
+        self.model_fields = [
+            meta.pk if name == 'pk' else meta.get_field(name) for name, descending in self.fields
+        ]
+
+    # The offset paginator attributes templates may read
+    count = None
+    num_pages = None
+
+    def get_page(self, token):
+        query, make_page = self.page_query(token)
+        return make_page(list(query))
+
+    async def aget_page(self, token):
+        """``get_page`` for async views, reading the rows with the async ORM"""
+        query, make_page = self.page_query(token)
+        return make_page([row async for row in query])
+
+    def page_query(self, token):
+        """The rows to fetch for ``token``, and how to turn them into a page"""
+        state = self.decode(token)
+        if state is None:
+            query = self.queryset.order_by(*self.ordering)[:self.per_page + 1]
+            return query, lambda rows: CursorPage(self, rows[:self.per_page], 1, len(rows) > self.per_page, False)
+
+        number, forward, values = state
+        queryset = self.queryset.filter(self.keyset_filter(values, forward))
+        if forward:
+            query = queryset.order_by(*self.ordering)[:self.per_page + 1]
+            return query, lambda rows: CursorPage(
+                self, rows[:self.per_page], number, len(rows) > self.per_page, bool(rows))
+
+        reverse_ordering = [name[1:] if name.startswith('-') else '-' + name for name in self.ordering]
+        query = queryset.order_by(*reverse_ordering)[:self.per_page + 1]
+
+        def make_page(rows):
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(self, rows, number if has_previous else 1, bool(rows), has_previous)
+        return query, make_page
+
+    def keyset_filter(self, values, forward):
+        """
+        Rows strictly after (or before) ``values`` in the paginator's ordering:
+        ``a > x OR (a = x AND b > y) OR ...`` with each comparison flipped for
+        descending fields. A plain range condition on the leading field is
+        added so the database can seek into the composite index.
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        name, descending = self.fields[0]
+        leading = Q(**{f'{name}__{"lte" if descending == forward else "gte"}': values[0]})
+        return leading & condition
+
+    def encode(self, number, forward, row):
+        values = [field.value_to_string(row) for field in self.model_fields]
+        payload = json.dumps([number, 'n' if forward else 'p', values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode(self, token):
+        """Return ``(number, forward, values)``, or ``None`` for the first page"""
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            number, direction, raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if type(number) is not int or len(raw_values) != len(self.fields) or direction not in ('n', 'p'):
+                return None
+            values = [field.to_python(value) for field, value in zip(self.model_fields, raw_values)]
+            if None in values:
+                # The ordering columns are not nullable, and None cannot be compared against
+                return None
+            return max(number, 1), direction == 'n', values
+        except (ValueError, TypeError, OverflowError, binascii.Error, ValidationError):
+            # Plain page numbers from offset links (``?page=1``) land here too
+            return None
+
+
+class CursorPage:
+    def __init__(self, paginator, object_list, number, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Cursor page {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        """The token for the next page, used wherever a page number would be"""
+        return self.paginator.encode(self.number + 1, True, self.object_list[-1])
+
+    def previous_page_number(self):
+        return self.paginator.encode(self.number - 1, False, self.object_list[0])
+
+
+async def aget_offset_page(paginator, number):
+    """``paginator.page(number)`` (or ``'last'``) with the count and rows read by the async ORM"""
+    paginator.count = await paginator.object_list.acount()
+    page = paginator.page(paginator.num_pages if number == 'last' else number)
+    page.object_list = [row async for row in page.object_list]
+    return page
+
+
+def paginate(queryset, per_page, page, ordering, mode=OFFSET):
+    """Return a page of ``queryset`` using either offset or cursor pagination"""
+    if mode == CURSOR:
+        return CursorPaginator(queryset, per_page, ordering).get_page(page)
+    return Paginator(queryset.order_by(*ordering), per_page).get_page(page)
@@ -0,0 +1,95 @@
+"""
+Review ingestion and the running rating aggregates on ``Restaurant``.
+
+Each restaurant keeps ``rating_total`` (sum of ratings), ``total_reviews``
+and ``rating`` (their quotient). A new, changed or deleted review applies
+its delta with one ``UPDATE ... SET x = x + delta`` that recomputes the
+average from the same old values, so parallel reviews never lose counts
+and nothing is read back into Python first. The restaurant row is locked
+only by that final UPDATE, just before commit, which keeps the window for
+contention on popular restaurants short.
+
+The deltas are applied from the ``Review`` signals, so admin edits and
+deletes stay consistent too. ``QuerySet.update``/``delete`` and
+``bulk_create`` on reviews bypass them; run ``rebuild_ratings`` afterwards.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .listing import touch_update
+from .models import Restaurant, Review
+
+
+def running_average(average_field, total_field, count_field, delta_total, delta_count):
+    """``update()`` kwargs that add ``delta_total``/``delta_count`` and recompute the average"""
+    count_after = F(count_field) + delta_count
+    return {
+        total_field: F(total_field) + delta_total,
+        count_field: count_after,
+        average_field: Case(
+            When(**{f'{count_field}__gt': -delta_count},
+                 then=Cast(F(total_field) + delta_total, FloatField()) / count_after),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    }
+
+
+def apply_review_change(old, new):
+    """
+    Apply the change from ``(restaurant_id, rating)`` ``old`` to ``new``
+    (either may be ``None`` for a create or a delete).
+    """
+    if old is not None and new is not None and old[0] != new[0]:
+        apply_review_change(old, None)
+        apply_review_change(None, new)
+        return
+    restaurant_id = (new or old)[0]
+    delta_total = (new[1] if new else 0) - (old[1] if old else 0)
+    delta_count = (new is not None) - (old is not None)
+    if not delta_total and not delta_count:
+        return
+    touch_update(
+        Restaurant.objects.filter(pk=restaurant_id),
+        **running_average('rating', 'rating_total', 'total_reviews', delta_total, delta_count),
+    )
+
+
+def submit_review(restaurant, user, rating, comment=''):
+    """Create or replace ``user``'s review of ``restaurant``; returns the review"""
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                review = Review.objects.select_for_update().filter(restaurant=restaurant, user=user).first()
+                if review is None:
+                    review = Review(restaurant=restaurant, user=user)
+                review.rating = rating
+                review.comment = comment
+                review.save()
+                return review
+        except IntegrityError:
+            # A parallel first review by the same user won; update that one
+            if attempt:
+                raise
+
+
+def rebuild_ratings(restaurant_ids=None):
+    """
+    Recount ``rating``/``total_reviews`` from ``Review``; returns the rows
+    updated. Aggregates carried over from before reviews were recorded are
+    replaced by the recount.
+    """
+    reviews = Review.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), 0)
+    queryset = Restaurant.objects.all()
+    if restaurant_ids is not None:
+        queryset = queryset.filter(pk__in=restaurant_ids)
+    updated = touch_update(queryset, rating_total=total, total_reviews=count)
+    queryset.update(rating=Case(
+        When(total_reviews__gt=0, then=Cast('rating_total', FloatField()) / F('total_reviews')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+    return updated
@@ -0,0 +1,223 @@
+"""
+Full-text search backends for restaurants.
+
+The search index lives in a side table next to ``restaurant_restaurant``:
+an FTS5 virtual table on SQLite and a tsvector column with a GIN index on
+PostgreSQL. Both are created by migration ``0002_restaurant_search_index``
+and kept in sync from the ``Restaurant`` save/delete signals. When no index
+is available the plain ``icontains`` lookup is used instead.
+"""
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Restaurant
+
+SEARCH_TABLE = 'restaurant_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a raw search string into lowercase word tokens"""
+    return TOKEN_RE.findall(query.lower())
+
+
+class IContainsSearchBackend:
+    """Fallback backend: substring match on name, description and address"""
+
+    def is_available(self):
+        return True
+
+    def search(self, queryset, query):
+        queryset = queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(address__icontains=query)
+        )
+        return queryset.order_by('-rating', '-created_at')
+
+    def index(self, restaurant):
+        pass
+
+    def remove(self, restaurant_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class IndexedSearchBackend(IContainsSearchBackend):
+    """Shared behaviour for backends that keep a side table in sync"""
+
+    vendor = None
+
+    def __init__(self):
+        self._available = None
+
+    def is_available(self):
+        if self._available is None:
+            try:
+                self._available = SEARCH_TABLE in connection.introspection.table_names()
+            except DatabaseError:
+                return False
+        return self._available
+
+    def search(self, queryset, query):
+        if not self.is_available():
+            return super().search(queryset, query)
+        tokens = tokenize(query)
+        if not tokens:
+            return super().search(queryset, query)
+        return self.ranked_search(queryset, tokens)
+
+    def ranked_search(self, queryset, tokens):
+        raise NotImplementedError
+
+    def index(self, restaurant):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            self.write_rows(cursor, [restaurant])
+
+    def remove(self, restaurant_id):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            self.delete_row(cursor, restaurant_id)
+
+    def rebuild(self):
+        """Repopulate the whole index from the restaurant table"""
+        if not self.is_available():
+            return 0
+        restaurants = Restaurant.objects.only('id', 'name', 'description', 'address')
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            batch = []
+            for restaurant in restaurants.iterator(chunk_size=2000):
+                batch.append(restaurant)
+                if len(batch) == 2000:
+                    self.write_rows(cursor, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.write_rows(cursor, batch)
+                count += len(batch)
+        return count
+
+    def write_rows(self, cursor, restaurants):
+        raise NotImplementedError
+
+    def delete_row(self, cursor, restaurant_id):
+        raise NotImplementedError
+
+
+class SQLiteFTSSearchBackend(IndexedSearchBackend):
+    """SQLite FTS5 index, ranked with bm25 (lower is better)"""
+
+    vendor = 'sqlite'
+
+    def ranked_search(self, queryset, tokens):
+        # Every token is a prefix query so partially typed words still match
+        match = ' '.join('"%s"*' % token for token in tokens)
+        table = Restaurant._meta.db_table
+        queryset = queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.rowid = {table}.id',
+                f'{SEARCH_TABLE} MATCH %s',
+            ],
+            params=[match],
+            select={'search_rank': f'bm25({SEARCH_TABLE}, 10.0, 2.0, 1.0)'},
+        )
+        return queryset.order_by('search_rank', '-rating', '-created_at')
+
+    def write_rows(self, cursor, restaurants):
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+            [(restaurant.pk,) for restaurant in restaurants],
+        )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, address) VALUES (%s, %s, %s, %s)',
+            [(r.pk, r.name, r.description, r.address) for r in restaurants],
+        )
+
+    def delete_row(self, cursor, restaurant_id):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [restaurant_id])
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    """PostgreSQL tsvector index with a GIN index, ranked with ts_rank"""
+
+    vendor = 'postgresql'
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def ranked_search(self, queryset, tokens):
+        tsquery = ' & '.join("'%s':*" % token for token in tokens)
+        table = Restaurant._meta.db_table
+        queryset = queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.restaurant_id = {table}.id',
+                f"{SEARCH_TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[tsquery],
+            select={'search_rank': f"ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s))"},
+            select_params=[tsquery],
+        )
+        return queryset.order_by('-search_rank', '-rating', '-created_at')
+
+    def write_rows(self, cursor, restaurants):
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (restaurant_id, document) VALUES (%s, {self.DOCUMENT_SQL}) '
+            f'ON CONFLICT (restaurant_id) DO UPDATE SET document = EXCLUDED.document',
+            [(r.pk, r.name, r.description, r.address) for r in restaurants],
+        )
+
+    def delete_row(self, cursor, restaurant_id):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE restaurant_id = %s', [restaurant_id])
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend.
+
+    ``RESTAURANT_SEARCH_BACKEND`` may name a backend class by dotted path;
+    otherwise one is picked from the database vendor.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'RESTAURANT_SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        else:
+            backend_class = BACKENDS.get(connection.vendor, IContainsSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def reset_search_backend():
+    global _backend
+    _backend = None
+
+
+def search_restaurants(queryset, query):
+    """Filter ``queryset`` by ``query`` and order it by relevance"""
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,138 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, blobs, geo, hours, images, menus, reviews, summary
+from .models import Restaurant, MenuItem, RestaurantMenuSummary, Review
+from .search import get_search_backend
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_opening_hours(sender, instance, raw=False, **kwargs):
+    """Stash the stored hours so post_save only rebuilds open slots on a change"""
+    if raw or instance._state.adding:
+        instance._stored_hours = None
+    else:
+        instance._stored_hours = Restaurant.objects.filter(pk=instance.pk).values_list(
+            'opening_time', 'closing_time').first()
+
+
+@receiver(pre_save, sender=Restaurant)
+def update_geohash(sender, instance, raw=False, **kwargs):
+    """Keep the geohash cell in step with the coordinates"""
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = ''
+    else:
+        instance.geohash = geo.geohash_encode(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Restaurant)
+def index_restaurant(sender, instance, created=False, raw=False, **kwargs):
+    """Keep the full-text search index in sync with restaurant edits"""
+    if raw:
+        return
+    if created:
+        RestaurantMenuSummary.objects.get_or_create(restaurant=instance)
+    if getattr(instance, '_stored_hours', None) != (instance.opening_time, instance.closing_time):
+        hours.rebuild_open_slots([instance.pk])
+        instance._stored_hours = (instance.opening_time, instance.closing_time)
+    get_search_backend().index(instance)
+    autocomplete.sync_restaurant(instance)
+    geo.sync_restaurant(instance)
+    images.schedule(instance)
+    menus.invalidate_menu(instance.pk)
+
+
+@receiver(post_delete, sender=Restaurant)
+def unindex_restaurant(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+    autocomplete.remove_restaurant(instance.pk)
+    geo.remove_restaurant(instance.pk)
+    menus.invalidate_menu(instance.pk)
+
+
+@receiver(pre_save, sender=MenuItem)
+def remember_menu_item_state(sender, instance, raw=False, **kwargs):
+    """Stash the stored row so post_save can apply a summary delta"""
+    if raw or instance.pk is None or instance._state.adding:
+        instance._summary_snapshot = None
+    else:
+        instance._summary_snapshot = summary.fetch_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=MenuItem)
+def index_menu_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_summary_snapshot', None)
+    if previous is not None and previous['restaurant_id'] != instance.restaurant_id:
+        menus.invalidate_menu(previous['restaurant_id'])
+    menus.invalidate_menu(instance.restaurant_id)
+    current = summary.snapshot(instance)
+    if not summary.apply_menu_item_change(previous, current):
+        summary.rebuild_summary(instance.restaurant_id)
+    instance._summary_snapshot = current
+    autocomplete.sync_menu_item(instance)
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=MenuItem)
+def unindex_menu_item(sender, instance, **kwargs):
+    # A missing summary row here means the restaurant itself is being deleted
+    summary.apply_menu_item_change(summary.snapshot(instance), None)
+    autocomplete.remove_menu_item(instance.pk)
+    menus.invalidate_menu(instance.restaurant_id)
+
+
+@receiver(pre_save, sender=Review)
+@receiver(pre_delete, sender=Review)
+def remember_review(sender, instance, raw=False, **kwargs):
+    """Stash the stored review so post_save/post_delete apply what is really in the table"""
+    instance._stored_review = None
+    if not raw and not instance._state.adding:
+        instance._stored_review = Review.objects.filter(pk=instance.pk).values_list(
+            'restaurant_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def aggregate_review(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = (instance.restaurant_id, instance.rating)
+    reviews.apply_review_change(getattr(instance, '_stored_review', None), new)
+    instance._stored_review = new
+
+
+@receiver(post_delete, sender=Review)
+def unaggregate_review(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_review', None)
+    if stored is not None:
+        reviews.apply_review_change(stored, None)
+
+
+@receiver(pre_save, sender=Restaurant)
+@receiver(pre_save, sender=MenuItem)
+@receiver(pre_delete, sender=Restaurant)
+@receiver(pre_delete, sender=MenuItem)
+def remember_images(sender, instance, raw=False, **kwargs):
+    """Stash the stored file names so the blob counts follow what is really in the table"""
+    instance._stored_images = None
+    if not raw and not instance._state.adding:
+        instance._stored_images = blobs.fetch_image_names(sender, instance.pk)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=MenuItem)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = blobs.image_names(instance)
+    blobs.apply_image_change(getattr(instance, '_stored_images', None), current)
+    instance._stored_images = current
+
+
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=MenuItem)
+def release_images(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_images', None)
+    if stored is not None:
+        blobs.release(stored)
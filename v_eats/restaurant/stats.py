@@ -0,0 +1,59 @@
+"""
+Menu statistics for the restaurant dashboard.
+
+All counts come from a single conditional-aggregation query and are cached
+per restaurant under its ``menu_generation`` (see menus.py). Every change
+to one of its menu items bumps that column, in the same transaction and
+for every worker at once, so a cached entry is never used once its counts
+are out of date; old entries simply expire.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import MenuItem, Restaurant
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def stats_cache_key(restaurant_id, generation):
+    return f'restaurant:{restaurant_id}:dashboard-stats:{generation}'
+
+
+def compute_dashboard_stats(restaurant_id):
+    aggregates = {
+        'total_items': Count('id'),
+        'available_items': Count('id', filter=Q(is_available=True)),
+        'vegetarian_items': Count('id', filter=Q(is_vegetarian=True)),
+        'vegan_items': Count('id', filter=Q(is_vegan=True)),
+    }
+    for value, label in MenuItem.CATEGORY_CHOICES:
+        aggregates[f'category_{value}'] = Count('id', filter=Q(category=value))
+
+    # aggregate() on a filtered queryset is one SELECT with no GROUP BY
+    counts = MenuItem.objects.filter(restaurant_id=restaurant_id).aggregate(**aggregates)
+
+    return {
+        'total_items': counts['total_items'],
+        'available_items': counts['available_items'],
+        'vegetarian_items': counts['vegetarian_items'],
+        'vegan_items': counts['vegan_items'],
+        'category_counts': [
+            {'category': value, 'label': label, 'count': counts[f'category_{value}']}
+            for value, label in MenuItem.CATEGORY_CHOICES
+        ],
+    }
+
+
+def get_dashboard_stats(restaurant_id, generation=None):
+    """
+    The stats of ``restaurant_id``; pass its ``menu_generation`` when the
+    restaurant row is at hand to save reading it again.
+    """
+    if generation is None:
+        generation = Restaurant.objects.filter(pk=restaurant_id).values_list('menu_generation', flat=True).first()
+    key = stats_cache_key(restaurant_id, generation)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_dashboard_stats(restaurant_id)
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
@@ -0,0 +1,72 @@
+"""
+Content-addressed storage for uploaded images.
+
+``ContentAddressedStorage`` streams each upload to a temporary file while
+hashing it, then moves it to ``blobs/<aa>/<sha256>.<ext>``. An upload whose
+content is already stored is dropped and the existing blob reused, so
+re-uploading a photo (or the same photo for two menu items) costs no disk
+space. Blob names never change meaning, which lets them be served as
+immutable (see ``restaurant.blobs.serve_immutable``).
+
+The storage itself knows nothing about the database; the reference counts
+and garbage collection of unused blobs live in ``restaurant/blobs.py``.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+TEMP_DIR = f'{BLOB_DIR}/tmp'
+BLOB_NAME = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(?:\.\w+)?$')
+
+
+def blob_name(digest, extension=''):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def blob_digest(name):
+    """The SHA-256 of a blob, read from its name; ``None`` for other files"""
+    match = BLOB_NAME.match(name or '')
+    return match.group('digest') if match else None
+
+
+@deconstructible(path='restaurant.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, in _save
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+            name = blob_name(digest.hexdigest(), extension)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.unlink(temp_path)
+                # A fresh mtime keeps the garbage collector off a blob that is being reused
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+
+blob_storage = ContentAddressedStorage()
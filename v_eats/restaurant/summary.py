@@ -0,0 +1,219 @@
+"""
+Incremental maintenance of ``RestaurantMenuSummary``.
+
+Each menu item contributes a small vector to its restaurant's summary
+(one item, one available item, its preparation time if available, ...).
+A save or delete applies ``contribution(new) - contribution(old)`` with a
+single ``UPDATE ... SET x = x + delta`` so concurrent edits never lose
+counts. Prices only need a recount when the price being removed was the
+current minimum or maximum, and that recount is a subquery inside the same
+UPDATE.
+
+``bulk_create`` and ``QuerySet.update`` bypass the signals; use
+``rebuild_summary`` / ``rebuild_all_summaries`` (or the
+``rebuild_menu_summaries`` command) after bulk writes.
+"""
+from django.db import transaction
+from django.db.models import (
+    Avg, Case, Count, DecimalField, F, FloatField, Max, Min, OuterRef, Q, Subquery, Sum, When,
+)
+from django.db.models.functions import Cast
+
+from .models import MenuItem, Restaurant, RestaurantMenuSummary
+
+SNAPSHOT_FIELDS = ('restaurant_id', 'is_available', 'is_vegetarian', 'is_vegan', 'price', 'preparation_time')
+
+COUNTER_FIELDS = (
+    'item_count', 'available_count', 'vegetarian_count', 'vegan_count', 'preparation_time_total',
+)
+
+COMPARED_FIELDS = COUNTER_FIELDS + ('min_price', 'max_price', 'avg_preparation_time')
+
+PRICE_FIELD = DecimalField(max_digits=8, decimal_places=2)
+
+
+def snapshot(menu_item):
+    """The fields of ``menu_item`` that feed its restaurant's summary"""
+    values = {field: getattr(menu_item, field) for field in SNAPSHOT_FIELDS}
+    # Unsaved form data may still hold the price as a string
+    values['price'] = MenuItem._meta.get_field('price').to_python(values['price'])
+    return values
+
+
+def fetch_snapshot(menu_item_id):
+    return MenuItem.objects.filter(pk=menu_item_id).values(*SNAPSHOT_FIELDS).first()
+
+
+def contribution(values):
+    if values is None:
+        return dict.fromkeys(COUNTER_FIELDS, 0), None
+    available = bool(values['is_available'])
+    counters = {
+        'item_count': 1,
+        'available_count': int(available),
+        'vegetarian_count': int(available and values['is_vegetarian']),
+        'vegan_count': int(available and values['is_vegan']),
+        'preparation_time_total': values['preparation_time'] if available else 0,
+    }
+    return counters, (values['price'] if available else None)
+
+
+def apply_menu_item_change(old, new):
+    """
+    Apply the change from snapshot ``old`` to snapshot ``new`` (either may be
+    ``None`` for a create or a delete). Returns ``False`` if a summary row
+    was missing and nothing was written.
+    """
+    if old is not None and new is not None and old['restaurant_id'] != new['restaurant_id']:
+        # Moved between restaurants: a delete from one and a create in the other
+        removed = apply_menu_item_change(old, None)
+        added = apply_menu_item_change(None, new)
+        return removed and added
+
+    restaurant_id = (new or old)['restaurant_id']
+    old_counters, old_price = contribution(old)
+    new_counters, new_price = contribution(new)
+    deltas = {field: new_counters[field] - old_counters[field] for field in COUNTER_FIELDS}
+
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas['available_count'] or deltas['preparation_time_total']:
+        available_after = F('available_count') + deltas['available_count']
+        updates['avg_preparation_time'] = Case(
+            When(
+                available_count__gt=-deltas['available_count'],
+                then=Cast(F('preparation_time_total') + deltas['preparation_time_total'], FloatField())
+                / available_after,
+            ),
+            default=None,
+            output_field=FloatField(),
+        )
+    if old_price != new_price:
+        updates['min_price'] = _price_bound('min_price', old_price, new_price, Min)
+        updates['max_price'] = _price_bound('max_price', old_price, new_price, Max)
+
+    if not updates:
+        return True
+    return RestaurantMenuSummary.objects.filter(pk=restaurant_id).update(**updates) > 0
+
+
+def _price_bound(field, old_price, new_price, aggregate):
+    """
+    Expression for the new ``min_price``/``max_price`` of one restaurant.
+
+    Adding a price only ever widens the range. Removing one that sat on the
+    bound requires a recount, done by a correlated subquery that already sees
+    the menu item's new state.
+    """
+    current = F(field)
+    if new_price is None:
+        widened = current
+    else:
+        beyond = {f'{field}__gt' if aggregate is Min else f'{field}__lt': new_price}
+        widened = Case(
+            When(**{f'{field}__isnull': True}, then=new_price),
+            When(**beyond, then=new_price),
+            default=current,
+            output_field=PRICE_FIELD,
+        )
+    if old_price is None:
+        return widened
+
+    recount = Subquery(
+        MenuItem.objects.filter(restaurant_id=OuterRef('pk'), is_available=True)
+        .order_by()
+        .values('restaurant_id')
+        .annotate(bound=aggregate('price'))
+        .values('bound')[:1]
+    )
+    on_bound = {f'{field}__gte' if aggregate is Min else f'{field}__lte': old_price}
+    return Case(When(**on_bound, then=recount), default=widened, output_field=PRICE_FIELD)
+
+
+def compute_summaries(restaurant_ids=None):
+    """Recount summaries from ``MenuItem`` in one grouped query"""
+    available = Q(is_available=True)
+    queryset = MenuItem.objects.order_by()
+    if restaurant_ids is not None:
+        queryset = queryset.filter(restaurant_id__in=restaurant_ids)
+    rows = queryset.values('restaurant_id').annotate(
+        item_count=Count('id'),
+        available_count=Count('id', filter=available),
+        vegetarian_count=Count('id', filter=available & Q(is_vegetarian=True)),
+        vegan_count=Count('id', filter=available & Q(is_vegan=True)),
+        min_price=Min('price', filter=available),
+        max_price=Max('price', filter=available),
+        preparation_time_total=Sum('preparation_time', filter=available),
+        avg_preparation_time=Avg('preparation_time', filter=available),
+    )
+    summaries = {}
+    for row in rows:
+        restaurant_id = row.pop('restaurant_id')
+        row['preparation_time_total'] = row['preparation_time_total'] or 0
+        summaries[restaurant_id] = row
+    return summaries
+
+
+def empty_summary():
+    values = dict.fromkeys(COUNTER_FIELDS, 0)
+    values.update(min_price=None, max_price=None, avg_preparation_time=None)
+    return values
+
+
+def rebuild_summary(restaurant_id):
+    values = compute_summaries([restaurant_id]).get(restaurant_id, empty_summary())
+    RestaurantMenuSummary.objects.update_or_create(restaurant_id=restaurant_id, defaults=values)
+
+
+def rebuild_all_summaries(batch_size=1000):
+    """Replace every summary row with a fresh recount; returns the row count"""
+    summaries = compute_summaries()
+    with transaction.atomic():
+        RestaurantMenuSummary.objects.all().delete()
+        batch = []
+        count = 0
+        for restaurant_id in Restaurant.objects.values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            values = summaries.get(restaurant_id, empty_summary())
+            batch.append(RestaurantMenuSummary(restaurant_id=restaurant_id, **values))
+            if len(batch) >= batch_size:
+                RestaurantMenuSummary.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            RestaurantMenuSummary.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def verify_summaries():
+    """
+    Compare stored summaries with a fresh recount.
+
+    Returns a list of ``(restaurant_id, field, stored, expected)`` tuples;
+    an empty list means every summary is correct.
+    """
+    expected = compute_summaries()
+    stored = {
+        row.pop('restaurant_id'): row
+        for row in RestaurantMenuSummary.objects.values('restaurant_id', *COMPARED_FIELDS)
+    }
+    mismatches = []
+    for restaurant_id in Restaurant.objects.values_list('pk', flat=True).iterator():
+        want = expected.get(restaurant_id, empty_summary())
+        have = stored.pop(restaurant_id, None)
+        if have is None:
+            mismatches.append((restaurant_id, 'row', None, 'missing'))
+            continue
+        for field in COMPARED_FIELDS:
+            if not _same(have[field], want[field]):
+                mismatches.append((restaurant_id, field, have[field], want[field]))
+    for restaurant_id in stored:
+        mismatches.append((restaurant_id, 'row', 'orphaned', None))
+    return mismatches
+
+
+def _same(stored, expected):
+    if stored is None or expected is None:
+        return stored is expected
+    if isinstance(expected, float):
+        return abs(stored - expected) < 1e-6
+    return stored == expected
@@ -0,0 +1,38 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from restaurant.images import VARIANTS, is_stale
+
+register = template.Library()
+
+
+def srcset(files):
+    return format_html_join(', ', '{} {}w', ((default_storage.url(name), width) for width, name in files))
+
+
+@register.simple_tag
+def responsive_image(obj, field_name, variant, alt='', css_class=''):
+    """
+    ``<picture>`` with the WebP and JPEG ``variant`` of ``obj.<field_name>``,
+    or a plain ``<img>`` of the upload while its variants are not ready::
+
+        {% responsive_image restaurant 'logo' 'avatar' alt=restaurant.name css_class='w-12 h-12' %}
+    """
+    image = getattr(obj, field_name)
+    if not image:
+        return ''
+    entry = (obj.image_variants or {}).get(field_name)
+    files = None if is_stale(image.name, entry) else entry['variants'].get(variant)
+    if not files:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">', image.url, alt, css_class,
+        )
+    width, height, sizes = VARIANTS[variant]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="lazy" decoding="async"></picture>',
+        srcset(files['webp']), sizes, default_storage.url(files['jpeg'][0][1]), srcset(files['jpeg']), sizes,
+        width, height, alt, css_class,
+    )
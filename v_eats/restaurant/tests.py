@@ -1,3 +1,1480 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import BytesIO, StringIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import Http404, JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from PIL import Image
+
+from v_eats.instrumentation import RequestMetrics, RequestMetricsMiddleware, histogram
+
+from . import api, blobs, geo, hours, images, menus, reviews, views
+from .benchmarks import compare_results, make_rng
+from .autocomplete import AutocompleteIndex, MENU_ITEM, RESTAURANT, reset_autocomplete_index
+from .export import ExportError, apply_filters, export_chunks
+from .menu_import import MenuImportError, import_menu_file
+from .cart import COOKIE_NAME, Cart
+from .checkout import CheckoutError, place_order
+from .models import (
+    MenuItem, Order, Restaurant, RestaurantMenuSummary, RestaurantOpenSlot, Review, StoredBlob,
+)
+from .search import IContainsSearchBackend, get_search_backend, search_restaurants
+from .stats import get_dashboard_stats
+from .summary import verify_summaries
+from .pagination import CursorPaginator
+
+
+def create_restaurant(owner, **kwargs):
+    defaults = {
+        'name': 'Test Restaurant',
+        'description': 'A place to eat',
+        'address': '1 Main Street',
+        'phone': '555-0100',
+        'email': 'owner@example.com',
+        'status': 'active',
+        'opening_time': datetime.time(9, 0),
+        'closing_time': datetime.time(21, 0),
+    }
+    defaults.update(kwargs)
+    return Restaurant.objects.create(owner=owner, **defaults)
+
+
+def create_menu_item(restaurant, **kwargs):
+    defaults = {
+        'name': 'Jollof Rice',
+        'description': 'Smoky party rice',
+        'price': '12.50',
+        'category': 'main_course',
+    }
+    defaults.update(kwargs)
+    return MenuItem.objects.create(restaurant=restaurant, **defaults)
+
+
+class QueryScalingMixin:
+    """Fail when a page's query count grows with the number of rows it lists"""
+
+    def assertQueriesDoNotScale(self, url, add_rows, sizes=(1, 6)):
+        counts = []
+        added = 0
+        for size in sizes:
+            add_rows(size - added)
+            added = size
+            # Cached fragments would hide per-row queries
+            cache.clear()
+            caches['fragments'].clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append((size, captured.captured_queries))
+
+        (few_rows, few_queries), (many_rows, many_queries) = counts[0], counts[-1]
+        if len(many_queries) > len(few_queries):
+            # Group statements that differ only in their literal values
+            shapes = Counter(re.sub(r"'[^']*'|\b\d+\b", '?', query['sql']) for query in many_queries)
+            sql, repeats = shapes.most_common(1)[0]
+            self.fail(
+                f'{url}: {len(few_queries)} queries for {few_rows} rows but {len(many_queries)} '
+                f'for {many_rows}; repeated {repeats} times: {sql}'
+            )
+
+
+class RestaurantSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        cls.pizza = create_restaurant(cls.owner, name='Pizza Palace', description='Wood fired ovens')
+        cls.grill = create_restaurant(
+            cls.owner, name='Suya Grill', description='Spicy grilled meat and pizza on Fridays'
+        )
+        cls.cafe = create_restaurant(cls.owner, name='Corner Cafe', address='12 Pizzeria Road')
+
+    def test_index_is_available(self):
+        self.assertTrue(get_search_backend().is_available())
+
+    def test_prefix_search_ranks_name_matches_first(self):
+        results = list(search_restaurants(Restaurant.objects.all(), 'pizz'))
+        self.assertEqual(results[0], self.pizza)
+        self.assertEqual(set(results), {self.pizza, self.grill, self.cafe})
+
+    def test_all_tokens_must_match(self):
+        results = list(search_restaurants(Restaurant.objects.all(), 'spicy pizza'))
+        self.assertEqual(results, [self.grill])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.grill.name = 'Suya Spot'
+        self.grill.description = 'Grilled meat'
+        self.grill.save()
+        results = list(search_restaurants(Restaurant.objects.all(), 'pizza'))
+        self.assertNotIn(self.grill, results)
+
+        self.pizza.delete()
+        results = list(search_restaurants(Restaurant.objects.all(), 'pizz'))
+        self.assertEqual(results, [self.cafe])
+
+    def test_fallback_backend_matches_substrings(self):
+        results = IContainsSearchBackend().search(Restaurant.objects.all(), 'fire')
+        self.assertEqual(list(results), [self.pizza])
+
+    def test_list_view_uses_search(self):
+        response = self.client.get(reverse('restaurant:list'), {'search': 'suya'})
+        self.assertEqual(list(response.context['restaurants']), [self.grill])
+
+
+class AutocompleteIndexTests(TestCase):
+    def setUp(self):
+        self.index = AutocompleteIndex()
+        self.index.extend([
+            (RESTAURANT, 1, 'Pizza Palace', 4.5, None),
+            (RESTAURANT, 2, 'Palace Grill', 3.0, None),
+            (MENU_ITEM, 10, 'Pepperoni Pizza', 0.0, 2),
+        ])
+
+    def test_whole_name_prefix_ranks_first(self):
+        names = [result['name'] for result in self.index.search('pa')]
+        self.assertEqual(names, ['Palace Grill', 'Pizza Palace'])
+
+    def test_word_prefix_and_multi_word_prefix(self):
+        names = [result['name'] for result in self.index.search('pizza')]
+        self.assertEqual(names, ['Pizza Palace', 'Pepperoni Pizza'])
+        self.assertEqual(self.index.search('pizza pal')[0]['id'], 1)
+
+    def test_trigram_fallback_tolerates_typos(self):
+        names = [result['name'] for result in self.index.search('pepperonni')]
+        self.assertEqual(names, ['Pepperoni Pizza'])
+
+    def test_prefix_matches_are_ranked_before_the_limit(self):
+        # The best match sorts after more than MAX_CANDIDATES weaker ones
+        self.index.extend([(MENU_ITEM, 100 + number, f'Pizza {number:03}', 0.0, 2) for number in range(5)])
+        self.index.add(RESTAURANT, 3, 'Pizza Zone', weight=5.0)
+        with mock.patch('restaurant.autocomplete.MAX_CANDIDATES', 3):
+            self.assertEqual(self.index.search('pizza', limit=1)[0]['name'], 'Pizza Zone')
+
+    def test_trigram_scan_stops_at_the_candidate_limit(self):
+        # Names sharing one trigram each with the query, spread over several postings
+        self.index.extend([
+            (MENU_ITEM, 100 + number, f'{prefix} {number}', 0.0, 2)
+            for number, prefix in enumerate(['jol'] * 5 + ['oll'] * 5 + ['lof'] * 5)
+        ])
+        with mock.patch('restaurant.autocomplete.MAX_CANDIDATES', 3), \
+                mock.patch('restaurant.autocomplete.MIN_TRIGRAM_SCORE', 0):
+            self.assertEqual(len(self.index._trigram_matches('jollof', exclude={})), 3)
+
+    def test_remove_restaurant_drops_its_menu_items(self):
+        self.index.remove_restaurant(2)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search('pepperoni'), [])
+
+
+class AutocompleteViewTests(TestCase):
+    def setUp(self):
+        reset_autocomplete_index()
+        self.addCleanup(reset_autocomplete_index)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        self.restaurant = create_restaurant(self.owner, name='Mama Put')
+
+    def test_results_follow_model_changes(self):
+        url = reverse('restaurant:autocomplete')
+        self.assertEqual(self.client.get(url, {'q': 'ma'}).json()['results'][0]['name'], 'Mama Put')
+
+        item = create_menu_item(self.restaurant, name='Moi Moi')
+        results = self.client.get(url, {'q': 'moi'}).json()['results']
+        self.assertEqual(results, [
+            {'type': 'menu_item', 'id': item.pk, 'name': 'Moi Moi', 'restaurant_id': self.restaurant.pk},
+        ])
+
+        item.is_available = False
+        item.save()
+        self.assertEqual(self.client.get(url, {'q': 'moi'}).json()['results'], [])
+
+        self.restaurant.status = 'inactive'
+        self.restaurant.save()
+        self.assertEqual(self.client.get(url, {'q': 'ma'}).json()['results'], [])
+
+    def test_index_picks_up_other_processes_edits(self):
+        url = reverse('restaurant:autocomplete')
+        self.assertEqual(self.client.get(url, {'q': 'suya'}).json()['results'], [])
+        # Saved by another worker: no signal reaches this process's index
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(name='Suya Spot')
+        self.assertEqual(self.client.get(url, {'q': 'suya'}).json()['results'], [])
+        with mock.patch('restaurant.autocomplete.INDEX_MAX_AGE', -1):
+            results = self.client.get(url, {'q': 'suya'}).json()['results']
+        self.assertEqual([result['name'] for result in results], ['Suya Spot'])
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        self.restaurant = create_restaurant(self.owner)
+        create_menu_item(self.restaurant, name='Salad', category='appetizer', is_vegetarian=True, is_vegan=True)
+        create_menu_item(self.restaurant, name='Fried Rice', is_vegetarian=True)
+        create_menu_item(self.restaurant, name='Pepper Soup', is_available=False)
+
+    def test_stats_use_one_query_then_cache(self):
+        self.restaurant.refresh_from_db()
+        generation = self.restaurant.menu_generation
+        with self.assertNumQueries(1):
+            stats = get_dashboard_stats(self.restaurant.pk, generation)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_stats(self.restaurant.pk, generation), stats)
+
+        self.assertEqual(stats['total_items'], 3)
+        self.assertEqual(stats['available_items'], 2)
+        self.assertEqual(stats['vegetarian_items'], 2)
+        self.assertEqual(stats['vegan_items'], 1)
+        by_category = {row['category']: row['count'] for row in stats['category_counts']}
+        self.assertEqual(by_category['appetizer'], 1)
+        self.assertEqual(by_category['main_course'], 2)
+        self.assertEqual(by_category['dessert'], 0)
+
+    def test_menu_item_changes_invalidate_cache(self):
+        get_dashboard_stats(self.restaurant.pk)
+        item = create_menu_item(self.restaurant, name='Chin Chin', category='dessert')
+        self.assertEqual(get_dashboard_stats(self.restaurant.pk)['total_items'], 4)
+        item.delete()
+        self.assertEqual(get_dashboard_stats(self.restaurant.pk)['total_items'], 3)
+
+    def test_moved_items_update_both_restaurants(self):
+        other = create_restaurant(self.owner, name='Other Place')
+        get_dashboard_stats(self.restaurant.pk)
+        get_dashboard_stats(other.pk)
+        item = MenuItem.objects.get(name='Salad')
+        item.restaurant = other
+        item.save()
+        self.assertEqual(get_dashboard_stats(self.restaurant.pk)['total_items'], 2)
+        self.assertEqual(get_dashboard_stats(other.pk)['total_items'], 1)
+
+    def test_stats_cached_by_another_worker_are_not_reused(self):
+        self.assertEqual(get_dashboard_stats(self.restaurant.pk)['vegetarian_items'], 2)
+        # A bulk write another process made, signalled through the database only
+        MenuItem.objects.filter(restaurant=self.restaurant).update(is_vegetarian=False)
+        menus.invalidate_menu(self.restaurant.pk)
+        self.assertEqual(get_dashboard_stats(self.restaurant.pk)['vegetarian_items'], 0)
+
+    def test_dashboard_query_count(self):
+        self.client.force_login(self.owner)
+        url = reverse('restaurant:dashboard', kwargs={'pk': self.restaurant.pk})
+        # session, user, profile (base.html), restaurant, stats, recent items
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual(response.context['total_items'], 3)
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+
+class MenuSummaryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        self.restaurant = create_restaurant(self.owner)
+
+    def summary(self):
+        return RestaurantMenuSummary.objects.get(restaurant=self.restaurant)
+
+    def test_new_restaurant_gets_empty_summary(self):
+        summary = self.summary()
+        self.assertEqual(summary.item_count, 0)
+        self.assertIsNone(summary.min_price)
+        self.assertIsNone(summary.avg_preparation_time)
+
+    def test_deltas_match_a_full_recount(self):
+        cheap = create_menu_item(self.restaurant, name='Puff Puff', price='2.00', preparation_time=5, is_vegetarian=True)
+        create_menu_item(self.restaurant, name='Suya', price='9.00', preparation_time=25)
+        pricey = create_menu_item(self.restaurant, name='Asun', price='15.00', preparation_time=30, is_vegan=True)
+
+        summary = self.summary()
+        self.assertEqual(summary.item_count, 3)
+        self.assertEqual(summary.min_price, Decimal('2.00'))
+        self.assertEqual(summary.max_price, Decimal('15.00'))
+        self.assertEqual(summary.avg_preparation_time, 20)
+        self.assertEqual(verify_summaries(), [])
+
+        # Removing the current bounds falls back to the remaining items
+        cheap.is_available = False
+        cheap.save()
+        pricey.delete()
+        summary = self.summary()
+        self.assertEqual((summary.item_count, summary.available_count), (2, 1))
+        self.assertEqual((summary.min_price, summary.max_price), (Decimal('9.00'), Decimal('9.00')))
+        self.assertEqual((summary.vegetarian_count, summary.vegan_count), (0, 0))
+        self.assertEqual(summary.avg_preparation_time, 25)
+        self.assertEqual(verify_summaries(), [])
+
+    def test_deleting_restaurant_removes_summary(self):
+        create_menu_item(self.restaurant)
+        self.restaurant.delete()
+        self.assertFalse(RestaurantMenuSummary.objects.exists())
+
+    def test_rebuild_command_repairs_drift(self):
+        create_menu_item(self.restaurant)
+        RestaurantMenuSummary.objects.update(item_count=99)
+        self.assertEqual(len(verify_summaries()), 1)
+        call_command('rebuild_menu_summaries', stdout=StringIO())
+        self.assertEqual(self.summary().item_count, 1)
+
+    def test_list_view_filters_and_sorts_on_summary(self):
+        veggie = create_restaurant(self.owner, name='Green Bowl')
+        create_menu_item(veggie, name='Salad', price='8.00', is_vegetarian=True)
+        create_menu_item(self.restaurant, name='Burger', price='6.00')
+
+        response = self.client.get(reverse('restaurant:list'), {'vegetarian': '1'})
+        self.assertEqual(list(response.context['restaurants']), [veggie])
+
+        response = self.client.get(reverse('restaurant:list'), {'sort': 'price'})
+        self.assertEqual(list(response.context['restaurants']), [self.restaurant, veggie])
+
+        response = self.client.get(reverse('restaurant:list'), {'max_price': '7'})
+        self.assertEqual(list(response.context['restaurants']), [self.restaurant])
+
+    def test_non_finite_max_price_is_ignored(self):
+        create_menu_item(self.restaurant, price='6.00')
+        for value in ('NaN', 'sNaN', 'Infinity', '-Infinity', 'cheap'):
+            with self.subTest(value=value):
+                response = self.client.get(reverse('restaurant:list'), {'max_price': value})
+                self.assertEqual(list(response.context['restaurants']), [self.restaurant])
+                response = self.client.get(
+                    reverse('api:restaurant_list', kwargs={'version': 'v1'}), {'max_price': value})
+                self.assertEqual(response.status_code, 200)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        # Repeated ratings force the created_at/id tie-breakers to do their job
+        for number in range(10):
+            create_restaurant(cls.owner, name=f'Restaurant {number}', rating=number % 3)
+        cls.ordering = ('-rating', '-created_at', '-id')
+        cls.expected = list(Restaurant.objects.order_by(*cls.ordering))
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = CursorPaginator(Restaurant.objects.all(), 3, self.ordering)
+        page = paginator.get_page(None)
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_page_number())
+            pages.append(page)
+        self.assertEqual([row for page in pages for row in page], self.expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4])
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.get_page(pages[2].previous_page_number())
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertEqual(back.number, 2)
+        first = paginator.get_page(back.previous_page_number())
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_tokens_fall_back_to_first_page(self):
+        paginator = CursorPaginator(Restaurant.objects.all(), 3, self.ordering)
+        for token in ('1', 'not-a-token', 'W10'):
+            self.assertEqual(list(paginator.get_page(token)), self.expected[:3])
+
+    def test_tampered_tokens_fall_back_to_first_page(self):
+        paginator = CursorPaginator(Restaurant.objects.all(), 3, self.ordering)
+        row = paginator.encode(2, True, self.expected[2])
+        values = json.loads(base64.urlsafe_b64decode(row + '=' * (-len(row) % 4)))[2]
+        for payload in ('[1e999,"n",%s]' % json.dumps(values), '[2,"n",[null,null,null]]',
+                        '[true,"n",%s]' % json.dumps(values), '[2.5,"n",%s]' % json.dumps(values)):
+            with self.subTest(payload=payload):
+                token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+                self.assertEqual(list(paginator.get_page(token)), self.expected[:3])
+                response = self.client.get(reverse('restaurant:list'), {'page': token})
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(reverse('api:restaurant_list', kwargs={'version': 'v1'}), {'page': token})
+                self.assertEqual(response.status_code, 200)
+
+    def test_list_view_runs_no_count_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('restaurant:list'))
+        self.assertEqual(list(response.context['restaurants']), self.expected[:12])
+        self.assertFalse(response.context['is_paginated'])
+
+    def test_manage_menu_cursor_pages(self):
+        restaurant = self.expected[0]
+        for number in range(14):
+            create_menu_item(restaurant, name=f'Dish {number:02d}')
+        self.client.force_login(self.owner)
+        url = reverse('restaurant:manage_menu', kwargs={'pk': restaurant.pk})
+        first = self.client.get(url).context['menu_items']
+        self.assertTrue(first.has_next())
+        second = self.client.get(url, {'page': first.next_page_number()}).context['menu_items']
+        self.assertEqual([item.name for item in second], ['Dish 12', 'Dish 13'])
+        self.assertFalse(second.has_next())
+
+
+class RestaurantCardCacheTests(TestCase):
+    def setUp(self):
+        caches['fragments'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass12345')
+        self.restaurant = create_restaurant(self.owner, name='Buka Hut')
+
+    def test_cards_are_served_from_cache_until_updated(self):
+        url = reverse('restaurant:list')
+        self.assertContains(self.client.get(url), 'Buka Hut')
+
+        # A queryset update leaves updated_at alone, so the cached card is reused
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(name='Buka Palace')
+        self.assertContains(self.client.get(url), 'Buka Hut')
+
+        self.restaurant.refresh_from_db()
+        self.restaurant.save()
+        self.assertContains(self.client.get(url), 'Buka Palace')
+
+    def test_cards_vary_on_superuser(self):
+        url = reverse('restaurant:list')
+        self.assertNotContains(self.client.get(url), 'Manage')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(url), 'Manage')
+
+
+class AddMenuItemViewTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner)
+        self.client.force_login(self.owner)
+        self.url = reverse('restaurant:add_menu_item', args=[self.restaurant.pk])
+
+    def test_form_renders(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Add Menu Item')
+
+    def test_submit_creates_item(self):
+        response = self.client.post(self.url, {
+            'name': 'Jollof Rice', 'description': 'Smoky party jollof', 'price': '12.50',
+            'category': 'main_course', 'is_available': 'on', 'preparation_time': 20,
+        })
+        self.assertRedirects(response, reverse('restaurant:manage_menu', args=[self.restaurant.pk]))
+        self.assertTrue(self.restaurant.menu_items.filter(name='Jollof Rice').exists())
+
+
+class BenchmarkComparisonTests(TestCase):
+    def test_flags_slower_p95_and_extra_queries(self):
+        baseline = {
+            'list': {'p95_ms': 10.0, 'queries': 2},
+            'menu': {'p95_ms': 10.0, 'queries': 6},
+        }
+        current = {
+            'list': {'p95_ms': 11.0, 'queries': 2},
+            'menu': {'p95_ms': 15.0, 'queries': 7},
+            'new_view': {'p95_ms': 99.0, 'queries': 9},
+        }
+        self.assertEqual(compare_results(baseline, current, threshold=0.2), [
+            ('menu', 'p95_ms', 10.0, 15.0),
+            ('menu', 'queries', 6, 7),
+        ])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        histogram.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass', is_staff=True)
+        self.restaurant = create_restaurant(self.owner)
+        for index in range(3):
+            create_menu_item(self.restaurant, name=f'Dish {index}')
+        self.client.force_login(self.owner)
+
+    def test_server_timing_header_and_histogram(self):
+        response = self.client.get(reverse('restaurant:manage_menu', args=[self.restaurant.pk]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        metrics = self.client.get(reverse('request_metrics')).json()
+        entry = metrics['views']['GET restaurant:manage_menu']
+        self.assertEqual(entry['count'], 1)
+        self.assertGreater(entry['max_queries'], 0)
+        self.assertGreater(entry['mean_template_ms'], 0)
+
+    def test_user_is_not_loaded_for_the_header(self):
+        url = reverse('api:restaurant_menu_snapshot', kwargs={'version': 'v1', 'pk': self.restaurant.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+        self.assertEqual(histogram.snapshot()['GET api:restaurant_menu_snapshot']['max_queries'], len(queries))
+
+    def test_repeated_sql_counts_as_duplicates(self):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for item in MenuItem.objects.all():
+                Restaurant.objects.get(pk=item.restaurant_id)
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates, 2)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.logout()
+        response = self.client.get(reverse('request_metrics'))
+        self.assertEqual(response.status_code, 302)
+
+
+class QueryScalingTests(QueryScalingMixin, TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner, name='Home Kitchen')
+        self.counter = iter(range(10 ** 6))
+
+    def add_restaurants(self, count):
+        for _ in range(count):
+            create_restaurant(self.owner, name=f'Restaurant {next(self.counter)}')
+
+    def add_menu_items(self, count):
+        for _ in range(count):
+            create_menu_item(self.restaurant, name=f'Dish {next(self.counter)}')
+
+    def test_restaurant_list(self):
+        self.assertQueriesDoNotScale(reverse('restaurant:list'), self.add_restaurants)
+
+    def test_my_restaurants(self):
+        self.client.force_login(self.owner)
+        self.assertQueriesDoNotScale(reverse('restaurant:my_restaurants'), self.add_restaurants)
+
+    def test_manage_menu(self):
+        self.client.force_login(self.owner)
+        self.assertQueriesDoNotScale(
+            reverse('restaurant:manage_menu', args=[self.restaurant.pk]), self.add_menu_items)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        self.assertQueriesDoNotScale(
+            reverse('admin:restaurant_restaurant_changelist'), self.add_restaurants)
+        self.assertQueriesDoNotScale(
+            reverse('admin:restaurant_menuitem_changelist'), self.add_menu_items)
+
+
+YABA = (6.5095, 3.3711)
+SURULERE = (6.5005, 3.3489)
+IKEJA = (6.6018, 3.3515)
+LEKKI = (6.4698, 3.5852)
+
+
+class GeoTests(TestCase):
+    def test_geohash_and_covering_cells(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        cells = geo.covering_cells(*YABA, 5)
+        self.assertTrue(any(geo.geohash_encode(*SURULERE).startswith(cell) for cell in cells))
+
+    def test_kd_tree_matches_brute_force(self):
+        rng = make_rng(7)
+        points = [(rng.uniform(6.3, 6.8), rng.uniform(3.0, 3.8)) for _ in range(500)]
+        index = geo.DeliveryIndex((pk, lat, lng, 5.0, True) for pk, (lat, lng) in enumerate(points))
+        for lat, lng in points[:25]:
+            expected = {
+                pk for pk, (other_lat, other_lng) in enumerate(points)
+                if geo.haversine_km(lat, lng, other_lat, other_lng) <= 8
+            }
+            self.assertEqual(set(index.within(lat, lng, 8)), expected)
+
+    def test_delivery_index_edits(self):
+        index = geo.DeliveryIndex([(1, *YABA, 5.0, True), (2, *IKEJA, 5.0, True)])
+        self.assertEqual(set(index.delivering_to(*SURULERE)), {1})
+        # Widening a radius needs no rebuild; moving or removing goes through the overlay
+        index.add(2, *IKEJA, 15.0, True)
+        self.assertEqual(set(index.delivering_to(*SURULERE)), {1, 2})
+        index.add(1, *LEKKI, 5.0, True)
+        index.remove(2)
+        self.assertEqual(set(index.delivering_to(*SURULERE)), set())
+        self.assertEqual(set(index.delivering_to(*LEKKI)), {1})
+
+    def test_geocode_prefers_most_specific_place(self):
+        gazetteer = geo.load_gazetteer()
+        self.assertEqual(geo.geocode('12 Allen Avenue, Ikeja, Lagos', gazetteer), gazetteer['allen avenue'])
+        self.assertEqual(geo.geocode('3 Herbert Macaulay Way, Yaba', gazetteer), gazetteer['yaba'])
+        self.assertIsNone(geo.geocode('Somewhere unknown', gazetteer))
+
+
+class DeliveryAreaListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        geo.reset_delivery_index()
+        self.addCleanup(geo.reset_delivery_index)
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.yaba = create_restaurant(owner, name='Yaba Buka', address='5 Commercial Avenue, Yaba')
+        self.ikeja = create_restaurant(owner, name='Ikeja Grill', address='Allen Avenue, Ikeja')
+        self.pickup = create_restaurant(
+            owner, name='Surulere Pickup', address='Adeniran Ogunsanya, Surulere', is_delivery_available=False)
+        self.far = create_restaurant(owner, name='Lekki Kitchen', address='Admiralty Way, Lekki Phase 1')
+        call_command('geocode_restaurants', stdout=StringIO())
+
+    def listed(self, **params):
+        response = self.client.get(reverse('restaurant:list'), params)
+        return {restaurant.name for restaurant in response.context['restaurants']}
+
+    def test_geocode_command_sets_coordinates_and_geohash(self):
+        self.yaba.refresh_from_db()
+        self.assertEqual((self.yaba.latitude, self.yaba.longitude), YABA)
+        self.assertEqual(self.yaba.geohash, geo.geohash_encode(*YABA))
+
+    def test_delivers_to_and_radius_filters(self):
+        for mode in ('memory', 'database'):
+            with self.subTest(mode=mode), override_settings(GEO_INDEX=mode):
+                self.assertEqual(self.listed(near='Yaba', delivers='1'), {'Yaba Buka'})
+                self.assertEqual(self.listed(near='Yaba', radius='5'), {'Yaba Buka', 'Surulere Pickup'})
+                self.assertEqual(
+                    self.listed(lat=YABA[0], lng=YABA[1], radius='12'),
+                    {'Yaba Buka', 'Surulere Pickup', 'Ikeja Grill'},
+                )
+
+    def test_saves_update_the_loaded_index(self):
+        self.assertEqual(self.listed(near='Ikeja', delivers='1'), {'Ikeja Grill'})
+        self.yaba.refresh_from_db()
+        self.yaba.delivery_radius_km = 15
+        self.yaba.save()
+        self.assertEqual(self.listed(near='Ikeja', delivers='1'), {'Ikeja Grill', 'Yaba Buka'})
+
+    def test_invalid_coordinates_are_ignored(self):
+        everyone = {'Yaba Buka', 'Ikeja Grill', 'Surulere Pickup', 'Lekki Kitchen'}
+        for lat, lng in (('inf', 'inf'), ('nan', '1'), ('91', '3'), ('6', '-181')):
+            with self.subTest(lat=lat, lng=lng):
+                self.assertEqual(self.listed(lat=lat, lng=lng, delivers='1'), everyone)
+                self.assertEqual(self.listed(lat=lat, lng=lng, near='Ikeja', delivers='1'), {'Ikeja Grill'})
+                response = self.client.get(
+                    reverse('api:restaurant_list', kwargs={'version': 'v1'}), {'lat': lat, 'lng': lng})
+                self.assertEqual(response.status_code, 200)
+
+    def test_index_picks_up_other_processes_edits(self):
+        self.assertEqual(self.listed(near='Ikeja', delivers='1'), {'Ikeja Grill'})
+        # Saved by another worker: no signal reaches this process's index
+        Restaurant.objects.filter(pk=self.yaba.pk).update(delivery_radius_km=15)
+        self.assertEqual(self.listed(near='Ikeja', delivers='1'), {'Ikeja Grill'})
+        with mock.patch('restaurant.geo.INDEX_MAX_AGE', -1):
+            self.assertEqual(self.listed(near='Ikeja', delivers='1'), {'Ikeja Grill', 'Yaba Buka'})
+
+    def test_unknown_place_is_reported(self):
+        response = self.client.get(reverse('restaurant:list'), {'near': 'Atlantis'})
+        self.assertTrue(response.context['location_not_found'])
+
+
+class OpeningHoursTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.lunch = create_restaurant(owner, name='Lunch Spot')
+        self.late = create_restaurant(
+            owner, name='Night Owl', opening_time=datetime.time(22, 30), closing_time=datetime.time(2, 0))
+        self.always = create_restaurant(
+            owner, name='All Hours', opening_time=datetime.time(0, 0), closing_time=datetime.time(0, 0))
+
+    def listed(self, **params):
+        response = self.client.get(reverse('restaurant:list'), params)
+        return {restaurant.name for restaurant in response.context['restaurants']}
+
+    def test_open_slots_split_overnight_hours(self):
+        slots = hours.open_slots(datetime.time(22, 30), datetime.time(2, 0))
+        self.assertEqual(slots, [(0, 0, 60), (1, 60, 120), (22, 1350, 1380), (23, 1380, 1440)])
+        self.assertEqual(len(hours.open_slots(datetime.time(0, 0), datetime.time(0, 0))), 24)
+        self.assertTrue(hours.is_open_at(datetime.time(22, 30), datetime.time(2, 0), datetime.time(1, 59)))
+        self.assertFalse(hours.is_open_at(datetime.time(22, 30), datetime.time(2, 0), datetime.time(2, 0)))
+
+    def test_open_at_filter(self):
+        self.assertEqual(self.listed(open_at='12:00'), {'Lunch Spot', 'All Hours'})
+        self.assertEqual(self.listed(open_at='23:15'), {'Night Owl', 'All Hours'})
+        self.assertEqual(self.listed(open_at='05:00'), {'All Hours'})
+        self.assertEqual(self.listed(open_at='bogus'), {'Lunch Spot', 'Night Owl', 'All Hours'})
+
+    def test_both_query_plans_agree(self):
+        queryset = Restaurant.objects.all()
+        for share in (0.0, 1.0):
+            with self.subTest(share=share):
+                cache.set(hours.OPEN_SHARE_CACHE_KEY, [share] * 24)
+                self.assertEqual(
+                    set(hours.filter_open_at(queryset, datetime.time(1, 0)).values_list('name', flat=True)),
+                    {'Night Owl', 'All Hours'},
+                )
+
+    def test_slots_follow_changed_hours(self):
+        self.lunch.refresh_from_db()
+        self.lunch.closing_time = datetime.time(23, 30)
+        self.lunch.save()
+        self.assertIn('Lunch Spot', self.listed(open_at='23:15'))
+        self.assertEqual(hours.rebuild_open_slots(), RestaurantOpenSlot.objects.count())
+        self.assertIn('Lunch Spot', self.listed(open_at='23:15'))
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurant = create_restaurant(owner, rating=4.0, total_reviews=2, rating_total=8)
+        self.customers = [
+            User.objects.create_user(f'customer{n}', f'customer{n}@example.com', 'pass') for n in range(3)
+        ]
+
+    def assertRating(self, rating, total_reviews):
+        self.restaurant.refresh_from_db()
+        self.assertAlmostEqual(self.restaurant.rating, rating)
+        self.assertEqual(self.restaurant.total_reviews, total_reviews)
+
+    def test_create_change_and_delete_apply_deltas(self):
+        updated_at = self.restaurant.updated_at
+        review = reviews.submit_review(self.restaurant, self.customers[0], 1)
+        self.assertRating(3.0, 3)
+        self.assertGreater(self.restaurant.updated_at, updated_at)
+        reviews.submit_review(self.restaurant, self.customers[0], 4, 'Better the second time')
+        self.assertRating(4.0, 3)
+        self.assertEqual(Review.objects.count(), 1)
+        review.delete()
+        self.assertRating(4.0, 2)
+        self.assertEqual(reviews.rebuild_ratings(), 1)
+        self.assertRating(0.0, 0)
+
+    def test_saving_a_stale_instance_keeps_the_aggregates(self):
+        stale = Restaurant.objects.get(pk=self.restaurant.pk)
+        reviews.submit_review(self.restaurant, self.customers[0], 1)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertRating(3.0, 3)
+        self.assertEqual((self.restaurant.name, self.restaurant.rating_total), ('Renamed', 9))
+
+    def test_review_view(self):
+        url = reverse('restaurant:review', args=[self.restaurant.pk])
+        self.client.force_login(self.customers[1])
+        response = self.client.post(url, {'rating': 5, 'comment': 'Great suya'})
+        self.assertEqual(response.json(), {'success': True, 'rating': 13 / 3, 'total_reviews': 3})
+        self.assertEqual(self.client.post(url, {'rating': 9}).status_code, 400)
+        self.client.force_login(self.restaurant.owner)
+        self.assertEqual(self.client.post(url, {'rating': 5}).status_code, 403)
+
+
+class ConcurrentReviewTests(TransactionTestCase):
+    """Parallel writers on one restaurant must not lose any review"""
+
+    writers = 8
+    reviews_per_writer = 10
+
+    def test_parallel_reviews_are_all_counted(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        restaurant = create_restaurant(owner)
+        customers = User.objects.bulk_create([
+            User(username=f'customer{n}', password='!') for n in range(self.writers * self.reviews_per_writer)
+        ])
+        barrier = threading.Barrier(self.writers)
+        errors = []
+
+        def write(batch):
+            try:
+                barrier.wait()
+                for customer in batch:
+                    while True:
+                        try:
+                            reviews.submit_review(restaurant, customer, customer.pk % 5 + 1)
+                            break
+                        except OperationalError as e:
+                            # The shared-cache SQLite test database fails fast
+                            # instead of waiting for a writer; wait here
+                            if 'locked' not in str(e):
+                                raise
+                            time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=write, args=(customers[n::self.writers],)) for n in range(self.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        restaurant.refresh_from_db()
+        expected_total = sum(customer.pk % 5 + 1 for customer in customers)
+        self.assertEqual(restaurant.total_reviews, len(customers))
+        self.assertEqual(restaurant.rating_total, expected_total)
+        self.assertAlmostEqual(restaurant.rating, expected_total / len(customers))
+
+
+class MenuImportTests(TestCase):
+    header = 'name,description,price,category,is_vegan,preparation_time,notes\n'
+
+    def setUp(self):
+        cache.clear()
+        reset_autocomplete_index()
+        self.addCleanup(reset_autocomplete_index)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner)
+
+    def upload(self, body, name='menu.csv'):
+        return SimpleUploadedFile(name, (self.header + body).encode(), content_type='text/csv')
+
+    def test_valid_rows_are_imported_in_batches(self):
+        rows = ''.join(f'Dish {n},Tasty {n},{n + 1}.25,Main Course,{"yes" if n % 2 else ""},,\n' for n in range(40))
+        with CaptureQueriesContext(connection) as queries:
+            result = import_menu_file(self.restaurant, self.upload(rows), 'menu.csv', batch_size=10)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "restaurant_menuitem"')]
+        self.assertEqual(len(inserts), 4)
+        self.assertLess(len(queries), 15)
+        self.assertTrue(result.committed)
+        self.assertEqual((result.created, result.error_count), (40, 0))
+        summary = RestaurantMenuSummary.objects.get(pk=self.restaurant.pk)
+        self.assertEqual((summary.item_count, summary.vegan_count, summary.max_price), (40, 20, Decimal('40.25')))
+        self.assertEqual(MenuItem.objects.get(name='Dish 3').preparation_time, 15)
+        self.assertEqual(verify_summaries(), [])
+
+    def test_row_errors_are_reported_and_roll_back(self):
+        rows = 'Jollof,Smoky,12.50,main_course,no,20,\n,No name,5,dessert,,,\nSuya,Spicy,abc,grill,maybe,,\n'
+        result = import_menu_file(self.restaurant, self.upload(rows), 'menu.csv')
+        self.assertFalse(result.committed)
+        self.assertEqual([row for row, errors in result.errors], [3, 4])
+        self.assertEqual(set(result.errors[1][1]), {'price', 'category', 'is_vegan'})
+        self.assertFalse(MenuItem.objects.exists())
+
+        result = import_menu_file(self.restaurant, self.upload(rows), 'menu.csv', partial=True)
+        self.assertEqual((result.created, result.error_count), (1, 2))
+        self.assertEqual(list(MenuItem.objects.values_list('name', flat=True)), ['Jollof'])
+
+    def test_file_level_errors(self):
+        with self.assertRaisesMessage(MenuImportError, 'Unsupported file type'):
+            import_menu_file(self.restaurant, self.upload(''), 'menu.txt')
+        upload = SimpleUploadedFile('menu.csv', b'name,price\nRice,2\n')
+        with self.assertRaisesMessage(MenuImportError, 'description, category'):
+            import_menu_file(self.restaurant, upload, 'menu.csv')
+
+    def test_non_utf8_csv_is_reported(self):
+        body = (self.header + 'Rice,Plain,2,Main Course,,,\nCr\u00eape,Sweet,4,Dessert,,,\n').encode('cp1252')
+        with self.assertRaisesMessage(MenuImportError, 'not UTF-8 CSV'):
+            import_menu_file(self.restaurant, SimpleUploadedFile('menu.csv', body), 'menu.csv', batch_size=1)
+        self.assertFalse(MenuItem.objects.exists())
+
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('restaurant:import_menu', args=[self.restaurant.pk]),
+            {'file': SimpleUploadedFile('menu.csv', body, content_type='text/csv')},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('not UTF-8 CSV', str(response.context['form'].errors['file']))
+
+    def test_import_view(self):
+        self.client.force_login(self.owner)
+        url = reverse('restaurant:import_menu', args=[self.restaurant.pk])
+        response = self.client.post(url, {'file': self.upload('Zobo,Hibiscus drink,3,Beverage,yes,5,\n')})
+        self.assertRedirects(response, reverse('restaurant:manage_menu', args=[self.restaurant.pk]))
+        self.assertEqual(MenuItem.objects.get().category, 'beverage')
+
+        response = self.client.post(url, {'file': self.upload('Zobo,,3,Beverage,,,\n')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].errors, [(2, {'description': ['This field is required.']})])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.active = create_restaurant(self.admin, name='Mama Put, Yaba')
+        self.pending = create_restaurant(self.admin, name='Pending Place', status='pending')
+        create_menu_item(self.active, name='Jollof Rice')
+        create_menu_item(self.active, name='Zobo', category='beverage', is_vegan=True)
+
+    def test_csv_and_json_round_trip(self):
+        rows = list(csv.DictReader(StringIO(''.join(export_chunks(Restaurant.objects.all(), 'csv')))))
+        self.assertEqual([row['name'] for row in rows], ['Mama Put, Yaba', 'Pending Place'])
+        self.assertEqual(rows[0]['owner__username'], 'admin')
+
+        items = json.loads(''.join(export_chunks(MenuItem.objects.all(), 'json')))
+        self.assertEqual([item['name'] for item in items], ['Jollof Rice', 'Zobo'])
+        self.assertEqual(items[0]['price'], '12.50')
+        self.assertEqual(json.loads(''.join(export_chunks(MenuItem.objects.none(), 'json'))), [])
+
+    def test_filters_follow_list_filter(self):
+        allowed = ('status', 'is_delivery_available', 'created_at')
+        queryset = apply_filters(
+            Restaurant.objects.all(), {'status': 'pending', 'is_delivery_available': 'yes'}, allowed)
+        self.assertEqual(list(queryset), [self.pending])
+        self.assertFalse(apply_filters(Restaurant.objects.all(), {'created_at__gte': '2999-01-01'}, allowed))
+        with self.assertRaisesMessage(ExportError, 'Cannot filter on "name"'):
+            apply_filters(Restaurant.objects.all(), {'name': 'x'}, allowed)
+
+    def test_command_writes_filtered_rows(self):
+        stdout = StringIO()
+        call_command(
+            'export_catalogue', 'menu_items', '--format', 'json',
+            '--filter', 'is_vegan=true', '--filter', 'restaurant__name=Mama Put, Yaba', stdout=stdout,
+        )
+        self.assertEqual([item['name'] for item in json.loads(stdout.getvalue())], ['Zobo'])
+
+    def test_admin_action_streams_the_selection(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:restaurant_restaurant_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.pending.pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="restaurant-', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row[1] for row in rows[1:]], ['Pending Place'])
+
+
+def image_upload(name, size=(1000, 600), mode='RGB', format='PNG'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128) if mode == 'RGBA' else (200, 80, 40)).save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+
+@override_settings(IMAGE_PIPELINE_WORKER='command')
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media, MEDIA_URL='/media/')
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+
+    def render(self, obj, field_name, variant):
+        template = Template("{% load restaurant_images %}{% responsive_image obj field variant alt='Pic' %}")
+        return template.render(Context({'obj': obj, 'field': field_name, 'variant': variant}))
+
+    def test_upload_is_queued_and_rendered_with_content_hash_names(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            restaurant = create_restaurant(
+                self.owner, image=image_upload('front.png'), logo=image_upload('logo.png', (300, 300), 'RGBA'))
+        self.assertEqual(len(callbacks), 2)
+        self.assertIn('<img src="/media/blobs/', self.render(restaurant, 'image', 'card'))
+
+        self.assertEqual(images.process_pending(), 2)
+        restaurant.refresh_from_db()
+        card = restaurant.image_variants['image']['variants']['card']
+        self.assertEqual([width for width, name in card['webp']], [400, 800])
+        digest = restaurant.image_variants['image']['digest']
+        self.assertEqual(card['jpeg'][1][1], f'variants/{digest[:2]}/{digest[:32]}-card-800x384.jpeg')
+        with Image.open(f'{self.media}/{card["webp"][0][1]}') as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (400, 192)))
+        logo = restaurant.image_variants['logo']['variants']['avatar']
+        with Image.open(f'{self.media}/{logo["jpeg"][0][1]}') as thumbnail:
+            self.assertEqual((thumbnail.mode, thumbnail.size), ('RGB', (48, 48)))
+
+        html = self.render(restaurant, 'image', 'card')
+        self.assertIn('<source type="image/webp" srcset="/media/variants/', html)
+        self.assertIn('-card-800x384.webp 800w', html)
+        self.assertIn('width="400" height="192"', html)
+        # Nothing is stale any more, so nothing is rendered twice
+        self.assertEqual(images.process_pending(), 0)
+
+    def test_small_sources_only_get_1x_and_identical_uploads_share_files(self):
+        restaurant = create_restaurant(self.owner)
+        first = create_menu_item(restaurant, image=image_upload('a.png', (60, 60)))
+        second = create_menu_item(restaurant, name='Suya', image=image_upload('b.png', (60, 60)))
+        for item in (first, second):
+            images.process_image(MenuItem, item.pk, 'image')
+            item.refresh_from_db()
+        variants = first.image_variants['image']['variants']
+        self.assertEqual(len(variants['card']['jpeg']), 1)
+        self.assertEqual(len(variants['avatar']['jpeg']), 1)
+        self.assertEqual(variants, second.image_variants['image']['variants'])
+
+    def test_replaced_or_cleared_image_falls_back_until_reprocessed(self):
+        item = create_menu_item(create_restaurant(self.owner), image=image_upload('dish.png'))
+        images.process_image(MenuItem, item.pk, 'image')
+        item.refresh_from_db()
+        stamp = item.updated_at
+
+        item.image = image_upload('new-dish.png', (900, 900))
+        with self.captureOnCommitCallbacks() as callbacks:
+            item.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotIn('<picture>', self.render(item, 'image', 'avatar'))
+        self.assertTrue(images.process_image(MenuItem, item.pk, 'image'))
+        item.refresh_from_db()
+        self.assertGreater(item.updated_at, stamp)
+        self.assertIn('<picture>', self.render(item, 'image', 'avatar'))
+
+        MenuItem.objects.filter(pk=item.pk).update(image='')
+        self.assertEqual(images.process_pending(), 1)
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, {})
+
+
+@override_settings(IMAGE_PIPELINE_WORKER='command')
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.restaurant = create_restaurant(User.objects.create_user('owner', 'owner@example.com', 'pass'))
+
+    def blob_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media)
+            for directory, _, names in os.walk(self.media) for name in names
+        )
+
+    def test_duplicate_uploads_share_one_counted_blob(self):
+        first = create_menu_item(self.restaurant, image=image_upload('one.png'))
+        second = create_menu_item(self.restaurant, name='Suya', image=image_upload('one (copy).PNG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.blob_files(), [first.image.name])
+        self.assertEqual(StoredBlob.objects.get(name=first.image.name).refcount, 2)
+
+        second.delete()
+        first.image = image_upload('two.png', (200, 200))
+        first.save()
+        counts = dict(StoredBlob.objects.values_list('name', 'refcount'))
+        self.assertEqual(sorted(counts.values()), [0, 1])
+        self.assertEqual(counts[first.image.name], 1)
+
+    def test_garbage_collection_removes_unused_blobs_and_their_thumbnails(self):
+        item = create_menu_item(self.restaurant, image=image_upload('old.png'))
+        old = item.image.name
+        images.process_image(MenuItem, item.pk, 'image')
+        item.image = image_upload('new.png', (300, 300))
+        item.save()
+        kept = create_menu_item(self.restaurant, name='Kept', image=image_upload('kept.png', (80, 80)))
+        # The count drifts when the signals are bypassed, but the table is checked before deleting
+        MenuItem.objects.filter(pk=kept.pk).update(image=old)
+        stray = os.path.join(self.media, 'blobs', 'ff', 'f' * 64 + '.png')
+        os.makedirs(os.path.dirname(stray))
+        with open(stray, 'wb') as output:
+            output.write(b'left by a rolled back upload')
+
+        self.assertEqual(blobs.collect_garbage(grace=datetime.timedelta(hours=1)), (0, 0))
+        self.assertEqual(blobs.collect_garbage(grace=datetime.timedelta(0))[0], 1)
+        files = self.blob_files()
+        self.assertIn(old, files)
+        self.assertTrue(any(name.startswith('variants/') for name in files))
+        self.assertNotIn('blobs/ff/' + 'f' * 64 + '.png', files)
+        self.assertEqual(StoredBlob.objects.get(name=old).refcount, 1)
+
+        MenuItem.objects.filter(pk=kept.pk).update(image='')
+        blobs.rebuild_refcounts()
+        blobs.collect_garbage(grace=datetime.timedelta(0))
+        self.assertEqual(self.blob_files(), [item.image.name])
+
+    def test_thumbnails_shared_with_other_uploads_are_kept(self):
+        jpg = create_menu_item(self.restaurant, image=image_upload('dish.jpg'))
+        images.process_image(MenuItem, jpg.pk, 'image')
+        jpeg = create_menu_item(self.restaurant, name='Same Dish', image=image_upload('dish.jpeg'))
+        images.process_image(MenuItem, jpeg.pk, 'image')
+        self.assertNotEqual(jpg.image.name, jpeg.image.name)
+        os.makedirs(os.path.join(self.media, 'menu_items'))
+        with open(os.path.join(self.media, 'menu_items', 'legacy.jpg'), 'wb') as legacy:
+            legacy.write(image_upload('legacy.jpg').read())
+        legacy = create_menu_item(self.restaurant, name='Legacy')
+        MenuItem.objects.filter(pk=legacy.pk).update(image='menu_items/legacy.jpg')
+        images.process_image(MenuItem, legacy.pk, 'image')
+        variants = [name for name in self.blob_files() if name.startswith('variants/')]
+        self.assertTrue(variants)
+
+        jpg.delete()
+        blobs.collect_garbage(grace=datetime.timedelta(0))
+        self.assertNotIn(jpg.image.name, self.blob_files())
+        jpeg.delete()
+        blobs.collect_garbage(grace=datetime.timedelta(0))
+        # The legacy upload still shows them
+        self.assertEqual([name for name in self.blob_files() if name.startswith('variants/')], variants)
+
+    def test_legacy_uploads_are_adopted(self):
+        os.makedirs(os.path.join(self.media, 'restaurants'))
+        for name in ('photo.png', 'photo_814tpMB.png'):
+            with open(os.path.join(self.media, 'restaurants', name), 'wb') as legacy:
+                legacy.write(image_upload(name).read())
+        other = create_restaurant(self.restaurant.owner, name='Twin')
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(image='restaurants/photo.png')
+        Restaurant.objects.filter(pk=other.pk).update(image='restaurants/photo_814tpMB.png')
+
+        self.assertEqual(blobs.adopt_legacy_files(delete_originals=True), 2)
+        names = set(Restaurant.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.blob_files(), sorted(names))
+        self.assertEqual(StoredBlob.objects.get().refcount, 2)
+
+    def test_adoption_retires_stored_menus(self):
+        caches['menus'].clear()
+        self.addCleanup(caches['menus'].clear)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(status='active')
+        os.makedirs(os.path.join(self.media, 'menu_items'))
+        with open(os.path.join(self.media, 'menu_items', 'dish.png'), 'wb') as legacy:
+            legacy.write(image_upload('dish.png').read())
+        item = create_menu_item(self.restaurant)
+        MenuItem.objects.filter(pk=item.pk).update(image='menu_items/dish.png')
+        before = menus.get_menu(self.restaurant.pk)
+        self.assertIn(b'menu_items/dish.png', before.json)
+
+        blobs.adopt_legacy_files(delete_originals=True)
+        after = menus.get_menu(self.restaurant.pk)
+        self.assertNotEqual(after.generation, before.generation)
+        self.assertNotIn(b'menu_items/dish.png', after.json)
+        self.assertIn(MenuItem.objects.get(pk=item.pk).image.name.encode(), after.json)
+
+    def test_blobs_are_served_as_immutable(self):
+        item = create_menu_item(self.restaurant, image=image_upload('dish.png'))
+        # Routed only under DEBUG, which the test runner turns off
+        request = RequestFactory().get('/')
+        response = blobs.serve_immutable(request, item.image.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(blobs.serve_immutable(request, item.image.name).status_code, 304)
+        with self.assertRaises(Http404):
+            blobs.serve_immutable(RequestFactory().get('/'), item.image.name.replace('.png', '.jpg'))
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner, minimum_order=Decimal('10.00'), delivery_fee=Decimal('2.50'))
+        self.rice = create_menu_item(self.restaurant, price='4.00')
+        self.soup = create_menu_item(self.restaurant, name='Pepper Soup', price='6.50')
+        self.off = create_menu_item(self.restaurant, name='Moi Moi', price='3.00', is_available=False)
+        self.elsewhere = create_menu_item(create_restaurant(self.owner, name='Elsewhere'), name='Suya')
+
+    def test_order_snapshots_prices_with_one_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            order = place_order(self.customer, self.restaurant.pk, [(self.rice.pk, 1), (self.soup.pk, 1), (self.rice.pk, 2)])
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries].count('SELECT'), 1)
+        self.assertEqual((order.item_count, order.subtotal, order.total), (4, Decimal('18.50'), Decimal('21.00')))
+
+        MenuItem.objects.filter(pk=self.rice.pk).update(price='9.00')
+        order.refresh_from_db()
+        lines = list(order.items.order_by('name').values_list('name', 'unit_price', 'quantity', 'line_total'))
+        self.assertEqual(lines, [
+            ('Jollof Rice', Decimal('4.00'), 3, Decimal('12.00')),
+            ('Pepper Soup', Decimal('6.50'), 1, Decimal('6.50')),
+        ])
+
+    def test_every_bad_item_is_reported_and_nothing_written(self):
+        with self.assertRaises(CheckoutError) as raised:
+            place_order(self.customer, self.restaurant.pk, [
+                (self.soup.pk, 2), (self.off.pk, 1), (self.elsewhere.pk, 1), (999999, 1),
+            ])
+        self.assertEqual(sorted(raised.exception.item_ids), sorted([self.off.pk, self.elsewhere.pk, 999999]))
+        self.assertEqual(len(raised.exception.messages), 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_minimum_order_quantities_and_status(self):
+        with self.assertRaisesMessage(CheckoutError, 'The minimum order here is 10.00; add 6.00 more.'):
+            place_order(self.customer, self.restaurant.pk, [(self.rice.pk, 1)])
+        for lines in ([], [(self.rice.pk, 0)], [(self.rice.pk, 'two')], [(self.rice.pk, 51)],
+                      [(10 ** 30, 1)], [(0, 1)], [(self.rice.pk, 1.9)], [(self.rice.pk, True)], [(True, 3)]):
+            with self.subTest(lines=lines), self.assertRaises(CheckoutError):
+                place_order(self.customer, self.restaurant.pk, lines)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(status='inactive')
+        with self.assertRaisesMessage(CheckoutError, 'not taking orders'):
+            place_order(self.customer, self.restaurant.pk, [(self.soup.pk, 2)])
+
+    def test_checkout_view(self):
+        url = reverse('restaurant:checkout', args=[self.restaurant.pk])
+        self.client.force_login(self.customer)
+        response = self.client.post(
+            url, json.dumps({'items': [[self.soup.pk, 2]], 'delivery_address': '2 Side Road'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total'], '15.50')
+        self.assertEqual(Order.objects.get().delivery_address, '2 Side Road')
+
+        response = self.client.post(url, json.dumps({'items': [[self.off.pk, 5]]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['item_ids'], [self.off.pk])
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        for items in ([[10 ** 30, 1]], [[self.soup.pk, 1.9]], [[self.soup.pk, True]]):
+            with self.subTest(items=items):
+                response = self.client.post(url, json.dumps({'items': items}), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('not valid', response.json()['message'])
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner)
+        self.rice = create_menu_item(self.restaurant, price='4.00')
+        self.soup = create_menu_item(self.restaurant, name='Pepper Soup', price='6.50')
+        self.suya = create_menu_item(create_restaurant(self.owner, name='Suya Spot'), name='Suya', price='3.00')
+
+    def add(self, item, quantity=1):
+        return self.client.post(reverse('restaurant:cart_add'), {'item_id': item.pk, 'quantity': quantity})
+
+    def test_cart_is_a_compact_signed_cookie(self):
+        self.add(self.rice, 2)
+        self.add(self.soup)
+        response = self.add(self.rice)
+        self.assertEqual(response.json()['cart']['subtotal'], '18.50')
+        cookie = response.cookies[COOKIE_NAME].value
+        self.assertLess(len(cookie), 100)
+        self.assertEqual(self.client.cookies[COOKIE_NAME].value, cookie)
+
+        MenuItem.objects.filter(pk=self.rice.pk).update(price='5.00')
+        with self.assertNumQueries(1):
+            cart = self.client.get(reverse('restaurant:cart')).json()['cart']
+        self.assertEqual([(line['name'], line['quantity']) for line in cart['items']], [('Jollof Rice', 3), ('Pepper Soup', 1)])
+        self.assertEqual(cart['subtotal'], '21.50')
+
+        self.client.cookies[COOKIE_NAME] = cookie[:-2] + 'xx'
+        self.assertEqual(self.client.get(reverse('restaurant:cart')).json()['cart']['items'], [])
+
+    def test_switched_off_items_are_reconciled(self):
+        self.add(self.rice)
+        self.add(self.soup)
+        MenuItem.objects.filter(pk=self.soup.pk).update(is_available=False)
+        cart = self.client.get(reverse('restaurant:cart')).json()['cart']
+        self.assertEqual(cart['removed'], ['Pepper Soup'])
+        self.assertEqual(cart['item_count'], 1)
+        # The dropped entry was written back, so it is only reported once
+        self.assertEqual(self.client.get(reverse('restaurant:cart')).json()['cart']['removed'], [])
+
+    def test_item_from_another_restaurant_starts_a_new_cart(self):
+        self.add(self.rice)
+        response = self.add(self.suya)
+        self.assertTrue(response.json()['replaced'])
+        self.assertEqual(response.json()['cart']['restaurant_id'], self.suya.restaurant_id)
+        response = self.client.post(reverse('restaurant:cart_update'), {'item_id': self.suya.pk, 'quantity': 0})
+        self.assertEqual(response.json()['cart']['items'], [])
+        self.assertEqual(self.client.cookies[COOKIE_NAME].value, '')
+
+    @override_settings(CART_STORE='session', SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_session_store(self):
+        self.add(self.soup, 2)
+        self.assertNotIn(COOKIE_NAME, self.client.cookies)
+        self.assertEqual(self.client.session['cart'], [self.restaurant.pk, self.soup.pk, 2])
+        self.assertEqual(self.client.get(reverse('restaurant:cart')).json()['cart']['subtotal'], '13.00')
+
+    def test_checkout_from_cart(self):
+        customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        self.client.force_login(customer)
+        self.add(self.rice, 2)
+        self.add(self.soup)
+        MenuItem.objects.filter(pk=self.rice.pk).update(is_available=False)
+        url = reverse('restaurant:cart_checkout')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['item_ids'], [self.rice.pk])
+        self.assertEqual(response.json()['cart']['item_count'], 1)
+
+        response = self.client.post(url, {'delivery_address': '2 Side Road'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total'], '6.50')
+        self.assertEqual(self.client.get(reverse('restaurant:cart')).json()['cart']['items'], [])
+
+    def test_decode_ignores_malformed_data(self):
+        for data in ([], ['x'], [1, 2], [1, 2, 0, 3, 999]):
+            with self.subTest(data=data):
+                self.assertFalse(Cart.decode(data))
+        self.assertEqual(Cart.decode([1, 2, 3, 4, 5]).quantities, {2: 3, 4: 5})
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurants = [
+            create_restaurant(self.owner, name=f'Spot {n}', category='african' if n % 2 else 'chinese', rating=n)
+            for n in range(5)
+        ]
+        create_restaurant(self.owner, name='Hidden', status='pending')
+        self.rice = create_menu_item(self.restaurants[0], price='4.00')
+        self.soup = create_menu_item(self.restaurants[0], name='Pepper Soup', category='appetizer')
+        create_menu_item(self.restaurants[0], name='Moi Moi', is_available=False)
+
+    def url(self, name, pk=None):
+        kwargs = {'version': 'v1'} if pk is None else {'version': 'v1', 'pk': pk}
+        return reverse(f'api:{name}', kwargs=kwargs)
+
+    def test_list_projects_filters_and_pages_like_the_listing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url('restaurant_list'), {'fields': 'name,rating', 'category': 'african'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['results'], [{'name': 'Spot 3', 'rating': 3.0}, {'name': 'Spot 1', 'rating': 1.0}])
+        self.assertNotIn('description', queries.captured_queries[0]['sql'])
+
+        with mock.patch.object(api, 'PAGE_SIZE', 2):
+            first = self.client.get(self.url('restaurant_list'), {'fields': 'id'}).json()
+            second = self.client.get(first['next']).json()
+        self.assertNotIn('count', first)
+        self.assertEqual(
+            [row['id'] for row in first['results'] + second['results']],
+            [restaurant.pk for restaurant in self.restaurants[:0:-1]],
+        )
+
+        response = self.client.get(self.url('restaurant_list'), {'fields': 'name,owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown field: owner']})
+
+    def test_unchanged_resources_return_304(self):
+        url = self.url('restaurant_detail', self.restaurants[0].pk)
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.restaurants[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url('restaurant_detail', 999999)).status_code, 404)
+
+    def test_menu_etag_tracks_rows_on_the_page(self):
+        url = self.url('restaurant_menu', self.restaurants[0].pk)
+        response = self.client.get(url)
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Pepper Soup', 'Jollof Rice'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        MenuItem.objects.filter(pk=self.soup.pk).update(is_available=False)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Jollof Rice'])
+
+        item = self.client.get(self.url('menu_item_detail', self.rice.pk), {'fields': 'price,restaurant'}).json()
+        self.assertEqual(item, {'price': '4.00', 'restaurant': self.restaurants[0].pk})
+        self.assertEqual(self.client.get('/api/v2/restaurants/').status_code, 404)
+
+
+class MenuSnapshotTests(TestCase):
+    def setUp(self):
+        caches['menus'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurant = create_restaurant(self.owner)
+        self.rice = create_menu_item(self.restaurant, price='4.00')
+        create_menu_item(self.restaurant, name='Chin Chin', category='dessert')
+        create_menu_item(self.restaurant, name='Akara', category='appetizer')
+        create_menu_item(self.restaurant, name='Moi Moi', is_available=False)
+        self.url = reverse('api:restaurant_menu_snapshot', kwargs={'version': 'v1', 'pk': self.restaurant.pk})
+
+    def test_menu_is_served_from_the_snapshot(self):
+        response = self.client.get(self.url)
+        menu = json.loads(response.content)
+        self.assertEqual(
+            [(group['category'], [item['name'] for item in group['items']]) for group in menu['categories']],
+            [('appetizer', ['Akara']), ('dessert', ['Chin Chin']), ('main_course', ['Jollof Rice'])],
+        )
+        self.assertEqual(menu['categories'][2]['items'][0]['price'], '4.00')
+
+        # Only the generation check
+        with self.assertNumQueries(1):
+            again = self.client.get(self.url)
+        self.assertEqual(again.content, response.content)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_snapshot_is_rebuilt_after_menu_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        self.rice.price = Decimal('5.00')
+        self.rice.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['categories'][2]['items'][0]['price'], '5.00')
+
+        csv_file = BytesIO(b'name,description,price,category\nSuya,Spiced beef,3.00,main_course\n')
+        self.assertEqual(import_menu_file(self.restaurant, csv_file, 'menu.csv').created, 1)
+        names = [item['name'] for item in json.loads(self.client.get(self.url).content)['categories'][2]['items']]
+        self.assertEqual(names, ['Jollof Rice', 'Suya'])
+
+        self.restaurant.status = 'inactive'
+        self.restaurant.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_stale_rebuild_is_not_served(self):
+        generation = menus.get_menu(self.restaurant.pk).generation
+        # A rebuild that read the rows before an edit committed
+        menus.invalidate_menu(self.restaurant.pk)
+        menus.rebuild_menu(self.restaurant.pk, generation)
+        with self.assertNumQueries(3):
+            self.assertEqual(menus.get_menu(self.restaurant.pk).generation, generation + 1)
+
+    def test_edits_reach_snapshots_held_by_other_workers(self):
+        menus.get_menu(self.restaurant.pk)
+        # Another worker's cache kept its copy; only the database is shared
+        held = caches['menus'].get(menus.snapshot_key(self.restaurant.pk))
+        MenuItem.objects.filter(pk=self.rice.pk).update(price='6.00')
+        menus.invalidate_menu(self.restaurant.pk)
+        caches['menus'].set(menus.snapshot_key(self.restaurant.pk), held)
+        menu = json.loads(menus.get_menu(self.restaurant.pk).json)
+        self.assertEqual(menu['categories'][2]['items'][0]['price'], '6.00')
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        caches['menus'].clear()
+        cache.clear()
+        caches['fragments'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.restaurants = [
+            create_restaurant(self.owner, name=f'Spot {n}', category='african' if n % 2 else 'chinese', rating=n)
+            for n in range(4)
+        ]
+        self.rice = create_menu_item(self.restaurants[0], price='4.00')
+        create_menu_item(self.restaurants[0], name='Akara', category='appetizer')
+        self.factory = AsyncRequestFactory()
+
+    async def test_async_api_views_answer_with_the_same_bytes(self):
+        pk = self.restaurants[0].pk
+        cases = [
+            (api.restaurant_detail_async, reverse('api:restaurant_detail', kwargs={'version': 'v1', 'pk': pk}), pk),
+            (api.restaurant_menu_async, reverse('api:restaurant_menu', kwargs={'version': 'v1', 'pk': pk}), pk),
+            (api.menu_item_detail_async, reverse('api:menu_item_detail', kwargs={'version': 'v1', 'pk': self.rice.pk}),
+             self.rice.pk),
+            (api.restaurant_menu_snapshot_async,
+             reverse('api:restaurant_menu_snapshot', kwargs={'version': 'v1', 'pk': pk}), pk),
+        ]
+        for view, url, view_pk in cases:
+            params = {} if view is api.restaurant_menu_snapshot_async else {'fields': 'name'}
+            expected = await self.async_client.get(url, params)
+            response = await view(self.factory.get(url, params), 'v1', view_pk)
+            self.assertEqual((response.status_code, response.content), (200, expected.content), url)
+            self.assertEqual(response['ETag'], expected['ETag'])
+            response = await view(self.factory.get(url, params, headers={'If-None-Match': response['ETag']}), 'v1', view_pk)
+            self.assertEqual(response.status_code, 304)
+
+        response = await api.restaurant_detail_async(self.factory.get('/api/v1/restaurants/0/'), 'v1', 0)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'detail': 'No Restaurant matches the given query.'})
+        response = await api.restaurant_detail_async(self.factory.get('/', {'fields': 'owner'}), 'v1', pk)
+        self.assertEqual(json.loads(response.content), {'fields': ['Unknown field: owner']})
+
+    async def test_async_listing_pages_like_the_sync_view(self):
+        view = views.AsyncRestaurantListView.as_view()
+        for params, names in [
+            ({'category': 'african'}, ['Spot 3', 'Spot 1']),
+            # Summary sorts page with offsets and a count
+            ({'sort': 'price', 'page': 'last'}, ['Spot 0', 'Spot 3', 'Spot 2', 'Spot 1']),
+        ]:
+            request = self.factory.get('/restaurants/', params)
+            request.user = AnonymousUser()
+            response = await view(request)
+            await sync_to_async(response.render)()
+            self.assertEqual([restaurant.name for restaurant in response.context_data['restaurants']], names)
+            self.assertContains(response, names[0])
+
+        request = self.factory.get('/restaurants/', {'sort': 'price', 'page': '9'})
+        request.user = AnonymousUser()
+        with self.assertRaises(Http404):
+            await view(request)
+
+    async def test_async_requests_are_instrumented(self):
+        histogram.clear()
+
+        async def count_restaurants(request):
+            return JsonResponse({'count': await Restaurant.objects.acount()})
+
+        middleware = RequestMetricsMiddleware(count_restaurants)
+        response = await middleware(self.factory.get('/'))
+        self.assertEqual(json.loads(response.content), {'count': 4})
+        self.assertEqual(histogram.snapshot()['GET unresolved']['max_queries'], 1)
@@ -1,13 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'restaurant'
 
+# ASGI workers (ASYNC_VIEWS, see v_eats/asgi.py) read the listing with the async ORM
+RestaurantListView = views.AsyncRestaurantListView if settings.ASYNC_VIEWS else views.RestaurantListView
+
 urlpatterns = [
-    path('', views.RestaurantListView.as_view(), name='list'),
+    path('', RestaurantListView.as_view(), name='list'),
     path('add/', views.add_restaurant, name='add'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    path('cart/', views.cart_detail, name='cart'),
+    path('cart/add/', views.cart_update, {'add': True}, name='cart_add'),
+    path('cart/update/', views.cart_update, name='cart_update'),
+    path('cart/checkout/', views.cart_checkout, name='cart_checkout'),
     path('my-restaurants/', views.my_restaurants, name='my_restaurants'),
     path('<int:pk>/dashboard/', views.restaurant_dashboard, name='dashboard'),
     path('<int:pk>/menu/', views.manage_menu, name='manage_menu'),
     path('<int:pk>/menu/add/', views.add_menu_item, name='add_menu_item'),
+    path('<int:pk>/menu/import/', views.import_menu, name='import_menu'),
+    path('<int:pk>/review/', views.review_restaurant, name='review'),
+    path('<int:pk>/checkout/', views.checkout, name='checkout'),
 ]
@@ -1,14 +1,33 @@
+import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.db.models import Q, Count, Avg
-from django.core.paginator import Paginator
+from django.core.paginator import InvalidPage
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
+from django.views.decorators.http import require_POST
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .models import Restaurant, MenuItem
-from .forms import RestaurantForm, MenuItemForm
+from .forms import RestaurantForm, MenuItemForm, MenuImportForm, ReviewForm, CartItemForm
+from . import listing
+from .autocomplete import get_autocomplete_index
+from .stats import get_dashboard_stats
+from .pagination import CURSOR, CursorPaginator, aget_offset_page, get_pagination_mode, paginate
+from .reviews import submit_review
+from .menu_import import MenuImportError, import_menu_file
+from .checkout import CheckoutError, place_order
+from .cart import CartError, load_cart, save_cart
+
+# Columns the restaurant cards read; anything else would be a deferred
+# field loaded with one extra query per card. ``owner`` is read by the
+# ``owned_restaurants`` related manager.
+RESTAURANT_CARD_FIELDS = (
+    'id', 'owner', 'name', 'description', 'category', 'status', 'image', 'image_variants', 'rating',
+    'opening_time', 'closing_time', 'is_delivery_available', 'created_at', 'updated_at',
+)
 
 def is_admin_or_superuser(user):
     return user.is_authenticated and (user.is_superuser or user.is_staff)
@@ -38,24 +57,23 @@ def restaurant_dashboard(request, pk):
     restaurant = get_object_or_404(Restaurant, pk=pk)
 
     # Check if user has permission to access this dashboard
-    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner == request.user):
+    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner_id == request.user.pk):
         messages.error(request, "You don't have permission to access this dashboard.")
         return redirect('users:home')
 
-    # Get dashboard statistics
-    menu_items = restaurant.menu_items.all()
-    total_items = menu_items.count()
-    available_items = menu_items.filter(is_available=True).count()
-    vegetarian_items = menu_items.filter(is_vegetarian=True).count()
+    # Get dashboard statistics (one aggregate query, cached per restaurant)
+    stats = get_dashboard_stats(restaurant.pk, restaurant.menu_generation)
 
     # Get recent menu items
-    recent_items = menu_items.order_by('-created_at')[:5]
+    recent_items = restaurant.menu_items.order_by('-created_at')[:5]
 
     context = {
         'restaurant': restaurant,
-        'total_items': total_items,
-        'available_items': available_items,
-        'vegetarian_items': vegetarian_items,
+        'total_items': stats['total_items'],
+        'available_items': stats['available_items'],
+        'vegetarian_items': stats['vegetarian_items'],
+        'vegan_items': stats['vegan_items'],
+        'category_counts': stats['category_counts'],
         'recent_items': recent_items,
     }
 
@@ -68,6 +86,7 @@ def my_restaurants(request):
         restaurants = Restaurant.objects.all()
     else:
         restaurants = request.user.owned_restaurants.all()
+    restaurants = restaurants.only(*RESTAURANT_CARD_FIELDS)
 
     context = {
         'restaurants': restaurants,
@@ -81,11 +100,11 @@ def manage_menu(request, pk):
     restaurant = get_object_or_404(Restaurant, pk=pk)
 
     # Check permissions
-    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner == request.user):
+    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner_id == request.user.pk):
         messages.error(request, "You don't have permission to manage this menu.")
         return redirect('users:home')
 
-    menu_items = restaurant.menu_items.all().order_by('category', 'name')
+    menu_items = restaurant.menu_items.all()
 
     # Handle search and filtering
     search_query = request.GET.get('search', '')
@@ -99,10 +118,12 @@ def manage_menu(request, pk):
     if category_filter:
         menu_items = menu_items.filter(category=category_filter)
 
-    # Pagination
-    paginator = Paginator(menu_items, 12)
-    page_number = request.GET.get('page')
-    menu_items = paginator.get_page(page_number)
+    # Pagination (keyset or offset, see settings.PAGINATION_MODES)
+    menu_items = paginate(
+        menu_items, 12, request.GET.get('page'),
+        ordering=('category', 'name', 'id'),
+        mode=get_pagination_mode('manage_menu'),
+    )
 
     context = {
         'restaurant': restaurant,
@@ -119,7 +140,7 @@ def add_menu_item(request, pk):
     restaurant = get_object_or_404(Restaurant, pk=pk)
 
     # Check permissions
-    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner == request.user):
+    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner_id == request.user.pk):
         messages.error(request, "You don't have permission to add menu items.")
         return redirect('users:home')
 
@@ -141,32 +162,234 @@ def add_menu_item(request, pk):
 
     return render(request, 'restaurant/add_menu_item.html', context)
 
+@login_required
+def import_menu(request, pk):
+    """Bulk-add menu items from an uploaded CSV or XLSX file"""
+    restaurant = get_object_or_404(Restaurant, pk=pk)
+
+    # Check permissions
+    if not (request.user.is_superuser or request.user.is_staff or restaurant.owner_id == request.user.pk):
+        messages.error(request, "You don't have permission to import menu items.")
+        return redirect('users:home')
+
+    result = None
+    if request.method == 'POST':
+        form = MenuImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_menu_file(restaurant, upload, upload.name, partial=form.cleaned_data['partial'])
+            except MenuImportError as e:
+                form.add_error('file', str(e))
+            else:
+                if result.committed and not result.error_count:
+                    messages.success(request, f'{result.created} menu items have been imported successfully!')
+                    return redirect('restaurant:manage_menu', pk=restaurant.pk)
+    else:
+        form = MenuImportForm()
+
+    context = {
+        'form': form,
+        'restaurant': restaurant,
+        'result': result,
+    }
+
+    return render(request, 'restaurant/import_menu.html', context)
+
+@login_required
+@require_POST
+def review_restaurant(request, pk):
+    """Create or replace the current user's review, JSON in and out"""
+    restaurant = get_object_or_404(Restaurant.objects.only('pk', 'owner'), pk=pk, status='active')
+    if restaurant.owner_id == request.user.pk:
+        return JsonResponse({'success': False, 'message': "You can't review your own restaurant."}, status=403)
+
+    form = ReviewForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+    submit_review(restaurant, request.user, form.cleaned_data['rating'], form.cleaned_data['comment'])
+
+    restaurant = Restaurant.objects.only('rating', 'total_reviews').get(pk=pk)
+    return JsonResponse({'success': True, 'rating': restaurant.rating, 'total_reviews': restaurant.total_reviews})
+
+@login_required
+@require_POST
+def checkout(request, pk):
+    """
+    Place an order from a JSON body:
+    ``{"items": [[menu_item_id, quantity], ...], "delivery_address": "..."}``
+    """
+    try:
+        payload = json.loads(request.body)
+        lines = payload['items']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Send the cart as JSON.'}, status=400)
+    address = str(payload.get('delivery_address') or getattr(getattr(request.user, 'profile', None), 'address', '') or '')
+
+    try:
+        order = place_order(request.user, pk, lines, address)
+    except CheckoutError as e:
+        return JsonResponse({'success': False, 'message': ' '.join(e.messages), 'item_ids': e.item_ids}, status=400)
+    return JsonResponse({
+        'success': True,
+        'order_id': order.pk,
+        'item_count': order.item_count,
+        'subtotal': str(order.subtotal),
+        'delivery_fee': str(order.delivery_fee),
+        'total': str(order.total),
+    }, status=201)
+
+def cart_payload(cart):
+    lines = cart.lines()
+    return {
+        'restaurant_id': cart.restaurant_id,
+        'items': [
+            {
+                'id': item.pk, 'name': item.name, 'price': str(item.price), 'quantity': quantity,
+                'line_total': str(item.price * quantity),
+            }
+            for item, quantity in lines
+        ],
+        'item_count': len(cart),
+        'subtotal': str(cart.subtotal()),
+        'removed': cart.removed,
+    }
+
+def cart_detail(request):
+    """The current cart with today's prices, JSON"""
+    cart = load_cart(request)
+    return save_cart(request, JsonResponse({'success': True, 'cart': cart_payload(cart)}), cart)
+
+@require_POST
+def cart_update(request, add=False):
+    """Set (or with ``add``, increase) the quantity of one menu item"""
+    form = CartItemForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+    item_id, quantity = form.cleaned_data['item_id'], form.cleaned_data['quantity']
+
+    cart = load_cart(request)
+    restaurant_id = MenuItem.objects.filter(
+        pk=item_id, is_available=True, restaurant__status='active',
+    ).values_list('restaurant_id', flat=True).first()
+    if restaurant_id is None and quantity:
+        return JsonResponse({'success': False, 'message': 'This item is not available.'}, status=400)
+    if add:
+        quantity += cart.quantities.get(item_id, 0) if restaurant_id == cart.restaurant_id else 0
+    try:
+        replaced = cart.set(item_id, quantity, restaurant_id)
+    except CartError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    response = JsonResponse({'success': True, 'replaced': replaced, 'cart': cart_payload(cart)})
+    return save_cart(request, response, cart)
+
+@login_required
+@require_POST
+def cart_checkout(request):
+    """Place an order for the current cart and empty it"""
+    cart = load_cart(request)
+    if not cart:
+        return JsonResponse({'success': False, 'message': 'Your cart is empty.'}, status=400)
+    address = request.POST.get('delivery_address') or getattr(getattr(request.user, 'profile', None), 'address', '')
+    try:
+        order = place_order(request.user, cart.restaurant_id, list(cart.quantities.items()), address or '')
+    except CheckoutError as e:
+        # Drop what can no longer be ordered, so the customer sees the cart as it stands
+        cart.discard(e.item_ids)
+        response = JsonResponse({
+            'success': False, 'message': ' '.join(e.messages), 'item_ids': e.item_ids, 'cart': cart_payload(cart),
+        }, status=400)
+        return save_cart(request, response, cart)
+    cart.clear()
+    response = JsonResponse({'success': True, 'order_id': order.pk, 'total': str(order.total)}, status=201)
+    return save_cart(request, response, cart)
+
+def autocomplete(request):
+    """JSON suggestions for the restaurant search box"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+
+    results = get_autocomplete_index().search(query, limit) if query else []
+    return JsonResponse({'query': query, 'results': results})
+
 class RestaurantListView(ListView):
     model = Restaurant
     template_name = 'restaurant/restaurant_list.html'
     context_object_name = 'restaurants'
     paginate_by = 12
+    pagination_mode = None  # defaults to settings.PAGINATION_MODES['restaurant_list']
+    default_ordering = listing.DEFAULT_ORDERING
 
-    def get_queryset(self):
-        queryset = Restaurant.objects.filter(status='active')
-        search_query = self.request.GET.get('search', '')
-        category_filter = self.request.GET.get('category', '')
+    SORT_CHOICES = [
+        ('', 'Top Rated'),
+        ('price', 'Lowest Price'),
+        ('prep_time', 'Fastest Preparation'),
+    ]
 
-        if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(address__icontains=search_query)
-            )
+    def get_queryset(self):
+        queryset = Restaurant.objects.filter(status='active').only(*RESTAURANT_CARD_FIELDS)
+        return listing.filter_restaurants(queryset, self.request.GET)
 
-        if category_filter:
-            queryset = queryset.filter(category=category_filter)
+    def get_location(self):
+        return listing.parse_location(self.request.GET)
 
-        return queryset.order_by('-rating', '-created_at')
+    def paginate_queryset(self, queryset, page_size):
+        # Relevance and summary sorts have no stable keyset; they keep offsets
+        mode = self.pagination_mode or get_pagination_mode('restaurant_list')
+        if mode != CURSOR or not listing.uses_default_ordering(queryset):
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.default_ordering)
+        page = paginator.get_page(self.request.GET.get(self.page_kwarg))
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('search', '')
         context['category_filter'] = self.request.GET.get('category', '')
         context['categories'] = Restaurant.CATEGORY_CHOICES
+        context['vegetarian_filter'] = bool(self.request.GET.get('vegetarian'))
+        context['vegan_filter'] = bool(self.request.GET.get('vegan'))
+        context['max_price'] = self.request.GET.get('max_price', '')
+        context['sort'] = self.request.GET.get('sort', '')
+        context['sort_choices'] = self.SORT_CHOICES
+        context['near'] = self.request.GET.get('near', '')
+        context['radius'] = self.request.GET.get('radius', '')
+        context['delivers_filter'] = bool(self.request.GET.get('delivers'))
+        context['open_now_filter'] = bool(self.request.GET.get('open_now'))
+        context['open_at'] = self.request.GET.get('open_at', '')
+        context['location_not_found'] = bool(context['near'].strip()) and self.get_location() is None
         return context
+
+
+class AsyncRestaurantListView(RestaurantListView):
+    """
+    ``RestaurantListView`` for ASGI workers: the page and its count are read
+    with the async ORM, so a request waiting on the database does not tie up
+    a worker.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        # Building the queryset may load the geo or search index
+        self.object_list = await sync_to_async(self.get_queryset)()
+        self.paginated = await self.apaginate_queryset(self.object_list, self.paginate_by)
+        return self.render_to_response(self.get_context_data())
+
+    async def apaginate_queryset(self, queryset, page_size):
+        token = self.request.GET.get(self.page_kwarg)
+        mode = self.pagination_mode or get_pagination_mode('restaurant_list')
+        if mode == CURSOR and listing.uses_default_ordering(queryset):
+            paginator = CursorPaginator(queryset, page_size, self.default_ordering)
+            page = await paginator.aget_page(token)
+            return (paginator, page, page.object_list, page.has_other_pages())
+
+        try:
+            page = await aget_offset_page(self.get_paginator(queryset, page_size), token or 1)
+        except InvalidPage:
+            raise Http404('Invalid page.')
+        return (page.paginator, page, page.object_list, page.has_other_pages())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginated
@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import UserProfile, RestaurantProfile, DriverProfile
+from django.utils import timezone
+from .models import UserProfile, RestaurantProfile, DriverProfile, DriverRating, OutgoingEmail
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'role', 'phone', 'is_verified', 'date_joined')
+    list_select_related = ('user',)
     list_filter = ('role', 'is_verified', 'date_joined')
     search_fields = ('user__username', 'user__email', 'phone')
     readonly_fields = ('date_joined',)
@@ -11,6 +13,7 @@ class UserProfileAdmin(admin.ModelAdmin):
 @admin.register(RestaurantProfile)
 class RestaurantProfileAdmin(admin.ModelAdmin):
     list_display = ('business_name', 'user', 'status', 'business_phone', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('status', 'created_at')
     search_fields = ('business_name', 'user__username', 'business_license')
     readonly_fields = ('created_at',)
@@ -18,6 +21,31 @@ class RestaurantProfileAdmin(admin.ModelAdmin):
 @admin.register(DriverProfile)
 class DriverProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'vehicle_type', 'license_number', 'status', 'is_available', 'rating')
+    list_select_related = ('user',)
     list_filter = ('vehicle_type', 'status', 'is_available')
     search_fields = ('user__username', 'license_number', 'vehicle_plate')
-    readonly_fields = ('created_at', 'total_deliveries')
+    readonly_fields = ('created_at', 'total_deliveries', 'rating', 'location_updated_at')
+
+@admin.register(DriverRating)
+class DriverRatingAdmin(admin.ModelAdmin):
+    list_display = ('driver', 'user', 'rating', 'created_at')
+    list_select_related = ('driver__user', 'user')
+    list_filter = ('rating', 'created_at')
+    search_fields = ('driver__user__username', 'user__username', 'comment')
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('driver', 'user')
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('attempts', 'last_error', 'claim_token', 'claimed_at', 'sent_at', 'created_at')
+    actions = ('retry_now',)
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='SENT').update(
+            status='PENDING', attempts=0, next_attempt_at=timezone.now(), claim_token=''
+        )
+        self.message_user(request, f'{updated} email(s) queued for delivery.')
@@ -0,0 +1,260 @@
+"""
+Driver dispatch: match a pickup point to the best available driver.
+
+``DispatchIndex`` holds every approved, available driver with a known
+position, in one heap per ``(vehicle type, geohash cell)``. A pickup looks
+at its own cell first and then at rings of neighbouring cells, and takes
+the best driver from the nearest ring that has any: highest rating, then
+fewest deliveries, then shortest distance. Each bucket is a heap, so that is
+a fixed number of O(log n) heap operations however many drivers there are.
+
+The index only proposes candidates; the database decides. ``claim_driver``
+locks the driver row with ``select_for_update(skip_locked=True)`` and flips
+``is_available`` with a conditional UPDATE (just the UPDATE on backends
+without row locks), so two workers, or two processes with slightly stale
+indexes, never assign the same driver. A lost
+claim drops the driver from the local index and the next candidate is
+tried.
+
+The index is built lazily per process, kept in step by the ``DriverProfile``
+signals, and rebuilt after ``INDEX_MAX_AGE`` seconds to pick up changes
+made by other processes. ``QuerySet.update`` bypasses the signals, so the
+functions below sync the index themselves.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from restaurant.geo import geohash_cell_size, geohash_encode, haversine_km
+
+from .models import DriverProfile
+
+# Cells of about 4.9 x 4.9 km; two rings around the pickup cover ~12 km
+CELL_PRECISION = 5
+MAX_RINGS = 2
+# How many extra claims to attempt when other workers win the race
+MAX_CLAIM_ATTEMPTS = 5
+INDEX_MAX_AGE = 60
+
+VEHICLE_TYPES = tuple(code for code, label in DriverProfile.VEHICLE_TYPES)
+
+
+def dispatchable():
+    """Drivers that may be offered work"""
+    return DriverProfile.objects.filter(
+        status='APPROVED', is_available=True, latitude__isnull=False, longitude__isnull=False,
+    )
+
+
+class DispatchIndex:
+    """Available drivers bucketed by vehicle type and location cell"""
+
+    def __init__(self, drivers=()):
+        self._lock = threading.RLock()
+        # pk -> (version, vehicle_type, cell, lat, lng, rating, total_deliveries)
+        self._entries = {}
+        # (vehicle_type, cell) -> heap of (-rating, total_deliveries, pk, version)
+        self._buckets = {}
+        self._versions = itertools.count()
+        self._stale = 0
+        self.built_at = time.monotonic()
+        for pk, vehicle_type, lat, lng, rating, total_deliveries in drivers:
+            self.add(pk, vehicle_type, lat, lng, rating, total_deliveries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pk):
+        return pk in self._entries
+
+    def add(self, pk, vehicle_type, lat, lng, rating, total_deliveries):
+        """Insert a driver, or move one that is already indexed"""
+        with self._lock:
+            if pk in self._entries:
+                self._stale += 1
+            version = next(self._versions)
+            cell = geohash_encode(lat, lng, CELL_PRECISION)
+            self._entries[pk] = (version, vehicle_type, cell, lat, lng, rating, total_deliveries)
+            heapq.heappush(
+                self._buckets.setdefault((vehicle_type, cell), []),
+                (-rating, total_deliveries, pk, version),
+            )
+            self._maybe_compact()
+
+    def remove(self, pk):
+        # Heap entries are dropped lazily, when they reach the top
+        with self._lock:
+            if self._entries.pop(pk, None) is not None:
+                self._stale += 1
+                self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._stale > max(1024, len(self._entries)):
+            self._buckets = {}
+            for pk, (version, vehicle_type, cell, lat, lng, rating, deliveries) in self._entries.items():
+                self._buckets.setdefault((vehicle_type, cell), []).append((-rating, deliveries, pk, version))
+            for heap in self._buckets.values():
+                heapq.heapify(heap)
+            self._stale = 0
+
+    def _peek(self, key):
+        """The best live entry of one bucket, discarding stale ones on the way"""
+        heap = self._buckets.get(key)
+        while heap:
+            top = heap[0]
+            entry = self._entries.get(top[2])
+            if entry is not None and entry[0] == top[3]:
+                return top
+            heapq.heappop(heap)
+            self._stale -= 1
+        if heap is not None:
+            del self._buckets[key]
+        return None
+
+    def ring_cells(self, lat, lng, ring):
+        """Geohash cells at Chebyshev distance ``ring`` from the cell of ``(lat, lng)``"""
+        height, width = geohash_cell_size(CELL_PRECISION)
+        cells = set()
+        for i in range(-ring, ring + 1):
+            for j in range(-ring, ring + 1):
+                if max(abs(i), abs(j)) != ring:
+                    continue
+                cell_lat = max(-90.0, min(90.0, lat + i * height))
+                cell_lng = (lng + j * width + 180.0) % 360.0 - 180.0
+                cells.add(geohash_encode(cell_lat, cell_lng, CELL_PRECISION))
+        return cells
+
+    def best(self, lat, lng, vehicle_types=None):
+        """``(pk, distance_km)`` of the best driver near ``(lat, lng)``, or ``None``"""
+        vehicle_types = vehicle_types or VEHICLE_TYPES
+        with self._lock:
+            for ring in range(MAX_RINGS + 1):
+                candidates = []
+                for cell in self.ring_cells(lat, lng, ring):
+                    for vehicle_type in vehicle_types:
+                        top = self._peek((vehicle_type, cell))
+                        if top is not None:
+                            entry = self._entries[top[2]]
+                            distance = haversine_km(lat, lng, entry[3], entry[4])
+                            candidates.append((top[0], top[1], distance, top[2]))
+                if candidates:
+                    rating, deliveries, distance, pk = min(candidates)
+                    return pk, distance
+            return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def build_index():
+    rows = dispatchable().values_list('pk', 'vehicle_type', 'latitude', 'longitude', 'rating', 'total_deliveries')
+    return DispatchIndex(rows.iterator(chunk_size=2000))
+
+
+def get_dispatch_index():
+    global _index
+    index = _index
+    if index is None or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+        with _index_lock:
+            if _index is index:
+                _index = build_index()
+            index = _index
+    return index
+
+
+def reset_dispatch_index():
+    global _index
+    _index = None
+
+
+def sync_driver(driver):
+    """Apply a driver save to the dispatch index, if it has been loaded"""
+    index = _index
+    if index is None:
+        return
+    if (driver.status != 'APPROVED' or not driver.is_available
+            or driver.latitude is None or driver.longitude is None):
+        index.remove(driver.pk)
+    else:
+        index.add(
+            driver.pk, driver.vehicle_type, driver.latitude, driver.longitude,
+            driver.rating, driver.total_deliveries,
+        )
+
+
+def remove_driver(driver_id):
+    if _index is not None:
+        _index.remove(driver_id)
+
+
+def refresh_driver(driver_id):
+    """Re-read one driver into the index after an ``update()`` that skipped the signals"""
+    if _index is None:
+        return
+    driver = DriverProfile.objects.filter(pk=driver_id).only(
+        'vehicle_type', 'is_available', 'status', 'rating', 'total_deliveries', 'latitude', 'longitude',
+    ).first()
+    if driver is None:
+        remove_driver(driver_id)
+    else:
+        sync_driver(driver)
+
+
+def claim_driver(driver_id):
+    """Mark one driver as busy; ``False`` if someone else got there first"""
+    claimable = DriverProfile.objects.filter(pk=driver_id, status='APPROVED', is_available=True)
+    if not connection.features.has_select_for_update_skip_locked:
+        # Without row locks (SQLite) the conditional UPDATE alone is the claim
+        return claimable.update(is_available=False) == 1
+    with transaction.atomic():
+        # skip_locked: a row another worker is claiming counts as taken
+        if not claimable.select_for_update(skip_locked=True).values_list('pk', flat=True):
+            return False
+        return claimable.update(is_available=False) == 1
+
+
+def assign_driver(lat, lng, vehicle_types=None):
+    """
+    Claim the best available driver for a pickup at ``(lat, lng)``.
+
+    Returns ``(driver_id, distance_km)``, or ``None`` when nobody suitable is
+    within ``MAX_RINGS`` cells.
+    """
+    index = get_dispatch_index()
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        match = index.best(lat, lng, vehicle_types)
+        if match is None:
+            return None
+        # Busy either way: claimed here, or already taken elsewhere
+        index.remove(match[0])
+        if claim_driver(match[0]):
+            return match
+    return None
+
+
+def release_driver(driver_id, delivered=True, location=None):
+    """
+    Make a driver available again, counting the delivery if it was made.
+    ``location`` is an optional ``(lat, lng)``, usually the drop-off point.
+    """
+    updates = {'is_available': True}
+    if delivered:
+        updates['total_deliveries'] = F('total_deliveries') + 1
+    if location is not None:
+        updates.update(latitude=location[0], longitude=location[1], location_updated_at=timezone.now())
+    DriverProfile.objects.filter(pk=driver_id).update(**updates)
+    refresh_driver(driver_id)
+
+
+def update_location(driver_id, lat, lng):
+    """Record a position report without the cost of a full model save"""
+    DriverProfile.objects.filter(pk=driver_id).update(
+        latitude=lat, longitude=lng, location_updated_at=timezone.now(),
+    )
+    refresh_driver(driver_id)
@@ -0,0 +1,111 @@
+import time
+from collections import deque
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.benchmarks import (
+    benchmark_database, format_summary, make_rng, summarize_latencies, time_callable,
+)
+from users.dispatch import (
+    VEHICLE_TYPES, assign_driver, get_dispatch_index, release_driver, reset_dispatch_index,
+)
+from users.models import DriverProfile
+
+
+def random_point(rng):
+    # Greater Lagos, as in the restaurant benchmarks
+    return rng.uniform(6.40, 6.70), rng.uniform(3.10, 3.70)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with drivers and simulate a dispatch loop: '
+        'pickups are assigned, drivers deliver, report their new position and '
+        'become available again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=5000)
+        parser.add_argument('--assignments', type=int, default=20000)
+        parser.add_argument(
+            '--busy-fraction', type=float, default=0.5,
+            help='Share of drivers out on a delivery before the oldest one completes',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = make_rng(options['seed'])
+        with benchmark_database():
+            self.stdout.write('Seeding...')
+            self.seed_drivers(options['drivers'], rng)
+            reset_dispatch_index()
+            started = time.perf_counter()
+            index = get_dispatch_index()
+            self.stdout.write(f'Built dispatch index over {len(index)} drivers in {time.perf_counter() - started:.2f}s')
+
+            max_busy = max(1, int(options['drivers'] * options['busy_fraction']))
+            busy = deque()
+            busy_ids = set()
+            samples = []
+            unmatched = 0
+            started = time.perf_counter()
+            for _ in range(options['assignments']):
+                if len(busy) >= max_busy:
+                    driver_id = busy.popleft()
+                    busy_ids.discard(driver_id)
+                    # Delivered: the driver is now at the drop-off point
+                    release_driver(driver_id, location=random_point(rng))
+
+                lat, lng = random_point(rng)
+                assign_started = time.perf_counter()
+                match = assign_driver(lat, lng)
+                samples.append(time.perf_counter() - assign_started)
+                if match is None:
+                    unmatched += 1
+                    continue
+                if match[0] in busy_ids:
+                    raise CommandError(f'Driver {match[0]} was assigned twice')
+                busy.append(match[0])
+                busy_ids.add(match[0])
+            elapsed = time.perf_counter() - started
+
+            stored_busy = DriverProfile.objects.filter(is_available=False).count()
+            if stored_busy != len(busy_ids):
+                raise CommandError(f'{stored_busy} drivers busy in the database, {len(busy_ids)} in the simulation')
+
+            # The in-memory match alone, without the database claim
+            index = get_dispatch_index()
+            points = [random_point(rng) for _ in range(2000)]
+            queue = iter(points)
+            matches = time_callable(lambda: index.best(*next(queue)), len(points))
+
+            self.stdout.write(format_summary('index_best', summarize_latencies(matches)))
+            self.stdout.write(format_summary('assign_driver', summarize_latencies(samples)))
+            assigned = options['assignments'] - unmatched
+            self.stdout.write(
+                f'{assigned} assignments ({unmatched} unmatched) in {elapsed:.2f}s: '
+                f'{options["assignments"] / elapsed:.0f} dispatch cycles/s including deliveries, '
+                f'{len(samples) / sum(samples):.0f} assignments/s'
+            )
+
+    def seed_drivers(self, count, rng, batch_size=5000):
+        users = User.objects.bulk_create(
+            [User(username=f'driver{number}', password='!') for number in range(count)],
+            batch_size=batch_size,
+        )
+        drivers = []
+        for number, user in enumerate(users):
+            lat, lng = random_point(rng)
+            drivers.append(DriverProfile(
+                user=user,
+                license_number=f'LIC{number:08d}',
+                vehicle_type=rng.choice(VEHICLE_TYPES),
+                vehicle_plate=f'LAG-{number:05d}',
+                status='APPROVED' if rng.random() < 0.9 else 'PENDING',
+                rating=round(rng.uniform(3, 5), 1),
+                total_deliveries=rng.randint(0, 2000),
+                latitude=lat,
+                longitude=lng,
+            ))
+        DriverProfile.objects.bulk_create(drivers, batch_size=batch_size)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.outbox import BATCH_SIZE, POLL_INTERVAL, deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox (use with EMAIL_OUTBOX_WORKER = "command")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit.')
+        parser.add_argument(
+            '--interval', type=float, default=POLL_INTERVAL,
+            help='Seconds to sleep between polls when running continuously.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = deliver_pending(options['batch_size'])
+            if delivered:
+                self.stdout.write(f'Processed {delivered} queued emails.')
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Round
+
+
+def seed_rating_totals(apps, schema_editor):
+    # Keep existing averages: count each completed delivery as one rating
+    # (at least one) and store the running sum that implies. Drivers already
+    # rated since 0004 have real counters and are left alone.
+    DriverProfile = apps.get_model('users', 'DriverProfile')
+    DriverProfile.objects.filter(rating__gt=0, rating_count=0).update(
+        rating_count=Greatest(F('total_deliveries'), Value(1)),
+        rating_total=Round(F('rating') * Greatest(F('total_deliveries'), Value(1))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_driver_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rating_totals, migrations.RunPython.noop),
+    ]
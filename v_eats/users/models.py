@@ -1,10 +1,13 @@
 # users/models.py
 from django.db import models
 from django.contrib.auth.models import User
-from django.core.validators import RegexValidator
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
+from django.utils import timezone
 import random
 import string
 
+from restaurant.models import MaintainedFieldsMixin
+
 class UserProfile(models.Model):
     USER_ROLES = [
         ('SUPERUSER', 'Super User'),
@@ -59,7 +62,7 @@ class RestaurantProfile(models.Model):
     def __str__(self):
         return f"{self.business_name} - {self.status}"
 
-class DriverProfile(models.Model):
+class DriverProfile(MaintainedFieldsMixin, models.Model):
     APPROVAL_STATUS = [
         ('PENDING', 'Pending Approval'),
         ('APPROVED', 'Approved'),
@@ -80,9 +83,69 @@ class DriverProfile(models.Model):
     vehicle_plate = models.CharField(max_length=20)
     is_available = models.BooleanField(default=True)
     status = models.CharField(max_length=15, choices=APPROVAL_STATUS, default='PENDING')
+    # Running average of DriverRating.rating, maintained by users/ratings.py
     rating = models.FloatField(default=0.0)
+    rating_count = models.IntegerField(default=0, editable=False)
+    rating_total = models.IntegerField(default=0, editable=False)
     total_deliveries = models.IntegerField(default=0)
+    # Last reported position, used by users/dispatch.py
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    location_updated_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Moved only by ratings.py and dispatch.release_driver
+    maintained_fields = ('rating', 'rating_count', 'rating_total', 'total_deliveries')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'is_available'], name='driver_dispatchable_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.vehicle_type} Driver"
+
+class DriverRating(models.Model):
+    """A customer's rating of one delivery"""
+    driver = models.ForeignKey(DriverProfile, on_delete=models.CASCADE, related_name='ratings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='driver_ratings')
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.driver_id} - {self.rating} by {self.user_id}"
+
+class OutgoingEmail(models.Model):
+    """An email waiting in (or delivered from) the outbox, see users/outbox.py"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=254, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoingemail_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
@@ -0,0 +1,174 @@
+"""
+Email outbox: queue messages in the database, deliver them in the background.
+
+Views call ``enqueue_email`` and return straight away. Delivery happens in
+``deliver_batch``, either from a daemon thread inside the web process
+(``EMAIL_OUTBOX_WORKER = 'thread'``) or from ``manage.py process_email_outbox``
+running as its own process (``'command'``). Each batch is claimed with a
+conditional UPDATE so several workers never send the same row, and is sent
+over a single SMTP connection. Failures are retried with exponential
+backoff until ``MAX_ATTEMPTS``.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+# A claim older than this belongs to a worker that died mid-batch
+STALE_CLAIM = timedelta(minutes=10)
+POLL_INTERVAL = 30
+
+
+def enqueue_email(to_email, subject, body, from_email=None):
+    """Queue a message and nudge the worker once the transaction commits"""
+    message = OutgoingEmail.objects.create(
+        to_email=to_email,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        subject=subject,
+        body=body,
+    )
+    transaction.on_commit(wake_worker)
+    return message
+
+
+def backoff_delay(attempts):
+    return min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    now = timezone.now()
+    due = (
+        Q(status='PENDING', next_attempt_at__lte=now) |
+        Q(status='SENDING', claimed_at__lt=now - STALE_CLAIM)
+    )
+    ids = list(
+        OutgoingEmail.objects.filter(due)
+        .order_by('next_attempt_at')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Re-checking ``due`` makes the claim atomic: rows another worker claimed
+    # in the meantime no longer match
+    OutgoingEmail.objects.filter(due, pk__in=ids).update(
+        status='SENDING', claim_token=token, claimed_at=now
+    )
+    return list(OutgoingEmail.objects.filter(claim_token=token, status='SENDING'))
+
+
+def deliver_batch(batch_size=BATCH_SIZE):
+    """Send one batch over a single connection; returns how many were claimed"""
+    messages = claim_batch(batch_size)
+    if not messages:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    sent_ids = []
+    try:
+        connection.open()
+    except Exception as e:
+        # Could not connect at all: the whole batch is retried later
+        for message in messages:
+            record_failure(message, e)
+        return len(messages)
+
+    try:
+        for message in messages:
+            email = EmailMessage(
+                message.subject, message.body, message.from_email, [message.to_email],
+                connection=connection,
+            )
+            try:
+                email.send()
+            except Exception as e:
+                record_failure(message, e)
+            else:
+                sent_ids.append(message.pk)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    if sent_ids:
+        OutgoingEmail.objects.filter(pk__in=sent_ids).update(
+            status='SENT', sent_at=timezone.now(), attempts=F('attempts') + 1,
+            claim_token='', last_error='',
+        )
+    return len(messages)
+
+
+def record_failure(message, error):
+    attempts = message.attempts + 1
+    logger.error(f"Failed to send email to {message.to_email} (attempt {attempts}): {str(error)}")
+    updates = {'attempts': attempts, 'last_error': str(error), 'claim_token': ''}
+    if attempts >= MAX_ATTEMPTS:
+        updates['status'] = 'FAILED'
+    else:
+        updates['status'] = 'PENDING'
+        updates['next_attempt_at'] = timezone.now() + backoff_delay(attempts)
+    OutgoingEmail.objects.filter(pk=message.pk, claim_token=message.claim_token).update(**updates)
+
+
+def deliver_pending(batch_size=BATCH_SIZE):
+    """Drain everything that is currently due; returns the number claimed"""
+    total = 0
+    while True:
+        claimed = deliver_batch(batch_size)
+        if not claimed:
+            return total
+        total += claimed
+
+
+class OutboxWorker(threading.Thread):
+    """Daemon thread that drains the outbox when woken or every POLL_INTERVAL"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        super().__init__(name='email-outbox', daemon=True)
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                deliver_pending()
+            except Exception:
+                logger.exception("Email outbox worker failed")
+            finally:
+                close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def wake_worker():
+    if getattr(settings, 'EMAIL_OUTBOX_WORKER', 'thread') != 'thread':
+        return
+    global _worker
+    with _worker_lock:
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker()
+            _worker.start()
+    _worker.wake()
@@ -0,0 +1,100 @@
+"""
+Cache-backed token buckets for endpoints that are cheap to call and
+expensive to serve, such as ``resend_verification``.
+
+A bucket holds up to ``capacity`` tokens and regains ``refill_rate`` tokens
+per second; every request takes one. The state is a ``(tokens, timestamp)``
+pair stored in the cache, so limits are shared between processes whenever
+the cache is (they are per process with the default LocMemCache). Updates
+are read-modify-write: under heavy concurrency a bucket can let a request
+or two more through than its capacity, which is fine for abuse protection.
+"""
+import math
+import time
+
+from django.core.cache import cache
+
+COUNTER_KEY = 'ratelimit:counter:{}'
+
+
+class TokenBucket:
+    def __init__(self, name, capacity, refill_rate):
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def key(self, identity):
+        return f'ratelimit:{self.name}:{identity}'
+
+    def level(self, identity, now):
+        """The tokens ``identity`` has at ``now``"""
+        available, updated = cache.get(self.key(identity), (self.capacity, now))
+        return min(self.capacity, available + (now - updated) * self.refill_rate)
+
+    def retry_after(self, available, tokens):
+        return math.ceil((tokens - available) / self.refill_rate)
+
+    def check(self, identity, tokens=1):
+        """``consume`` without taking anything, to test several buckets first"""
+        available = self.level(identity, time.time())
+        if available >= tokens:
+            return True, 0
+        return False, self.retry_after(available, tokens)
+
+    def consume(self, identity, tokens=1):
+        """
+        Take ``tokens`` from the bucket for ``identity``.
+
+        Returns ``(allowed, retry_after)`` where ``retry_after`` is the number
+        of seconds until enough tokens are available again (0 when allowed).
+        """
+        now = time.time()
+        available = self.level(identity, now)
+        allowed = available >= tokens
+        if allowed:
+            available -= tokens
+        # Expire once the bucket would be full again, so idle keys disappear
+        timeout = math.ceil((self.capacity - available) / self.refill_rate) + 1
+        cache.set(self.key(identity), (available, now), timeout)
+        if allowed:
+            return True, 0
+        return False, self.retry_after(available, tokens)
+
+    def reset(self, identity):
+        cache.delete(self.key(identity))
+
+
+def claim_window(name, identity, seconds):
+    """
+    True for the first call per ``(name, identity)`` within ``seconds``;
+    later calls in the window return False so they can be coalesced.
+    """
+    return cache.add(window_key(name, identity), 1, seconds)
+
+
+def release_window(name, identity):
+    """End the window early, when the work it was claimed for did not happen"""
+    cache.delete(window_key(name, identity))
+
+
+def window_key(name, identity):
+    return f'ratelimit:window:{name}:{identity}'
+
+
+def increment_counter(name):
+    key = COUNTER_KEY.format(name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def get_counters(names):
+    values = cache.get_many([COUNTER_KEY.format(name) for name in names])
+    return {name: values.get(COUNTER_KEY.format(name), 0) for name in names}
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
@@ -0,0 +1,34 @@
+"""
+Driver ratings and the running average on ``DriverProfile``.
+
+Works like ``restaurant/reviews.py``: each rating, edit or delete applies
+its delta to ``rating_total``/``rating_count`` and recomputes ``rating`` in a
+single ``F()`` UPDATE, from the ``DriverRating`` signals.
+"""
+from restaurant.reviews import running_average
+
+from . import dispatch
+from .models import DriverProfile, DriverRating
+
+
+def apply_rating_change(old, new):
+    """Apply the change from ``(driver_id, rating)`` ``old`` to ``new`` (either may be ``None``)"""
+    if old is not None and new is not None and old[0] != new[0]:
+        apply_rating_change(old, None)
+        apply_rating_change(None, new)
+        return
+    driver_id = (new or old)[0]
+    delta_total = (new[1] if new else 0) - (old[1] if old else 0)
+    delta_count = (new is not None) - (old is not None)
+    if not delta_total and not delta_count:
+        return
+    DriverProfile.objects.filter(pk=driver_id).update(
+        **running_average('rating', 'rating_total', 'rating_count', delta_total, delta_count),
+    )
+    # Rating orders candidates in the dispatch index
+    dispatch.refresh_driver(driver_id)
+
+
+def rate_driver(driver, user, rating, comment=''):
+    """Record a customer's rating of a delivery"""
+    return DriverRating.objects.create(driver=driver, user=user, rating=rating, comment=comment)
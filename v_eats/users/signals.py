@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import dispatch, ratings
+from .models import DriverProfile, DriverRating
+
+
+@receiver(post_save, sender=DriverProfile)
+def index_driver(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dispatch.sync_driver(instance)
+
+
+@receiver(post_delete, sender=DriverProfile)
+def unindex_driver(sender, instance, **kwargs):
+    dispatch.remove_driver(instance.pk)
+
+
+@receiver(pre_save, sender=DriverRating)
+@receiver(pre_delete, sender=DriverRating)
+def remember_driver_rating(sender, instance, raw=False, **kwargs):
+    instance._stored_rating = None
+    if not raw and not instance._state.adding:
+        instance._stored_rating = DriverRating.objects.filter(pk=instance.pk).values_list(
+            'driver_id', 'rating').first()
+
+
+@receiver(post_save, sender=DriverRating)
+def aggregate_driver_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = (instance.driver_id, instance.rating)
+    ratings.apply_rating_change(getattr(instance, '_stored_rating', None), new)
+    instance._stored_rating = new
+
+
+@receiver(post_delete, sender=DriverRating)
+def unaggregate_driver_rating(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_rating', None)
+    if stored is not None:
+        ratings.apply_rating_change(stored, None)
@@ -1,3 +1,200 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import dispatch, outbox, ratings
+from .models import DriverProfile, OutgoingEmail, User, UserProfile
+from .views import RESEND_USER_BUCKET
+
+
+@override_settings(EMAIL_OUTBOX_WORKER='command')
+class EmailOutboxTests(TestCase):
+    def test_registration_queues_verification_email(self):
+        response = self.client.post(reverse('users:register_customer'), {
+            'username': 'alice',
+            'email': 'alice@example.com',
+            'first_name': 'Alice',
+            'last_name': 'Smith',
+            'phone': '5550100',
+            'address': '1 Main Street',
+            'password1': 'a-Strong-pass-123',
+            'password2': 'a-Strong-pass-123',
+        })
+        user = User.objects.get(username='alice')
+        self.assertRedirects(response, reverse('users:verify', args=[user.id]), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutgoingEmail.objects.get()
+        self.assertEqual(queued.to_email, 'alice@example.com')
+        self.assertEqual(queued.status, 'PENDING')
+        self.assertIn(user.profile.verification_code, queued.body)
+
+    def test_deliver_pending_sends_and_marks_sent(self):
+        for i in range(3):
+            outbox.enqueue_email(f'user{i}@example.com', 'Subject', 'Body')
+        self.assertEqual(outbox.deliver_pending(batch_size=2), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutgoingEmail.objects.filter(status='SENT', attempts=1).count(), 3)
+        # Nothing left to claim
+        self.assertEqual(outbox.deliver_pending(), 0)
+
+    def test_failures_back_off_then_give_up(self):
+        message = outbox.enqueue_email('bob@example.com', 'Subject', 'Body')
+        failing = mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('refused'))
+        with failing, self.assertLogs('users.outbox', 'ERROR'):
+            outbox.deliver_pending()
+            message.refresh_from_db()
+            self.assertEqual(message.status, 'PENDING')
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            # Not due yet, so not retried
+            self.assertEqual(outbox.deliver_pending(), 0)
+
+            for attempt in range(2, outbox.MAX_ATTEMPTS + 1):
+                OutgoingEmail.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+                outbox.deliver_pending()
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'FAILED')
+        self.assertEqual(message.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(message.last_error, 'refused')
+
+
+@override_settings(EMAIL_OUTBOX_WORKER='command')
+class ResendVerificationRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('carol', 'carol@example.com', 'pass')
+        UserProfile.objects.create(user=self.user, role='USER')
+        self.url = reverse('users:resend_verification', args=[self.user.id])
+
+    def test_repeat_requests_are_coalesced_into_one_send(self):
+        first = self.client.post(self.url)
+        code = UserProfile.objects.get(user=self.user).verification_code
+        second = self.client.post(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.json()['success'])
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        # The code is not regenerated for the coalesced request
+        self.assertEqual(UserProfile.objects.get(user=self.user).verification_code, code)
+
+    def test_burst_beyond_capacity_gets_429(self):
+        responses = [self.client.post(self.url) for _ in range(4)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200, 429])
+        self.assertFalse(responses[-1].json()['success'])
+        self.assertGreater(int(responses[-1]['Retry-After']), 0)
+
+        staff = User.objects.create_user('admin', 'admin@example.com', 'pass', is_staff=True)
+        self.client.force_login(staff)
+        counters = self.client.get(reverse('users:resend_verification_stats')).json()
+        self.assertEqual(counters, {'resend_sent': 1, 'resend_coalesced': 2, 'resend_throttled': 1})
+
+    def test_failed_or_unknown_resend_is_not_coalesced(self):
+        with mock.patch('users.views.enqueue_email', side_effect=OSError('down')):
+            self.assertFalse(self.client.post(self.url).json()['success'])
+        response = self.client.post(self.url)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        unknown = reverse('users:resend_verification', args=[self.user.id + 100])
+        self.assertEqual([self.client.post(unknown).json()['message'] for _ in range(2)], ['User not found.'] * 2)
+
+    def test_ip_limit_does_not_spend_user_tokens(self):
+        for number in range(10):
+            self.client.post(reverse('users:resend_verification', args=[self.user.id + 100 + number]))
+        self.assertEqual(self.client.post(self.url).status_code, 429)
+        self.assertEqual(RESEND_USER_BUCKET.check(self.user.id, tokens=3), (True, 0))
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        dispatch.reset_dispatch_index()
+        self.addCleanup(dispatch.reset_dispatch_index)
+        # Yaba, and points roughly 1 km and 9 km away
+        self.pickup = (6.5095, 3.3711)
+        self.near = self.create_driver('near', 6.5185, 3.3711, rating=4.0)
+        self.near_top = self.create_driver('near_top', 6.5150, 3.3750, rating=4.9)
+        self.far_top = self.create_driver('far_top', 6.6000, 3.3711, rating=5.0)
+        self.car = self.create_driver('car', 6.5100, 3.3700, rating=4.5, vehicle_type='CAR')
+
+    def create_driver(self, username, lat, lng, **kwargs):
+        user = User.objects.create_user(username, f'{username}@example.com', 'pass')
+        defaults = {
+            'license_number': f'LIC-{username}',
+            'vehicle_type': 'BIKE',
+            'vehicle_plate': 'LAG-001',
+            'status': 'APPROVED',
+            'latitude': lat,
+            'longitude': lng,
+        }
+        defaults.update(kwargs)
+        return DriverProfile.objects.create(user=user, **defaults)
+
+    def test_best_rated_driver_in_the_nearest_cells_is_claimed(self):
+        driver_id, distance = dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])
+        self.assertEqual(driver_id, self.near_top.pk)
+        self.assertLess(distance, 2)
+        self.assertFalse(DriverProfile.objects.get(pk=driver_id).is_available)
+        self.assertEqual(dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])[0], self.near.pk)
+        self.assertEqual(dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])[0], self.far_top.pk)
+        self.assertIsNone(dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE']))
+
+    def test_stale_index_never_double_assigns(self):
+        # Another worker's index still lists every driver
+        other = dispatch.build_index()
+        first, _ = dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])
+        self.assertEqual(other.best(*self.pickup, ['BIKE'])[0], first)
+        self.assertFalse(dispatch.claim_driver(first))
+        second, _ = dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])
+        self.assertNotEqual(first, second)
+        self.assertEqual(DriverProfile.objects.filter(is_available=False).count(), 2)
+
+    def test_saves_and_releases_update_the_index(self):
+        index = dispatch.get_dispatch_index()
+        self.near_top.status = 'SUSPENDED'
+        self.near_top.save()
+        self.assertNotIn(self.near_top.pk, index)
+        self.assertEqual(dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])[0], self.near.pk)
+        dispatch.release_driver(self.near.pk, location=self.pickup)
+        self.near.refresh_from_db()
+        self.assertTrue(self.near.is_available)
+        self.assertEqual(self.near.total_deliveries, 1)
+        self.assertIn(self.near.pk, index)
+
+    def test_ratings_update_the_average_and_the_index(self):
+        index = dispatch.get_dispatch_index()
+        customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        ratings.rate_driver(self.near, customer, 5)
+        first = ratings.rate_driver(self.near, customer, 5)
+        self.near.refresh_from_db()
+        self.assertEqual((self.near.rating, self.near.rating_count), (5.0, 2))
+        self.assertEqual(index.best(*self.pickup, ['BIKE'])[0], self.near.pk)
+        first.delete()
+        ratings.rate_driver(self.near, customer, 2)
+        self.near.refresh_from_db()
+        self.assertEqual((self.near.rating, self.near.rating_count), (3.5, 2))
+
+    def test_saving_a_stale_profile_keeps_the_counters(self):
+        stale = DriverProfile.objects.get(pk=self.near.pk)
+        ratings.rate_driver(self.near, User.objects.create_user('customer', 'customer@example.com', 'pass'), 2)
+        dispatch.release_driver(self.near.pk)
+        stale.status = 'SUSPENDED'
+        stale.save()
+        self.near.refresh_from_db()
+        self.assertEqual(
+            (self.near.status, self.near.rating, self.near.rating_count, self.near.total_deliveries),
+            ('SUSPENDED', 2.0, 1, 1),
+        )
+
+    def test_driver_location_view(self):
+        self.client.force_login(self.far_top.user)
+        response = self.client.post(reverse('users:driver_location'), {'lat': '6.5100', 'lng': '3.3710'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dispatch.assign_driver(*self.pickup, vehicle_types=['BIKE'])[0], self.far_top.pk)
+        self.assertEqual(
+            self.client.post(reverse('users:driver_location'), {'lat': '95', 'lng': '3'}).status_code, 400)
@@ -14,7 +14,9 @@ urlpatterns = [
     path("register/driver/", views.register_driver, name="register_driver"),
     path("verify/<int:user_id>/", views.verify_account, name="verify"),
     path("resend-verification/<int:user_id>/", views.resend_verification, name="resend_verification"),
+    path("resend-verification/stats/", views.resend_verification_stats, name="resend_verification_stats"),
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("driver/location/", views.driver_location, name="driver_location"),
     path("profile/", views.profile, name="profile"),
     path("logout/", views.logout_view, name="logout"),
 ]
@@ -2,19 +2,31 @@
 import random
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
-from django.core.mail import send_mail
 from django.conf import settings
+from django.views.decorators.http import require_POST
 from .forms import CustomerRegistrationForm, RestaurantRegistrationForm, DriverRegistrationForm, VerificationForm
-from .models import User, UserProfile
+from .dispatch import update_location
+from .models import DriverProfile, User, UserProfile
+from .outbox import enqueue_email
+from .ratelimit import TokenBucket, claim_window, client_ip, get_counters, increment_counter, release_window
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Resend limits: a burst of 3 per user then one a minute, 10 per IP then one
+# every 30 seconds. Requests inside the coalesce window are answered without
+# sending another email.
+RESEND_USER_BUCKET = TokenBucket('resend:user', capacity=3, refill_rate=1 / 60)
+RESEND_IP_BUCKET = TokenBucket('resend:ip', capacity=10, refill_rate=1 / 30)
+RESEND_COALESCE_SECONDS = 60
+RESEND_COUNTERS = ('resend_sent', 'resend_coalesced', 'resend_throttled')
+
 def send_verification_email(user, verification_code):
-    """Send verification code via email"""
+    """Queue the verification code email"""
     subject = 'V-Eats Account Verification Code'
     message = f"""
     Hello {user.first_name or user.username},
@@ -31,17 +43,13 @@ def send_verification_email(user, verification_code):
     V-Eats Team
     """
 
+    # Delivery happens in the background (see users/outbox.py), so a slow
+    # mail server never holds up the request
     try:
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            [user.email],
-            fail_silently=False,
-        )
+        enqueue_email(user.email, subject, message, from_email=settings.EMAIL_HOST_USER)
         return True
     except Exception as e:
-        logger.error(f"Failed to send verification email to {user.email}: {str(e)}")
+        logger.error(f"Failed to queue verification email to {user.email}: {str(e)}")
         return False
 
 def home(request):
@@ -162,19 +170,50 @@ def verify_account(request, user_id):
     })
 
 def resend_verification(request, user_id):
-    """Resend verification code"""
+    """Resend verification code, throttled per user and per client IP"""
+    # Check rate limits before touching the database; a request refused by
+    # one bucket must not spend a token from the other
+    buckets = ((RESEND_USER_BUCKET, user_id), (RESEND_IP_BUCKET, client_ip(request)))
+    checks = [bucket.check(identity) for bucket, identity in buckets]
+    if all(allowed for allowed, retry_after in checks):
+        checks = [bucket.consume(identity) for bucket, identity in buckets]
+    if not all(allowed for allowed, retry_after in checks):
+        retry_after = max(retry_after for allowed, retry_after in checks)
+        increment_counter('resend_throttled')
+        response = JsonResponse(
+            {'success': False, 'message': f'Too many requests. Please try again in {retry_after} seconds.',
+             'retry_after': retry_after},
+            status=429,
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    # Repeat clicks within the window reuse the code that was just sent
+    if not claim_window('resend_verification', user_id, RESEND_COALESCE_SECONDS):
+        increment_counter('resend_coalesced')
+        return JsonResponse({'success': True, 'message': 'Verification code sent to your email!'})
+
     try:
         user_profile = UserProfile.objects.get(user_id=user_id)
         verification_code = user_profile.generate_verification_code()
 
         # Send verification email
         if send_verification_email(user_profile.user, verification_code):
+            increment_counter('resend_sent')
             return JsonResponse({'success': True, 'message': 'Verification code sent to your email!'})
         else:
+            # Nothing went out, so the next click must try again
+            release_window('resend_verification', user_id)
             return JsonResponse({'success': False, 'message': 'Failed to send verification email. Please try again.'})
     except UserProfile.DoesNotExist:
+        release_window('resend_verification', user_id)
         return JsonResponse({'success': False, 'message': 'User not found.'})
 
+@staff_member_required
+def resend_verification_stats(request):
+    """Counters for sent, coalesced and throttled resend requests"""
+    return JsonResponse(get_counters(RESEND_COUNTERS))
+
 @login_required
 def dashboard(request):
     """Role-based dashboard redirect"""
@@ -183,12 +222,30 @@ def dashboard(request):
     if user_profile.role == 'SUPERUSER':
         return redirect('admin:dashboard')
     elif user_profile.role == 'RESTAURANT':
-        return redirect('restaurant:dashboard')
+        return redirect('restaurant:my_restaurants')
     elif user_profile.role == 'DRIVER':
         return redirect('driver:dashboard')
     else:
         return redirect('customer:dashboard')
 
+@login_required
+@require_POST
+def driver_location(request):
+    """Position report from a driver's device, feeds the dispatch index"""
+    try:
+        driver_id = request.user.driver_profile.pk
+    except DriverProfile.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Only drivers can report a location.'}, status=403)
+    try:
+        lat, lng = float(request.POST['lat']), float(request.POST['lng'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'message': 'lat and lng are required.'}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({'success': False, 'message': 'Coordinates out of range.'}, status=400)
+
+    update_location(driver_id, lat, lng)
+    return JsonResponse({'success': True})
+
 @login_required
 def profile(request):
     """User profile view"""
@@ -0,0 +1,222 @@
+"""
+Per-request cost accounting.
+
+``RequestMetricsMiddleware`` records, for every request, the number of SQL
+queries, time spent in SQL, repeated queries (the same SQL issued more than
+once, which is how N+1 patterns show up), template render time and total
+latency. Queries are timed with ``connection.execute_wrapper`` and templates
+through ``InstrumentedDjangoTemplates``, so nothing depends on ``DEBUG``
+and the cost per request is a few clock reads and dict updates.
+
+The numbers are sent back as a ``Server-Timing`` header (in DEBUG or for
+staff users) and kept in a rolling in-process window per view that staff
+can read at ``/instrumentation/``. Each process has its own window. The
+header is only added when the view already loaded the user: looking it up
+here would be a session read and a query the metrics do not count.
+
+Under ASGI the middleware runs natively async; the query hook is then
+installed on the connections of the thread the async ORM uses for the
+request.
+"""
+import math
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.functional import empty
+
+# Rolling window size per view and the latency histogram bucket bounds (ms)
+WINDOW = 1000
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql_seconds', 'template_seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """``execute_wrapper`` hook: time and count one query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeated SQL already issued in this request"""
+        return self.queries - len(self.statements)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The stock Django template backend, with render time attributed to the request"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+
+class RequestHistogram:
+    """Last ``window`` requests per view, summarised on demand"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, route, total_ms, sql_ms, template_ms, queries, duplicates):
+        with self._lock:
+            self._samples[route].append((total_ms, sql_ms, template_ms, queries, duplicates))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self):
+        with self._lock:
+            samples = {route: list(window) for route, window in self._samples.items()}
+        return {route: summarize(rows) for route, rows in sorted(samples.items())}
+
+
+def summarize(rows):
+    latencies = sorted(row[0] for row in rows)
+    count = len(rows)
+
+    def nearest_rank(fraction):
+        return round(latencies[max(1, math.ceil(count * fraction)) - 1], 2)
+
+    buckets = Counter()
+    for latency in latencies:
+        bound = next((bound for bound in BUCKETS_MS if latency <= bound), None)
+        buckets[f'le_{bound}' if bound else 'inf'] += 1
+    return {
+        'count': count,
+        'p50_ms': nearest_rank(0.50),
+        'p95_ms': nearest_rank(0.95),
+        'p99_ms': nearest_rank(0.99),
+        'mean_sql_ms': round(sum(row[1] for row in rows) / count, 2),
+        'mean_template_ms': round(sum(row[2] for row in rows) / count, 2),
+        'mean_queries': round(sum(row[3] for row in rows) / count, 1),
+        'max_queries': max(row[3] for row in rows),
+        'max_duplicates': max(row[4] for row in rows),
+        'histogram': [
+            [f'le_{bound}', buckets[f'le_{bound}']] for bound in BUCKETS_MS
+        ] + [['inf', buckets['inf']]],
+    }
+
+
+histogram = RequestHistogram()
+
+
+def loaded_user(request):
+    """The request's user if the request already loaded it, else None"""
+    user = getattr(request, 'user', None)
+    if getattr(user, '_wrapped', None) is empty:
+        # Still lazy, unless an async view went through ``auser()``
+        return getattr(request, '_acached_user', None)
+    return user
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        # The async ORM runs queries in the request's thread-sensitive
+        # thread, so the wrapper goes on that thread's connections
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        await sync_to_async(attach_wrapper)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(detach_wrapper)(metrics)
+            _current.reset(token)
+        return self.record(request, response, metrics, started)
+
+    def record(self, request, response, metrics, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = metrics.sql_seconds * 1000
+        template_ms = metrics.template_seconds * 1000
+
+        match = request.resolver_match
+        route = f"{request.method} {match.view_name if match else 'unresolved'}"
+        histogram.record(route, total_ms, sql_ms, template_ms, metrics.queries, metrics.duplicates)
+
+        if settings.DEBUG or getattr(loaded_user(request), 'is_staff', False):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={sql_ms:.2f};desc="{metrics.queries} queries"',
+                f'dupq;desc="{metrics.duplicates} repeated queries"',
+                f'tpl;dur={template_ms:.2f}',
+                f'total;dur={total_ms:.2f}',
+            ])
+        return response
+
+
+def attach_wrapper(metrics):
+    for connection in connections.all():
+        connection.execute_wrappers.append(metrics)
+
+
+def detach_wrapper(metrics):
+    for connection in connections.all():
+        if metrics in connection.execute_wrappers:
+            connection.execute_wrappers.remove(metrics)
+
+
+@staff_member_required
+def request_metrics(request):
+    """Rolling per-view latency, SQL and template statistics for this process"""
+    return JsonResponse({'window': histogram.window, 'views': histogram.snapshot()})
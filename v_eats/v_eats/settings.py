@@ -42,11 +42,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'users',
     'restaurant',
 ]
 
 MIDDLEWARE = [
+    # First, so latency and queries include the other middleware
+    # (query count, SQL/template time per request, see v_eats/instrumentation.py)
+    'v_eats.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,7 +68,8 @@ LOGIN_REDIRECT_URL = 'users:home'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for RequestMetricsMiddleware
+        'BACKEND': 'v_eats.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -109,6 +114,49 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Caches
+# 'default' holds application data (dashboard stats, ...). 'fragments' holds
+# rendered template fragments such as restaurant cards; set
+# FRAGMENT_CACHE_BACKEND=file to share them between worker processes.
+# 'menus' holds the serialized public menus (restaurant/menus.py), checked
+# against a version column on every read; MENU_CACHE_BACKEND=file keeps
+# them on disk and shares them between workers.
+
+FRAGMENT_CACHE_BACKEND = config('FRAGMENT_CACHE_BACKEND', default='locmem')
+MENU_CACHE_BACKEND = config('MENU_CACHE_BACKEND', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'v-eats-default',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'
+        if FRAGMENT_CACHE_BACKEND == 'file'
+        else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': config('FRAGMENT_CACHE_LOCATION', default=str(BASE_DIR / '.cache' / 'fragments'))
+        if FRAGMENT_CACHE_BACKEND == 'file'
+        else 'v-eats-fragments',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'menus': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'
+        if MENU_CACHE_BACKEND == 'file'
+        else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': config('MENU_CACHE_LOCATION', default=str(BASE_DIR / '.cache' / 'menus'))
+        if MENU_CACHE_BACKEND == 'file'
+        else 'v-eats-menus',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -127,6 +175,40 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Pagination mode per listing view: 'offset' shows numbered pages with a
+# total count, 'cursor' uses keyset pagination with no COUNT query
+PAGINATION_MODES = {
+    'restaurant_list': 'cursor',
+    'manage_menu': 'cursor',
+}
+
+# Delivery-area lookups: 'memory' uses a per-process KD-tree, 'database'
+# uses the geohash index in SQL. GEO_GAZETTEER is the place-name file used
+# by the offline geocoder (defaults to restaurant/data/gazetteer.tsv).
+GEO_INDEX = config('GEO_INDEX', default='memory')
+GEO_GAZETTEER = config('GEO_GAZETTEER', default='') or None
+
+# Carts hold only [restaurant_id, item_id, qty, ...] (see restaurant/cart.py):
+# 'cookie' signs them into a cookie, 'session' puts them in the session, in
+# which case use the cache session engine to keep them out of the database
+CART_STORE = config('CART_STORE', default='cookie')
+
+# Read-only JSON API (restaurant/api.py), versioned in the URL path
+REST_FRAMEWORK = {
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
+    'ALLOWED_VERSIONS': ['v1'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': [],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'UNAUTHENTICATED_USER': None,
+}
+
+# Serve the browsing views (restaurant listing, API detail and menus) with
+# their async versions. v_eats/asgi.py turns this on for ASGI workers; under
+# WSGI async views only add a thread hop per request.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -139,4 +221,14 @@ EMAIL_PORT = config("EMAIL_PORT", cast=int)
 EMAIL_USE_TLS = config("EMAIL_USE_TLS", cast=bool)
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
-DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default=EMAIL_HOST_USER)
\ No newline at end of file
+DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default=EMAIL_HOST_USER)
+
+# Verification emails are queued in the outbox (users.OutgoingEmail) and sent
+# in the background: 'thread' runs a sender thread in each web process,
+# 'command' leaves delivery to `manage.py process_email_outbox`
+EMAIL_OUTBOX_WORKER = config("EMAIL_OUTBOX_WORKER", default="thread")
+
+# Thumbnails of uploaded images (restaurant/images.py): 'thread' renders them
+# in each web process after upload, 'command' leaves them to
+# `manage.py process_images`
+IMAGE_PIPELINE_WORKER = config("IMAGE_PIPELINE_WORKER", default="thread")
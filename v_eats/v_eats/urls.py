@@ -15,18 +15,33 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from restaurant.blobs import serve_immutable
+
+from .instrumentation import request_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('users.urls')),
     path('restaurants/', include('restaurant.urls')),
+    re_path(r'^api/(?P<version>v1)/', include('restaurant.api_urls')),
+    path('instrumentation/', request_metrics, name='request_metrics'),
 ]
 
-# Serve media files during development
+# Serve media files during development. In production the web server or CDN
+# serves MEDIA_URL; uploads and thumbnails under blobs/ and variants/ are
+# named by content hash and must go out with the same Cache-Control and ETag
+# headers as serve_immutable.
 if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>(?:blobs|variants)/[0-9a-f]{2}/[0-9a-f]{32,64}[\w.-]*)$' % settings.MEDIA_URL.lstrip('/'),
+            serve_immutable, name='immutable_media',
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)